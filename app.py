@@ -240,6 +240,22 @@ def scan_assets(subfolder, extensions):
     ])
 
 
+def joke_card_html(joke_data):
+    """Render one generated joke as a card."""
+    engine = joke_data.get("engine", "?")
+    similarity = joke_data.get("similarity", 0)
+    return f"""
+    <div class="joke-card">
+        <div class="joke-text">{joke_data.get('joke', 'N/A')}</div>
+        <div class="joke-meta">
+            <span class="badge">{engine}</span>
+            <span>Similarity: {similarity:.2f}</span>
+            <span>Strategy: {joke_data.get('selected_strategy', 'N/A')[:60]}</span>
+        </div>
+    </div>
+    """
+
+
 def get_pipeline_html():
     """Render the pipeline status bar."""
     s1 = "done" if st.session_state.generation_done else "active"
@@ -284,6 +300,21 @@ topic = st.text_input(
     label_visibility="collapsed",
 )
 
+SEARCH_MODE_LABELS = {
+    "vector": "🧮 Themes (vector)",
+    "hybrid": "🔤 Themes + keywords (hybrid)",
+    "multi_theme": "🎯 Each theme separately (multi-theme)",
+}
+search_mode = st.radio(
+    "Search mode",
+    list(SEARCH_MODE_LABELS),
+    format_func=SEARCH_MODE_LABELS.get,
+    horizontal=True,
+    label_visibility="collapsed",
+    help="Hybrid also matches names, places and products from the headline; "
+         "multi-theme searches each theme on its own for broader recall.",
+)
+
 col_search, col_reset = st.columns([4, 1])
 
 with col_search:
@@ -309,7 +340,7 @@ if search_btn and topic.strip():
     with st.spinner("🔍 Expanding themes and searching bridge embeddings..."):
         try:
             from modules.joke_generator.campaign_generator import search_bridges
-            matches = search_bridges(topic.strip(), top_k=30)
+            matches = search_bridges(topic.strip(), top_k=30, mode=search_mode)
             st.session_state.bridge_matches = matches
             st.session_state.selected_bridge_indices = []
             st.session_state.bridge_selection_done = False
@@ -385,6 +416,12 @@ if st.session_state.bridge_matches and not st.session_state.generation_done:
     st.markdown("")
     num_selected = len(st.session_state.selected_bridge_indices)
 
+    fresh_drafts = st.checkbox(
+        "🎲 Fresh drafts (ignore previously generated jokes)",
+        value=False,
+        help="By default, bridges already generated for this topic are reused instantly.",
+    )
+
     generate_btn = st.button(
         f"🔥 Generate {num_selected} Joke{'s' if num_selected != 1 else ''}"
         if num_selected > 0 else "🔥 Select bridges above first",
@@ -398,21 +435,37 @@ if st.session_state.bridge_matches and not st.session_state.generation_done:
             st.session_state.bridge_matches[i]
             for i in sorted(st.session_state.selected_bridge_indices)
         ]
-        with st.spinner(f"🔥 Generating {num_selected} jokes via Gemini..."):
-            try:
-                from modules.joke_generator.campaign_generator import generate_from_selected
-                results = generate_from_selected(topic.strip(), selected_matches)
-                st.session_state.jokes = results
-                st.session_state.generation_done = True
-                st.session_state.bridge_selection_done = True
-                st.session_state.selected_indices = []
-                st.session_state.edited_texts = {}
-                st.session_state.video_paths = {}
-                st.session_state.upload_results = {}
-                st.session_state.videos_done = False
-                st.rerun()
-            except Exception as e:
-                st.error(f"❌ Generation failed: {e}")
+        progress = st.progress(0, text=f"🔥 Generating {num_selected} jokes via Gemini...")
+        live_cards = st.container()
+        try:
+            from modules.joke_generator.campaign_generator import iter_generate_from_selected
+
+            slots = [None] * num_selected
+            finished = 0
+            for idx, result in iter_generate_from_selected(
+                topic.strip(), selected_matches, use_cache=not fresh_drafts
+            ):
+                finished += 1
+                slots[idx] = result
+                progress.progress(
+                    finished / num_selected,
+                    text=f"🔥 {finished}/{num_selected} jokes done..."
+                )
+                if result is not None:
+                    with live_cards:
+                        st.markdown(joke_card_html(result), unsafe_allow_html=True)
+
+            st.session_state.jokes = [r for r in slots if r is not None]
+            st.session_state.generation_done = True
+            st.session_state.bridge_selection_done = True
+            st.session_state.selected_indices = []
+            st.session_state.edited_texts = {}
+            st.session_state.video_paths = {}
+            st.session_state.upload_results = {}
+            st.session_state.videos_done = False
+            st.rerun()
+        except Exception as e:
+            st.error(f"❌ Generation failed: {e}")
 
 # ─── Generated Jokes Display (same as before) ────────────────────────────────
 
@@ -435,19 +488,7 @@ if st.session_state.jokes:
                 st.session_state.selected_indices.remove(i)
 
         with col_joke:
-            engine = joke_data.get("engine", "?")
-            similarity = joke_data.get("similarity", 0)
-
-            st.markdown(f"""
-            <div class="joke-card">
-                <div class="joke-text">{joke_data.get('joke', 'N/A')}</div>
-                <div class="joke-meta">
-                    <span class="badge">{engine}</span>
-                    <span>Similarity: {similarity:.2f}</span>
-                    <span>Strategy: {joke_data.get('selected_strategy', 'N/A')[:60]}</span>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(joke_card_html(joke_data), unsafe_allow_html=True)
 
     # Editable text fields for selected jokes
     if st.session_state.selected_indices:
@@ -526,37 +567,44 @@ if not can_produce and st.session_state.generation_done and not st.session_state
     st.info("☝️ Select at least one joke above to generate videos.")
 
 if produce_btn:
-    from modules.video_studio.studio import generate_reel, ASSETS_DIR
+    from modules.video_studio.studio import render_reels, ASSETS_DIR
 
     progress = st.progress(0, text="Preparing...")
-    total = len(st.session_state.selected_indices)
-
-    for count, idx in enumerate(sorted(st.session_state.selected_indices)):
-        joke_text = st.session_state.edited_texts.get(
-            idx,
-            st.session_state.jokes[idx].get("joke", "")
-        )
-
+    indices = sorted(st.session_state.selected_indices)
+    total = len(indices)
+
+    video_path = os.path.join(ASSETS_DIR, "templates", selected_template)
+    audio_path = os.path.join(ASSETS_DIR, "music", selected_music)
+
+    jobs = [
+        {
+            "joke_text": st.session_state.edited_texts.get(
+                idx,
+                st.session_state.jokes[idx].get("joke", "")
+            ),
+            "output_filename": f"reel_{idx + 1}.mp4",
+            "duration": duration,
+            "video_path": video_path,
+            "audio_path": audio_path,
+        }
+        for idx in indices
+    ]
+
+    progress.progress(0, text=f"🎬 Rendering {total} video(s)...")
+
+    def _on_reel_done(completed, total_jobs, result):
         progress.progress(
-            (count) / total,
-            text=f"🎬 Rendering video {count + 1}/{total}..."
+            completed / total_jobs,
+            text=f"🎬 Rendered {completed}/{total_jobs} videos..."
         )
 
-        try:
-            video_path = os.path.join(ASSETS_DIR, "templates", selected_template)
-            audio_path = os.path.join(ASSETS_DIR, "music", selected_music)
-
-            output_name = f"reel_{idx + 1}.mp4"
-            result_path = generate_reel(
-                joke_text,
-                output_filename=output_name,
-                duration=duration,
-                video_path=video_path,
-                audio_path=audio_path
-            )
-            st.session_state.video_paths[idx] = result_path
-        except Exception as e:
-            st.error(f"❌ Video {count + 1} failed: {e}")
+    results = render_reels(jobs, on_progress=_on_reel_done)
+
+    for count, (idx, result) in enumerate(zip(indices, results)):
+        if result["success"]:
+            st.session_state.video_paths[idx] = result["path"]
+        else:
+            st.error(f"❌ Video {count + 1} failed: {result['error']}")
 
     progress.progress(1.0, text="✅ All videos generated!")
     st.session_state.videos_done = True
@@ -0,0 +1,469 @@
+"""
+V12 Approximate Bridge Index (IVF-PQ)
+Pure-NumPy inverted-file + product-quantization index over bridge embeddings.
+
+Each vector is assigned to the nearest of nlist k-means centroids (its
+inverted list), and its residual from that centroid is compressed to m
+one-byte codes (product quantization). A query only scores the nprobe
+closest lists, using per-subspace lookup tables (asymmetric distance
+computation), then re-ranks the best candidates with the exact vectors from
+the memory-mapped snapshot.
+
+build_snapshot trains the index once the corpus reaches ANN_MIN_ROWS and
+keeps it in sync incrementally afterwards (new or changed jokes are encoded
+with the existing quantizers). Manual use:
+    python -m modules.joke_generator.ann_index build [--nlist N] [--m M]
+    python -m modules.joke_generator.ann_index report [--queries 200]
+"""
+
+import os
+import time
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+ANN_FILE = "ann.npz"
+
+# Corpus size at which build_snapshot starts maintaining an ANN index
+ANN_MIN_ROWS = int(os.getenv("BRIDGE_ANN_MIN_ROWS", "50000"))
+# Inverted lists scanned per query (0 = always use exact search)
+ANN_NPROBE = int(os.getenv("BRIDGE_ANN_NPROBE", "16"))
+# Candidates re-ranked with exact vectors
+ANN_RERANK = int(os.getenv("BRIDGE_ANN_RERANK", "200"))
+
+KMEANS_ITERS = 20
+TRAIN_SAMPLE = 100_000   # vectors used to train the coarse quantizer
+PQ_TRAIN_SAMPLE = 32768  # residuals used to train each PQ codebook
+PQ_ITERS = 10
+PQ_CENTROIDS = 256       # one byte per sub-vector
+CHUNK = 16384            # rows processed at once when assigning/encoding
+
+
+# ─── Quantizer training ──────────────────────────────────────────────────────
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid (L2) for each vector."""
+    c_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), CHUNK):
+        block = np.asarray(vectors[start:start + CHUNK], dtype=np.float32)
+        # ||x||² is the same for every centroid, so it can be dropped
+        labels[start:start + CHUNK] = (c_norms - 2.0 * (block @ centroids.T)).argmin(axis=1)
+    return labels
+
+
+def kmeans(vectors: np.ndarray, k: int, iters: int = KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means. Empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iters):
+        labels = _assign(vectors, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        sums = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        centroids[filled] = sums / counts[filled, None]
+
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            centroids[empty] = vectors[rng.choice(len(vectors), empty.size, replace=False)]
+
+    return centroids
+
+
+def _default_nlist(n: int) -> int:
+    # ~4·√n lists, with at least ~39 training points per centroid
+    return int(max(1, min(4 * np.sqrt(n), n // 39)))
+
+
+def _default_m(dim: int) -> int:
+    for m in (64, 48, 32, 24, 16, 12, 8, 6, 4, 3, 2):
+        if dim % m == 0 and dim // m >= 2:
+            return m
+    return 1
+
+
+def _checksums(matrix: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """Cheap per-row fingerprint used to spot re-embedded jokes."""
+    return np.concatenate([
+        np.asarray(matrix[rows[start:start + CHUNK]], dtype=np.float32).sum(axis=1)
+        for start in range(0, len(rows), CHUNK)
+    ] or [np.zeros(0, np.float32)])
+
+
+# ─── Index ───────────────────────────────────────────────────────────────────
+
+class IVFPQIndex:
+    """
+    IVF-PQ index over the rows of a bridge snapshot.
+    ids are joke ids; rows are the matching snapshot matrix rows.
+    """
+
+    def __init__(self, centroids: np.ndarray, codebooks: np.ndarray,
+                 ids: np.ndarray, rows: np.ndarray, lists: np.ndarray,
+                 codes: np.ndarray, checksums: np.ndarray,
+                 trained_on: int = 0, snapshot_built_at: float = None):
+        self.centroids = centroids      # (nlist, dim)
+        self.codebooks = codebooks      # (m, 256, dim // m)
+        self.ids = ids
+        self.rows = rows
+        self.lists = lists
+        self.codes = codes              # (n, m) uint8
+        self.checksums = checksums
+        self.trained_on = trained_on
+        self.snapshot_built_at = snapshot_built_at
+        self._sort_lists()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+
+    def _sort_lists(self):
+        """Lay entries out list by list so a probe is one contiguous slice."""
+        order = np.argsort(self.lists, kind="stable")
+        self.ids, self.rows = self.ids[order], self.rows[order]
+        self.lists, self.codes = self.lists[order], self.codes[order]
+        self.checksums = self.checksums[order]
+        self._offsets = np.searchsorted(self.lists, np.arange(self.nlist + 1))
+
+    # ─── Building ────────────────────────────────────────────────────────
+
+    @classmethod
+    def train(cls, matrix: np.ndarray, ids: Sequence[int], nlist: int = None,
+              m: int = None, sample: int = TRAIN_SAMPLE, seed: int = 0,
+              snapshot_built_at: float = None) -> "IVFPQIndex":
+        """Train coarse + PQ quantizers on a sample of matrix and encode every row."""
+        n, dim = matrix.shape
+        nlist = nlist or _default_nlist(n)
+        m = m or _default_m(dim)
+        if dim % m:
+            raise ValueError(f"m={m} must divide the embedding dimension {dim}")
+
+        rng = np.random.default_rng(seed)
+        picked = np.sort(rng.choice(n, min(n, sample), replace=False))
+        train = np.asarray(matrix[picked], dtype=np.float32)
+
+        print(f"🧠 Training IVF-PQ: {n} vectors, nlist={nlist}, m={m} "
+              f"({len(train)} training vectors)...")
+        centroids = kmeans(train, nlist, seed=seed)
+
+        pq_train = train[rng.choice(len(train), min(len(train), PQ_TRAIN_SAMPLE), replace=False)]
+        residuals = pq_train - centroids[_assign(pq_train, centroids)]
+        sub = dim // m
+        codebooks = np.zeros((m, PQ_CENTROIDS, sub), dtype=np.float32)
+        for j in range(m):
+            trained = kmeans(residuals[:, j * sub:(j + 1) * sub], PQ_CENTROIDS,
+                             iters=PQ_ITERS, seed=seed + j)
+            codebooks[j, :len(trained)] = trained
+
+        index = cls(
+            centroids, codebooks,
+            ids=np.zeros(0, np.int64), rows=np.zeros(0, np.int64),
+            lists=np.zeros(0, np.int32), codes=np.zeros((0, m), np.uint8),
+            checksums=np.zeros(0, np.float32),
+            trained_on=n, snapshot_built_at=snapshot_built_at,
+        )
+        index.add(np.asarray(ids, dtype=np.int64), np.arange(n), matrix)
+        print(f"   ✅ Encoded {len(index)} vectors ({index.codes.nbytes / 1e6:.1f} MB of codes)")
+        return index
+
+    def _encode(self, matrix: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(list assignment, PQ codes of the residual) for matrix[rows]."""
+        sub = self.codebooks.shape[2]
+        lists = np.empty(len(rows), dtype=np.int32)
+        codes = np.empty((len(rows), self.m), dtype=np.uint8)
+        for start in range(0, len(rows), CHUNK):
+            block = np.asarray(matrix[rows[start:start + CHUNK]], dtype=np.float32)
+            assigned = _assign(block, self.centroids)
+            residual = block - self.centroids[assigned]
+            lists[start:start + CHUNK] = assigned
+            for j in range(self.m):
+                codes[start:start + CHUNK, j] = _assign(
+                    residual[:, j * sub:(j + 1) * sub], self.codebooks[j]
+                )
+        return lists, codes
+
+    def add(self, ids: np.ndarray, rows: np.ndarray, matrix: np.ndarray):
+        """Encode matrix[rows] with the trained quantizers and append them."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.size == 0:
+            return
+        lists, codes = self._encode(matrix, rows)
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.rows = np.concatenate([self.rows, rows])
+        self.lists = np.concatenate([self.lists, lists])
+        self.codes = np.concatenate([self.codes, codes])
+        self.checksums = np.concatenate([self.checksums, _checksums(matrix, rows)])
+        self._sort_lists()
+
+    def sync(self, ids: Sequence[int], matrix: np.ndarray,
+             snapshot_built_at: float = None) -> Dict[str, int]:
+        """
+        Re-point the index at a new snapshot (ids aligned with matrix rows):
+        keep unchanged jokes, encode new or re-embedded ones, drop the rest.
+        """
+        snapshot_ids = np.asarray(ids, dtype=np.int64)
+        if snapshot_ids.size == 0:
+            removed = len(self)
+            keep = np.zeros(removed, dtype=bool)
+            self.ids, self.rows, self.lists = self.ids[keep], self.rows[keep], self.lists[keep]
+            self.codes, self.checksums = self.codes[keep], self.checksums[keep]
+            self._sort_lists()
+            self.snapshot_built_at = snapshot_built_at
+            return {"added": 0, "changed": 0, "removed": removed}
+
+        order = np.argsort(snapshot_ids, kind="stable")
+        sorted_ids = snapshot_ids[order]
+
+        pos = np.minimum(np.searchsorted(sorted_ids, self.ids), len(sorted_ids) - 1)
+        present = sorted_ids[pos] == self.ids
+        new_rows = order[pos]
+
+        keep = present.copy()
+        if keep.any():
+            keep[present] = np.isclose(
+                _checksums(matrix, new_rows[present]), self.checksums[present], atol=1e-4
+            )
+        changed = int(present.sum() - keep.sum())
+        removed = int((~present).sum())
+
+        self.ids, self.rows = self.ids[keep], new_rows[keep]
+        self.lists, self.codes = self.lists[keep], self.codes[keep]
+        self.checksums = self.checksums[keep]
+
+        todo = np.flatnonzero(~np.isin(snapshot_ids, self.ids))
+        self.add(snapshot_ids[todo], todo, matrix)
+        if todo.size == 0:
+            self._sort_lists()
+        self.snapshot_built_at = snapshot_built_at
+
+        return {"added": int(todo.size) - changed, "changed": changed, "removed": removed}
+
+    # ─── Search ──────────────────────────────────────────────────────────
+
+    def search(self, query: np.ndarray, matrix: np.ndarray, top_k: int = 10,
+               nprobe: int = None, rerank: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Approximate top-k for a unit-length query.
+        Returns (snapshot rows, exact cosine scores), best first.
+        """
+        nprobe = min(nprobe or ANN_NPROBE, self.nlist)
+        rerank = max(rerank or ANN_RERANK, top_k)
+
+        coarse = self.centroids @ query
+        probe = np.argpartition(-coarse, nprobe - 1)[:nprobe] if nprobe < self.nlist \
+            else np.arange(self.nlist)
+
+        candidates = np.concatenate([
+            np.arange(self._offsets[l], self._offsets[l + 1]) for l in probe
+        ])
+        if candidates.size == 0:
+            return np.empty(0, np.int64), np.empty(0, np.float32)
+
+        # score ≈ q·centroid + Σ_j q_j·codebook_j[code_j]  (vectors are unit length)
+        lut = np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.m, -1))
+        approx = coarse[self.lists[candidates]] + \
+            lut[np.arange(self.m), self.codes[candidates]].sum(axis=1)
+
+        if candidates.size > rerank:
+            candidates = candidates[np.argpartition(-approx, rerank - 1)[:rerank]]
+
+        rows = np.sort(self.rows[candidates])  # sorted for mmap locality
+        exact = np.asarray(matrix[rows], dtype=np.float32) @ query
+        best = np.argsort(-exact, kind="stable")[:top_k]
+        return rows[best], exact[best]
+
+    # ─── Persistence ─────────────────────────────────────────────────────
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            codebooks=self.codebooks,
+            ids=self.ids,
+            rows=self.rows,
+            lists=self.lists,
+            codes=self.codes,
+            checksums=self.checksums,
+            trained_on=np.int64(self.trained_on),
+            snapshot_built_at=np.float64(self.snapshot_built_at or 0.0),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                data["centroids"], data["codebooks"], data["ids"], data["rows"],
+                data["lists"], data["codes"], data["checksums"],
+                trained_on=int(data["trained_on"]),
+                snapshot_built_at=float(data["snapshot_built_at"]) or None,
+            )
+
+
+# ─── Snapshot integration ────────────────────────────────────────────────────
+
+def sync_ann(index_dir: str, ids: List[int], matrix: np.ndarray,
+             snapshot_built_at: float) -> Optional[Dict[str, int]]:
+    """
+    Called by build_snapshot before the new snapshot is swapped in: update
+    an existing ANN index incrementally, or train one once the corpus is
+    large enough. Returns the sync counts, or None when there is no index.
+    """
+    path = os.path.join(index_dir, ANN_FILE)
+    try:
+        ann = IVFPQIndex.load(path)
+    except (OSError, KeyError, ValueError):
+        ann = None
+
+    if ann is not None and ann.centroids.shape[1] != matrix.shape[1]:
+        print("   ⚠️  Embedding dimension changed; retraining ANN index")
+        ann = None
+
+    if ann is None:
+        if len(ids) < ANN_MIN_ROWS:
+            return None
+        ann = IVFPQIndex.train(matrix, ids, snapshot_built_at=snapshot_built_at)
+        counts = {"added": len(ann), "changed": 0, "removed": 0}
+    else:
+        counts = ann.sync(ids, matrix, snapshot_built_at=snapshot_built_at)
+        if len(ann) > 4 * ann.trained_on:
+            print(f"   ⚠️  ANN index has grown {len(ann) / ann.trained_on:.1f}× since training; "
+                  f"consider `python -m modules.joke_generator.ann_index build`")
+
+    ann.save(path)
+    return counts
+
+
+def load_ann(index_dir: str, snapshot_built_at: float) -> Optional[IVFPQIndex]:
+    """The ANN index for a snapshot, or None if missing or built for another snapshot."""
+    path = os.path.join(index_dir, ANN_FILE)
+    if not os.path.exists(path):
+        return None
+    try:
+        ann = IVFPQIndex.load(path)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"   ⚠️  Could not load ANN index: {e}")
+        return None
+    if ann.snapshot_built_at != snapshot_built_at:
+        print("   ⚠️  ANN index is stale for this snapshot; using exact search")
+        return None
+    return ann
+
+
+# ─── Evaluation ──────────────────────────────────────────────────────────────
+
+def recall_report(index, queries: np.ndarray = None, n_queries: int = 200,
+                  top_ks: Sequence[int] = (10, 30),
+                  nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32, 64),
+                  noise: float = 0.3, seed: int = 0) -> List[Dict]:
+    """
+    Recall@k and per-query latency of the ANN index against exact search.
+    Without explicit queries, snapshot rows perturbed by Gaussian noise are
+    used as stand-ins for theme embeddings.
+    """
+    if index.ann is None:
+        raise ValueError("Snapshot has no ANN index; run `ann_index build` first")
+
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(index), min(n_queries, len(index)), replace=False)
+        base = index.vectors[np.sort(rows)]
+        queries = base + rng.normal(scale=noise / np.sqrt(index.dim), size=base.shape)
+    queries = np.stack([index.normalize_query(q) for q in queries])
+    k_max = max(top_ks)
+
+    started = time.perf_counter()
+    truth = []
+    for q in queries:
+        truth.append(index.top_k(index.scores(q), k_max))
+    exact_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    report = [{"nprobe": "exact", "ms_per_query": exact_ms,
+               **{f"recall@{k}": 1.0 for k in top_ks}}]
+    for nprobe in nprobes:
+        if nprobe > index.ann.nlist:
+            continue
+        started = time.perf_counter()
+        found = [index.ann.search(q, index.vectors, top_k=k_max, nprobe=nprobe)[0] for q in queries]
+        ms = (time.perf_counter() - started) * 1000 / len(queries)
+        row = {"nprobe": nprobe, "ms_per_query": ms}
+        for k in top_ks:
+            hits = [len(np.intersect1d(f[:k], t[:k])) / k for f, t in zip(found, truth)]
+            row[f"recall@{k}"] = float(np.mean(hits))
+        report.append(row)
+
+    print(f"\n📊 IVF-PQ vs exact — {len(index)} bridges, {len(queries)} queries, "
+          f"nlist={index.ann.nlist}, m={index.ann.m}")
+    header = ["nprobe", *[f"recall@{k}" for k in top_ks], "ms_per_query"]
+    print("   " + "  ".join(f"{h:>12}" for h in header))
+    for row in report:
+        cells = [str(row["nprobe"]), *[f"{row[f'recall@{k}']:.3f}" for k in top_ks],
+                 f"{row['ms_per_query']:.2f}"]
+        print("   " + "  ".join(f"{c:>12}" for c in cells))
+
+    return report
+
+
+def rebuild_ann(index_dir: str = None, nlist: int = None, m: int = None,
+                sample: int = TRAIN_SAMPLE) -> IVFPQIndex:
+    """Retrain the ANN index from scratch for the current snapshot."""
+    from . import bridge_index
+
+    index_dir = index_dir or bridge_index.INDEX_DIR
+    index = bridge_index.get_index(index_dir)
+    if index is None or not len(index):
+        raise ValueError(f"No bridge snapshot in {index_dir}; build it first")
+
+    ann = IVFPQIndex.train(index.vectors, index.ids, nlist=nlist, m=m, sample=sample,
+                           snapshot_built_at=index.built_at)
+    ann.save(os.path.join(index_dir, ANN_FILE))
+    index.ann = ann
+    return ann
+
+
+def main():
+    from . import bridge_index
+
+    parser = argparse.ArgumentParser(description="Build or evaluate the IVF-PQ bridge index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Train the ANN index for the current snapshot")
+    build.add_argument("--nlist", type=int, default=None, help="Inverted lists (default ~4·√n)")
+    build.add_argument("--m", type=int, default=None, help="PQ sub-vectors (bytes per vector)")
+    build.add_argument("--sample", type=int, default=TRAIN_SAMPLE, help="Training sample size")
+
+    report = sub.add_parser("report", help="Recall@k vs latency against exact search")
+    report.add_argument("--queries", type=int, default=200)
+    report.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+
+    parser.add_argument("--index-dir", default=bridge_index.INDEX_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        rebuild_ann(args.index_dir, nlist=args.nlist, m=args.m, sample=args.sample)
+    else:
+        index = bridge_index.get_index(args.index_dir)
+        if index is None:
+            raise SystemExit(f"No bridge snapshot in {args.index_dir}")
+        recall_report(index, n_queries=args.queries, nprobes=args.nprobe)
+
+
+if __name__ == "__main__":
+    main()
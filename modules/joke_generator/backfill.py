@@ -0,0 +1,294 @@
+"""
+V12 Bridge Backfill
+Bulk pipeline that fills comic_segments.bridge_content/bridge_embedding.
+
+Per page of jokes: bridges are written by gpt-4o-mini with bounded
+concurrency, embedded in batched requests, and upserted in bulk. Progress is
+checkpointed after every page so an interrupted run resumes where it stopped;
+jokes that failed in earlier runs are retried first when resuming.
+
+Run:
+    python -m modules.joke_generator.backfill [--all] [--limit N] [--workers 8]
+
+Re-embed existing bridges at a new size (after altering the column, see
+DOCUMENTATION.md) without rewriting them:
+    python -m modules.joke_generator.backfill --reembed --dimensions 512
+"""
+
+import os
+import json
+import time
+import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .local_store import cache_path
+
+
+CHECKPOINT_FILE = "backfill_checkpoint.json"
+REEMBED_CHECKPOINT_FILE = "reembed_checkpoint.json"
+FAILED_BRIDGE = "A joke with an unclear mechanism"  # create_joke_bridge's fallback
+
+
+def load_checkpoint(path: str) -> Dict:
+    """Read the checkpoint, or start fresh."""
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"last_id": 0, "done": 0, "failed_ids": []}
+
+
+def retry_pages(failed_ids, page_size: int, fetch):
+    """Pages of jokes that failed in an earlier run, re-fetched by id."""
+    ids = sorted(failed_ids)
+    for start in range(0, len(ids), page_size):
+        page = fetch(ids[start:start + page_size])
+        if page:
+            yield page
+
+
+def save_checkpoint(path: str, checkpoint: Dict):
+    """Write the checkpoint atomically."""
+    checkpoint["updated_at"] = time.time()
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def create_bridges(jokes: List[Dict], max_workers: int = 8) -> List[Optional[str]]:
+    """Write bridges for a page of jokes concurrently; None marks a failure."""
+    from .bridge_manager import create_joke_bridge
+
+    def _one(joke):
+        try:
+            bridge = create_joke_bridge(joke.get("searchable_text") or "")
+        except Exception as e:
+            print(f"   ❌ Bridge failed for {joke['id']}: {e}")
+            return None
+        return None if bridge == FAILED_BRIDGE else bridge
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_one, jokes))
+
+
+def backfill_bridges(
+    only_missing: bool = True,
+    limit: int = None,
+    max_workers: int = 8,
+    page_size: int = 200,
+    embed_batch_size: int = 256,
+    upsert_batch_size: int = 200,
+    checkpoint_path: str = None,
+    restart: bool = False,
+    from_replica: bool = False,
+) -> Dict:
+    """
+    Backfill bridges for every joke (or only those missing one).
+    from_replica reads pages from the local replica instead of Supabase and
+    writes the new bridges through to it. Returns the final checkpoint dict.
+    """
+    from .db_manager import get_embeddings, get_jokes_by_ids, iter_jokes_for_backfill, upsert_joke_bridges
+
+    checkpoint_path = checkpoint_path or cache_path(CHECKPOINT_FILE)
+    checkpoint = {"last_id": 0, "done": 0, "failed_ids": []} if restart else load_checkpoint(checkpoint_path)
+
+    print()
+    print("=" * 60)
+    print(f"🌉 BRIDGE BACKFILL")
+    print(f"   Resuming after id {checkpoint['last_id']} ({checkpoint['done']} done so far)")
+    print("=" * 60)
+
+    processed = 0
+    started = time.time()
+    failed = set(checkpoint.get("failed_ids", []))
+    if failed:
+        print(f"   Retrying {len(failed)} jokes that failed before")
+
+    replica = None
+    if from_replica:
+        from .replica import get_replica
+
+        replica = get_replica()
+        fetch = replica.jokes_by_ids
+        pages = replica.iter_pages(checkpoint["last_id"], page_size, only_missing)
+    else:
+        fetch = lambda ids: get_jokes_by_ids(ids, "id, searchable_text")
+        pages = iter_jokes_for_backfill(checkpoint["last_id"], page_size, only_missing)
+
+    for retrying, page in itertools.chain(
+        ((True, p) for p in retry_pages(failed, page_size, fetch)),
+        ((False, p) for p in pages),
+    ):
+        if limit is not None:
+            page = page[:limit - processed]
+            if not page:
+                break
+
+        bridges = create_bridges(page, max_workers=max_workers)
+        embeddings = get_embeddings(
+            [b or "" for b in bridges], batch_size=embed_batch_size
+        )
+
+        rows = []
+        for joke, bridge, embedding in zip(page, bridges, embeddings):
+            if bridge is None or embedding is None:
+                failed.add(joke["id"])
+                continue
+            failed.discard(joke["id"])
+            rows.append({
+                "id": joke["id"],
+                "searchable_text": joke.get("searchable_text"),
+                "bridge_content": bridge,
+                "bridge_embedding": embedding,
+            })
+
+        upsert_joke_bridges(rows, batch_size=upsert_batch_size)
+        if replica is not None:
+            replica.apply(rows)
+
+        processed += len(page)
+        if not retrying:
+            checkpoint["last_id"] = page[-1]["id"]
+        checkpoint["done"] += len(rows)
+        checkpoint["failed_ids"] = sorted(failed)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        rate = processed / max(time.time() - started, 1e-6)
+        print(f"   ✅ Through id {checkpoint['last_id']}: +{len(rows)} bridges "
+              f"({processed} this run, {rate:.1f} jokes/s)")
+
+        if limit is not None and processed >= limit:
+            break
+
+    checkpoint["failed_ids"] = sorted(failed)
+    print(f"🏁 Backfill finished: {checkpoint['done']} bridged, "
+          f"{len(checkpoint['failed_ids'])} failed")
+    return checkpoint
+
+
+def reembed_bridges(
+    dimensions: int = None,
+    limit: int = None,
+    page_size: int = 200,
+    embed_batch_size: int = 256,
+    upsert_batch_size: int = 200,
+    checkpoint_path: str = None,
+    restart: bool = False,
+) -> Dict:
+    """
+    Migrate existing rows to a new embedding size: re-embed each stored
+    bridge_content at `dimensions` and upsert it. Bridges are not rewritten.
+    Returns the final checkpoint dict.
+    """
+    from .db_manager import get_embeddings, get_jokes_by_ids, iter_jokes_for_backfill, upsert_joke_bridges
+
+    checkpoint_path = checkpoint_path or cache_path(REEMBED_CHECKPOINT_FILE)
+    checkpoint = {"last_id": 0, "done": 0, "failed_ids": []} if restart else load_checkpoint(checkpoint_path)
+
+    print()
+    print("=" * 60)
+    print(f"🔁 BRIDGE RE-EMBED ({dimensions or 'default'} dims)")
+    print(f"   Resuming after id {checkpoint['last_id']} ({checkpoint['done']} done so far)")
+    print("=" * 60)
+
+    processed = 0
+    failed = set(checkpoint.get("failed_ids", []))
+    if failed:
+        print(f"   Retrying {len(failed)} rows that failed before")
+
+    columns = "id, searchable_text, bridge_content"
+    pages = iter_jokes_for_backfill(
+        checkpoint["last_id"], page_size, only_missing=False,
+        columns=columns, only_bridged=True,
+    )
+    for retrying, page in itertools.chain(
+        ((True, p) for p in retry_pages(failed, page_size, lambda ids: get_jokes_by_ids(ids, columns))),
+        ((False, p) for p in pages),
+    ):
+        if limit is not None:
+            page = page[:limit - processed]
+            if not page:
+                break
+
+        embeddings = get_embeddings(
+            [j.get("bridge_content") or "" for j in page],
+            batch_size=embed_batch_size, dimensions=dimensions,
+        )
+        rows = []
+        for joke, embedding in zip(page, embeddings):
+            if embedding is None:
+                failed.add(joke["id"])
+                continue
+            failed.discard(joke["id"])
+            rows.append({**joke, "bridge_embedding": embedding})
+
+        upsert_joke_bridges(rows, batch_size=upsert_batch_size)
+
+        processed += len(page)
+        if not retrying:
+            checkpoint["last_id"] = page[-1]["id"]
+        checkpoint["done"] += len(rows)
+        checkpoint["failed_ids"] = sorted(failed)
+        save_checkpoint(checkpoint_path, checkpoint)
+        print(f"   ✅ Through id {checkpoint['last_id']}: {checkpoint['done']} re-embedded")
+
+        if limit is not None and processed >= limit:
+            break
+
+    checkpoint["failed_ids"] = sorted(failed)
+    print(f"🏁 Re-embed finished: {checkpoint['done']} rows, "
+          f"{len(checkpoint['failed_ids'])} failed")
+    return checkpoint
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+
+    parser = argparse.ArgumentParser(description="Backfill joke bridges in bulk.")
+    parser.add_argument("--all", action="store_true",
+                        help="Re-index every joke, not just those without a bridge")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after N jokes")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent bridge requests")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--embed-batch", type=int, default=256)
+    parser.add_argument("--upsert-batch", type=int, default=200)
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file path")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--from-replica", action="store_true",
+                        help="Read jokes from the local replica (sync it first)")
+    parser.add_argument("--reembed", action="store_true",
+                        help="Only re-embed existing bridges (e.g. after changing dimensions)")
+    parser.add_argument("--dimensions", type=int, default=None,
+                        help="Embedding size for --reembed (default: EMBEDDING_DIMENSIONS)")
+    args = parser.parse_args()
+
+    if args.reembed:
+        reembed_bridges(
+            dimensions=args.dimensions,
+            limit=args.limit,
+            page_size=args.page_size,
+            embed_batch_size=args.embed_batch,
+            upsert_batch_size=args.upsert_batch,
+            checkpoint_path=args.checkpoint,
+            restart=args.restart,
+        )
+        return
+
+    backfill_bridges(
+        only_missing=not args.all,
+        limit=args.limit,
+        max_workers=args.workers,
+        page_size=args.page_size,
+        embed_batch_size=args.embed_batch,
+        upsert_batch_size=args.upsert_batch,
+        checkpoint_path=args.checkpoint,
+        restart=args.restart,
+        from_replica=args.from_replica,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+V12 Local Bridge Index
+Exact in-process search over comic_segments.bridge_embedding.
+
+The snapshot is a contiguous float32 matrix of L2-normalised rows saved as
+.npy and opened memory-mapped, so every worker process shares the same page
+cache instead of holding its own copy. A search is one matrix-vector product
+plus argpartition, and returns the same dicts as the match_joke_bridges RPC.
+Large snapshots also get an IVF-PQ index (ann_index.py) that search() uses
+instead of the full scan.
+
+The local copy can be smaller than the stored embeddings: vectors are
+truncated to BRIDGE_INDEX_DIMS (text-embedding-3 is Matryoshka-trained, so a
+re-normalised prefix is a valid lower-dimensional embedding) and stored as
+float32, float16 or int8 (per-row scale). Queries are truncated to match.
+
+Build or refresh the snapshot with:
+    python -m modules.joke_generator.bridge_index [--dims 512] [--dtype int8]
+"""
+
+import os
+import json
+import time
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .local_store import CACHE_DIR
+
+
+INDEX_DIR = os.getenv("BRIDGE_INDEX_DIR", os.path.join(CACHE_DIR, "bridge_index"))
+# Legacy (unversioned) names; builds now write "bridges-<stamp>.npy" etc.
+# and the meta file, swapped last, names the generation to open
+MATRIX_FILE = "bridges.npy"
+META_FILE = "bridges_meta.json"
+LEXICAL_FILE = "lexical.npz"
+SCALES_FILE = "bridges_scales.npy"
+
+# Local snapshot size/precision (0 dims = keep the embeddings' own size)
+INDEX_DIMS = int(os.getenv("BRIDGE_INDEX_DIMS", "0"))
+INDEX_DTYPE = os.getenv("BRIDGE_INDEX_DTYPE", "float32")
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+# Where refresh_snapshot reads from: "replica" (local, incremental) or "supabase"
+SNAPSHOT_SOURCE = os.getenv("BRIDGE_SNAPSHOT_SOURCE", "replica")
+
+SCORE_CHUNK = 512  # rows de-quantised at once when scoring (small enough to stay in cache)
+
+
+class DimensionMismatch(ValueError):
+    """The query embedding is smaller than the snapshot's vectors (rebuild with --dims)."""
+
+
+def prepare_matrix(vectors, dims: int = None,
+                   dtype: str = "float32") -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Truncate embeddings to dims, L2-normalise and quantise them for storage.
+    Returns (stored matrix, per-row int8 scales or None).
+    """
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError(f"Unknown storage dtype {dtype!r}; use one of {STORAGE_DTYPES}")
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if dims and dims < matrix.shape[1]:
+        matrix = matrix[:, :dims]
+    matrix = np.array(matrix, dtype=np.float32, order="C")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+        return quantized, scales.astype(np.float32)
+    return matrix, None
+
+
+class DequantizedRows:
+    """Row access to a float16/int8 matrix that yields float32 vectors."""
+
+    def __init__(self, matrix: np.ndarray, scales: np.ndarray = None):
+        self.matrix = matrix
+        self.scales = scales
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __getitem__(self, rows) -> np.ndarray:
+        block = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= np.asarray(self.scales[rows], dtype=np.float32)[..., None]
+        return block
+
+
+class BridgeIndex:
+    """Exact cosine-similarity index over pre-normalised bridge embeddings."""
+
+    def __init__(self, matrix: np.ndarray, ids: List[int], searchable_text: List[str],
+                 bridge_content: List[str], built_at: float = None, ann=None,
+                 scales: np.ndarray = None):
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(
+                f"Index matrix shape {matrix.shape} does not match {len(ids)} ids"
+            )
+        self.matrix = matrix
+        self.scales = scales
+        # float32 rows for re-ranking / ANN; the matrix itself when unquantised
+        self.vectors = matrix if matrix.dtype == np.float32 and scales is None \
+            else DequantizedRows(matrix, scales)
+        self.ids = ids
+        self.searchable_text = searchable_text
+        self.bridge_content = bridge_content
+        self.built_at = built_at
+        self.ann = ann
+        self._row_of = None
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def load(cls, index_dir: str = INDEX_DIR) -> "BridgeIndex":
+        """
+        Open a snapshot memory-mapped (read-only). The meta file names the
+        matrix generation it belongs to, so ids and vectors always match;
+        if a concurrent build pruned that generation in between, the meta
+        is re-read.
+        """
+        for attempt in range(3):
+            with open(os.path.join(index_dir, META_FILE), "r") as f:
+                meta = json.load(f)
+            try:
+                matrix = np.load(os.path.join(index_dir, meta.get("matrix_file", MATRIX_FILE)),
+                                 mmap_mode="r")
+                scales = None
+                if meta.get("dtype") == "int8":
+                    scales = np.load(os.path.join(index_dir, meta.get("scales_file", SCALES_FILE)),
+                                     mmap_mode="r")
+                break
+            except FileNotFoundError:
+                if attempt == 2:
+                    raise
+        if matrix.shape[0] != len(meta["ids"]):
+            raise ValueError(f"Snapshot matrix has {matrix.shape[0]} rows, meta lists {len(meta['ids'])}")
+
+        from .ann_index import load_ann
+
+        built_at = meta.get("built_at")
+        return cls(matrix, meta["ids"], meta["searchable_text"], meta["bridge_content"],
+                   built_at=built_at, ann=load_ann(index_dir, built_at), scales=scales)
+
+    def normalize_query(self, query_embedding) -> np.ndarray:
+        """Return the query as a unit-length float32 vector, truncated to the index size."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.ndim == 1 and query.shape[0] > self.dim:
+            query = query[:self.dim]
+        if query.shape != (self.dim,):
+            raise DimensionMismatch(f"Query has shape {query.shape}, index expects ({self.dim},)")
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        return query
+
+    def top_k(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        """Indices of the top_k highest scores, best first."""
+        top_k = min(top_k, scores.shape[0])
+        if top_k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if top_k < scores.shape[0]:
+            candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """matrix @ queries, de-quantising a chunk of rows at a time if needed."""
+        if self.vectors is self.matrix:
+            return self.matrix @ queries
+        out = np.empty((len(self),) + queries.shape[1:], dtype=np.float32)
+        for start in range(0, len(self), SCORE_CHUNK):
+            out[start:start + SCORE_CHUNK] = self.vectors[start:start + SCORE_CHUNK] @ queries
+        return out
+
+    def to_matches(self, rows: Iterable[int], similarities: Iterable[float]) -> List[Dict]:
+        """Shape rows (with their similarity) like the match_joke_bridges RPC output."""
+        return [
+            {
+                "id": self.ids[i],
+                "searchable_text": self.searchable_text[i],
+                "bridge_content": self.bridge_content[i],
+                "similarity": float(similarity),
+            }
+            for i, similarity in zip(rows, similarities)
+        ]
+
+    def nearest(self, query: np.ndarray, top_k: int, nprobe: int = None):
+        """
+        (rows, cosine scores) of the top_k rows for a unit-length query.
+        Uses the ANN index when there is one (nprobe=0 forces a full scan).
+        """
+        if self.ann is not None and nprobe != 0:
+            return self.ann.search(query, self.vectors, top_k=top_k, nprobe=nprobe)
+        scores = self.scores(query)
+        rows = self.top_k(scores, top_k)
+        return rows, scores[rows]
+
+    def search(self, query_embedding, top_k: int = 10, nprobe: int = None) -> List[Dict]:
+        """Top-k cosine search (approximate + exact re-rank if an ANN index is loaded)."""
+        query = self.normalize_query(query_embedding)
+        return self.to_matches(*self.nearest(query, top_k, nprobe))
+
+    def search_many(self, query_embeddings, top_k: int = 10, pooling: str = "max",
+                    temperature: float = 0.05) -> List[Dict]:
+        """
+        Score several queries (e.g. one per theme) in one matrix-matrix
+        product and pool per joke: "max", "mean", or "softmax" (each joke's
+        theme scores weighted by a softmax over themes). similarity is the
+        pooled score.
+        """
+        queries = np.stack([self.normalize_query(q) for q in query_embeddings])
+        scores = self.scores(queries.T)  # (jokes, themes)
+
+        if pooling == "max":
+            pooled = scores.max(axis=1)
+        elif pooling == "mean":
+            pooled = scores.mean(axis=1)
+        elif pooling == "softmax":
+            weights = np.exp((scores - scores.max(axis=1, keepdims=True)) / temperature)
+            weights /= weights.sum(axis=1, keepdims=True)
+            pooled = (weights * scores).sum(axis=1)
+        else:
+            raise ValueError(f"Unknown pooling: {pooling}")
+
+        rows = self.top_k(pooled, top_k)
+        return self.to_matches(rows, pooled[rows])
+
+    def row_of(self, joke_id: int) -> Optional[int]:
+        """Matrix row for a joke id."""
+        if self._row_of is None:
+            self._row_of = {joke_id: row for row, joke_id in enumerate(self.ids)}
+        return self._row_of.get(joke_id)
+
+    def search_hybrid(self, query_embedding, query_text: str, lexical,
+                      top_k: int = 10, candidates: int = 100) -> List[Dict]:
+        """
+        Fuse the vector ranking with a BM25 ranking of query_text using
+        reciprocal-rank fusion. similarity stays the exact cosine score.
+        """
+        from .lexical_index import reciprocal_rank_fusion
+
+        query = self.normalize_query(query_embedding)
+
+        vector_rows, _ = self.nearest(query, max(candidates, top_k))
+        vector_ranking = [self.ids[row] for row in vector_rows]
+        lexical_ranking = [joke_id for joke_id, _ in lexical.search(query_text, max(candidates, top_k))]
+
+        rows = []
+        for joke_id, _ in reciprocal_rank_fusion([vector_ranking, lexical_ranking]):
+            row = self.row_of(joke_id)
+            if row is not None:
+                rows.append(row)
+            if len(rows) == top_k:
+                break
+
+        rows = np.asarray(rows, dtype=np.int64)
+        return self.to_matches(rows, self.vectors[rows] @ query)
+
+
+def build_snapshot(rows: Iterable[Dict], index_dir: str = INDEX_DIR,
+                   dims: int = None, dtype: str = None) -> int:
+    """
+    Write a snapshot from rows with id, searchable_text, bridge_content and
+    bridge_embedding, truncated to dims and stored as dtype (defaults:
+    BRIDGE_INDEX_DIMS / BRIDGE_INDEX_DTYPE). The matrix and scales are
+    written under new, versioned names and the meta file that points at
+    them is swapped in last, so running workers see either the old or the
+    new snapshot, never a mix. The previous generation is kept for readers
+    still opening it; older ones are deleted. The ANN index is
+    synced (or trained, once the corpus is big enough) before the swap.
+    Returns the number of rows indexed.
+    """
+    dims = INDEX_DIMS if dims is None else dims
+    dtype = dtype or INDEX_DTYPE
+
+    ids, texts, bridges, vectors = [], [], [], []
+    for row in rows:
+        if row.get("bridge_embedding") is None:
+            continue
+        ids.append(row["id"])
+        texts.append(row.get("searchable_text") or "")
+        bridges.append(row.get("bridge_content") or "")
+        vectors.append(row["bridge_embedding"])
+
+    if vectors:
+        matrix, scales = prepare_matrix(vectors, dims=dims, dtype=dtype)
+    else:
+        matrix, scales = np.zeros((0, 0), dtype=np.float32), None
+    del vectors
+
+    os.makedirs(index_dir, exist_ok=True)
+    meta_path = os.path.join(index_dir, META_FILE)
+    built_at = time.time()
+    stamp = f"{int(built_at * 1000)}"
+    matrix_file = f"bridges-{stamp}.npy"
+    scales_file = f"bridges_scales-{stamp}.npy" if scales is not None else None
+
+    with open(os.path.join(index_dir, matrix_file), "wb") as f:
+        np.save(f, matrix)
+    if scales is not None:
+        with open(os.path.join(index_dir, scales_file), "wb") as f:
+            np.save(f, scales)
+    with open(meta_path + ".tmp", "w") as f:
+        json.dump({
+            "ids": ids,
+            "searchable_text": texts,
+            "bridge_content": bridges,
+            "dims": int(matrix.shape[1]),
+            "dtype": dtype if len(ids) else "float32",
+            "built_at": built_at,
+            "matrix_file": matrix_file,
+            "scales_file": scales_file,
+        }, f)
+
+    from .ann_index import sync_ann
+
+    # The ANN index sees the same de-quantised vectors searches will re-rank with
+    stored = matrix if scales is None and matrix.dtype == np.float32 else DequantizedRows(matrix, scales)
+    ann_counts = sync_ann(index_dir, ids, stored, built_at) if len(ids) else None
+    if ann_counts:
+        print(f"   🧭 ANN index: +{ann_counts['added']} new, {ann_counts['changed']} changed, "
+              f"-{ann_counts['removed']} removed")
+
+    previous = _generation_files(meta_path)
+    os.replace(meta_path + ".tmp", meta_path)
+    _prune_generations(index_dir, keep=previous | {matrix_file, scales_file})
+
+    from .lexical_index import update_lexical_index
+
+    update_lexical_index(
+        zip(ids, (f"{t} {b}" for t, b in zip(texts, bridges))),
+        path=os.path.join(index_dir, LEXICAL_FILE),
+    )
+
+    return len(ids)
+
+
+def _generation_files(meta_path: str) -> set:
+    """Matrix/scales file names the current meta points at (empty if none)."""
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    return {meta.get("matrix_file", MATRIX_FILE), meta.get("scales_file", SCALES_FILE)}
+
+
+def _prune_generations(index_dir: str, keep: set):
+    """Delete snapshot matrices/scales other than the ones in keep."""
+    for name in os.listdir(index_dir):
+        if name in keep or not name.endswith(".npy"):
+            continue
+        if name in (MATRIX_FILE, SCALES_FILE) or name.startswith(("bridges-", "bridges_scales-")):
+            try:
+                os.remove(os.path.join(index_dir, name))
+            except OSError:
+                pass
+
+
+def refresh_snapshot(index_dir: str = INDEX_DIR, dims: int = None, dtype: str = None,
+                     source: str = None) -> int:
+    """
+    Rebuild the snapshot. source="replica" (default) syncs the local
+    comic_segments replica, moving only changed rows, and builds from disk;
+    source="supabase" pages every bridged joke over the wire.
+    """
+    source = source or SNAPSHOT_SOURCE
+    if source == "replica":
+        from .replica import get_replica
+
+        replica = get_replica()
+        replica.sync()
+        rows = replica.iter_bridged()
+    else:
+        from .db_manager import iter_bridged_jokes
+
+        print(f"📥 Pulling bridge embeddings from Supabase...")
+        rows = iter_bridged_jokes()
+
+    count = build_snapshot(rows, index_dir=index_dir, dims=dims, dtype=dtype)
+    print(f"   ✅ Indexed {count} bridges → {index_dir}")
+    return count
+
+
+# ─── Process-wide index handle ───────────────────────────────────────────────
+
+def get_lexical(index_dir: str = INDEX_DIR):
+    """The BM25 index that sits next to the vector snapshot, if built."""
+    from .lexical_index import get_lexical_index
+
+    return get_lexical_index(os.path.join(index_dir, LEXICAL_FILE))
+
+
+_indexes: Dict[str, tuple] = {}
+_index_lock = threading.Lock()
+
+
+def get_index(index_dir: str = INDEX_DIR) -> Optional[BridgeIndex]:
+    """
+    Return the snapshot for this process, reopening it when a newer one has
+    been written. Returns None if no snapshot exists yet.
+    """
+    meta_path = os.path.join(index_dir, META_FILE)
+    try:
+        mtime = os.path.getmtime(meta_path)
+    except OSError:
+        return None
+
+    with _index_lock:
+        cached = _indexes.get(index_dir)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = (mtime, BridgeIndex.load(index_dir))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"   ⚠️  Could not load bridge index: {e}")
+                return None
+            _indexes[index_dir] = cached
+        return cached[1]
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+
+    parser = argparse.ArgumentParser(description="Build or re-index the local bridge snapshot.")
+    parser.add_argument("--dims", type=int, default=None,
+                        help="Truncate vectors to this many dimensions (default: BRIDGE_INDEX_DIMS)")
+    parser.add_argument("--dtype", choices=STORAGE_DTYPES, default=None,
+                        help="Storage precision (default: BRIDGE_INDEX_DTYPE)")
+    parser.add_argument("--source", choices=["replica", "supabase"], default=None,
+                        help="Read from the local replica or Supabase (default: BRIDGE_SNAPSHOT_SOURCE)")
+    args = parser.parse_args()
+
+    refresh_snapshot(dims=args.dims, dtype=args.dtype, source=args.source)
@@ -3,7 +3,11 @@ V12 Bridge Embedding Manager
 Refactored for Unified Content Engine — uses relative imports.
 """
 
+import re
+from typing import Dict, List
+
 from . import openai_client
+from .theme_memo import get_theme_memo
 
 
 def create_joke_bridge(joke_text: str) -> str:
@@ -42,10 +46,19 @@ def create_joke_bridge(joke_text: str) -> str:
     return bridge_string
 
 
-def expand_headline_to_themes(headline: str) -> str:
+def expand_headline_to_themes(headline: str, use_cache: bool = True) -> str:
     """
     Expands a headline into abstract themes for semantic search.
+    Results are memoised per (loosely normalised) headline, so a repeat
+    headline skips the chat call entirely.
     """
+    memo = get_theme_memo()
+    if use_cache:
+        cached = memo.get(headline)
+        if cached is not None:
+            print("   ⚡ Themes from memo")
+            return cached
+
     prompt = f"""
     Topic: "{headline}"
     
@@ -66,4 +79,38 @@ def expand_headline_to_themes(headline: str) -> str:
     if response_text is None:
         return headline
 
-    return response_text.strip()
+    themes = response_text.strip()
+    if themes:
+        memo.put(headline, themes)
+    return themes or headline
+
+
+def warm_theme_memo(topics: List[str], max_workers: int = 8) -> Dict[str, int]:
+    """Expand themes for topics that are not memoised yet (e.g. trending topics)."""
+    from .parallel import run_concurrently
+
+    memo = get_theme_memo()
+    todo = list(dict.fromkeys(t for t in topics if t and t not in memo))
+    counts = {"cached": len(set(topics)) - len(todo), "expanded": 0, "failed": 0}
+
+    for i, _, error in run_concurrently(
+        lambda topic: expand_headline_to_themes(topic, use_cache=False), todo, max_workers=max_workers
+    ):
+        # A failed expansion returns the headline itself without memoising it
+        if error is None and memo.get(todo[i]) is not None:
+            counts["expanded"] += 1
+        else:
+            counts["failed"] += 1
+
+    return counts
+
+
+def split_themes(themes: str) -> List[str]:
+    """Split expand_headline_to_themes output into individual themes."""
+    parts = re.split(r"[,\n;]+", themes)
+    themes_by_key = {}
+    for part in parts:
+        theme = part.strip().strip("'\"").strip()
+        if theme and theme.casefold() not in themes_by_key:
+            themes_by_key[theme.casefold()] = theme
+    return list(themes_by_key.values())
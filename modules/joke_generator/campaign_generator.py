@@ -2,26 +2,68 @@
 V12 Campaign Generator
 Refactored for Unified Content Engine — uses relative imports, no sys.path hack.
 Exports: find_matching_structures, search_bridges, generate_from_selected,
-         generate_campaign, generate_campaign_json
+         iter_generate_from_selected, generate_campaign, generate_campaign_json,
+         generate_variants_for_jokes
 """
 
-from typing import List, Dict
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from .bridge_manager import expand_headline_to_themes
-from .db_manager import get_embedding, search_by_bridge
-from .engine import generate_v11_joke
+from . import bridge_index
+from .bridge_manager import expand_headline_to_themes, split_themes
+from .db_manager import get_embedding, get_embeddings, search_by_bridge
+from .engine import generate_v11_joke, generate_v11_jokes_batch, generate_variants
+from .local_store import append_jsonl
+from .parallel import run_concurrently
 
 
-def find_matching_structures(headline: str, top_k: int = 10) -> List[Dict]:
+# "local" searches the in-process snapshot when one exists; "rpc" always
+# goes to Supabase's match_joke_bridges.
+SEARCH_BACKEND = os.getenv("BRIDGE_SEARCH_BACKEND", "local")
+
+# Concurrent Gemini calls per campaign, and the per-joke time limit (seconds)
+GENERATION_PARALLELISM = int(os.getenv("JOKE_GENERATION_PARALLELISM", "8"))
+GENERATION_TIMEOUT = float(os.getenv("JOKE_GENERATION_TIMEOUT", "120"))
+# Slack for the per-card backstop in generate_variants_for_jokes, so the
+# card's own deadline (which keeps its partial variants) always fires first
+VARIANT_TIMEOUT_MARGIN = 10.0
+
+# Reference jokes packed into one Gemini request (1 = one request per joke)
+GENERATION_BATCH_SIZE = int(os.getenv("JOKE_GENERATION_BATCH_SIZE", "1"))
+
+# Headline/theme log that embedding_eval replays as real search queries
+SEARCH_LOG_FILE = "search_log.jsonl"
+LOG_SEARCHES = os.getenv("BRIDGE_SEARCH_LOG", "1") == "1"
+
+
+def find_matching_structures(headline: str, top_k: int = 10, mode: str = "vector",
+                             pooling: str = "max") -> List[Dict]:
     """
     1. Expands headline into Themes.
-    2. Searches the DB's 'Bridge Vectors'.
+    2. Searches the 'Bridge Vectors' (local snapshot if built, else the DB).
+    mode="hybrid" also runs BM25 over the joke/bridge text for the headline
+    and themes, fused with the vector ranking by reciprocal rank.
+    mode="multi_theme" embeds each theme separately and pools their scores.
     """
     print(f"🔍 Expanding headline to themes...")
 
     search_query = expand_headline_to_themes(headline)
     print(f"   Themes: {search_query}")
 
+    if LOG_SEARCHES:
+        try:
+            append_jsonl(SEARCH_LOG_FILE, {"ts": time.time(), "headline": headline, "themes": search_query})
+        except OSError as e:
+            print(f"   ⚠️  Could not log search: {e}")
+
+    if mode == "multi_theme":
+        matches = _search_multi_theme(search_query, top_k, pooling)
+        if matches is not None:
+            print(f"   Found {len(matches)} matches")
+            return matches
+        print("   ⚠️  Multi-theme search unavailable; using vector search")
+
     print(f"🧮 Creating embedding...")
     query_embedding = get_embedding(search_query)
 
@@ -29,18 +71,72 @@ def find_matching_structures(headline: str, top_k: int = 10) -> List[Dict]:
         print("   ❌ Failed to create query embedding")
         return []
 
-    print(f"🔎 Searching bridge embeddings...")
-    matches = search_by_bridge(query_embedding, match_count=top_k)
+    index = bridge_index.get_index() if SEARCH_BACKEND == "local" else None
+
+    lexical = bridge_index.get_lexical() if index is not None and mode == "hybrid" else None
+    if mode == "hybrid" and lexical is None:
+        print("   ⚠️  Hybrid search needs the local bridge index; using vector search")
+
+    matches = None
+    try:
+        if lexical is not None and len(index):
+            print(f"🔎 Hybrid search over local bridge index ({len(index)} bridges)...")
+            matches = index.search_hybrid(
+                query_embedding, f"{headline} {search_query}", lexical, top_k=top_k
+            )
+        elif index is not None and len(index):
+            print(f"🔎 Searching local bridge index ({len(index)} bridges)...")
+            matches = index.search(query_embedding, top_k=top_k)
+    except bridge_index.DimensionMismatch as e:
+        _warn_dimension_mismatch(e)
+
+    if matches is None:
+        print(f"🔎 Searching bridge embeddings...")
+        matches = search_by_bridge(query_embedding, match_count=top_k)
 
     print(f"   Found {len(matches)} matches")
 
     return matches
 
 
-def search_bridges(headline: str, top_k: int = 30) -> List[Dict]:
+def _search_multi_theme(search_query: str, top_k: int, pooling: str) -> Optional[List[Dict]]:
+    """
+    Fan-out search: one batched embeddings call for all themes, one
+    matrix-matrix product against the bridge index, pooled per joke.
+    Returns None when there is no local index to search, or it was built
+    at more dimensions than the query embeddings have.
+    """
+    index = bridge_index.get_index() if SEARCH_BACKEND == "local" else None
+    if index is None or not len(index):
+        return None
+
+    themes = split_themes(search_query) or [search_query]
+    print(f"🧮 Embedding {len(themes)} themes in one request...")
+    embeddings = [e for e in get_embeddings(themes) if e is not None]
+    if not embeddings:
+        print("   ❌ Failed to create theme embeddings")
+        return []
+
+    print(f"🔎 Multi-theme search ({pooling} pooling, {len(index)} bridges)...")
+    try:
+        return index.search_many(embeddings, top_k=top_k, pooling=pooling)
+    except bridge_index.DimensionMismatch as e:
+        _warn_dimension_mismatch(e)
+        return None
+
+
+def _warn_dimension_mismatch(error: Exception):
+    print(f"   ⚠️  Bridge index does not match the embedding size ({error}); "
+          f"rebuild it with `python -m modules.joke_generator.bridge_index --dims N`")
+
+
+def search_bridges(headline: str, top_k: int = 30, mode: str = "vector",
+                   pooling: str = "max") -> List[Dict]:
     """
     Phase 1: Search bridge embeddings and return raw matches for user selection.
     Does NOT generate any jokes — just returns the semantic search results.
+    mode: "vector" (default), "hybrid" (vector + BM25, fused with RRF) or
+    "multi_theme" (one embedding per theme, pooled with max/mean/softmax).
     """
     print()
     print("=" * 60)
@@ -49,16 +145,129 @@ def search_bridges(headline: str, top_k: int = 30) -> List[Dict]:
     print("=" * 60)
     print()
 
-    matches = find_matching_structures(headline, top_k=top_k)
+    matches = find_matching_structures(headline, top_k=top_k, mode=mode, pooling=pooling)
 
     print(f"   Returning {len(matches)} bridge matches for selection")
     return matches
 
 
-def generate_from_selected(headline: str, selected_matches: List[Dict]) -> List[Dict]:
+def _generate_for_match(headline: str, match: Dict, use_cache: bool = True) -> Dict:
+    """Run the V11 engine for one bridge match. Returns the raw engine dict."""
+    return generate_v11_joke(match.get('searchable_text', ''), headline, use_cache=use_cache)
+
+
+def _build_result(match: Dict, generated: Dict) -> Dict:
+    """Shape a successful generation as a joke card dict."""
+    return {
+        "original_id": match.get('id'),
+        "searchable_text": match.get('searchable_text', ''),
+        "bridge_content": match.get('bridge_content', ''),
+        "similarity": match.get('similarity', 0),
+        "engine": generated.get('engine_selected'),
+        "selected_strategy": generated.get('selected_strategy'),
+        "joke": generated.get('draft_joke'),
+        "brainstorming": generated.get('brainstorming', [])
+    }
+
+
+def _log_outcome(i: int, total: int, match: Dict, generated: Dict, error: Exception):
+    """Print one match's outcome as a single block (safe with concurrent calls)."""
+    bridge = match.get('bridge_content', '')
+    lines = [
+        "",
+        f"[{i+1}/{total}] ────────────────────────────────",
+        f"📌 Reference ID: {match.get('id')}",
+        f"📊 Similarity: {match.get('similarity', 0):.3f}",
+        f"🌉 Bridge: {bridge[:60]}..." if bridge else "   No bridge",
+        f"📝 Joke: {match.get('searchable_text', '')[:80]}...",
+    ]
+    if error is not None:
+        lines.append(f"❌ Error: {error}")
+    elif generated.get('success'):
+        lines += [
+            f"✅ Engine: {generated.get('engine_selected')}",
+            f"💡 Strategy: {generated.get('selected_strategy')}",
+            f"🎭 Joke: {generated.get('draft_joke')}",
+        ]
+    else:
+        lines.append(f"❌ Generation failed: {generated.get('error')}")
+    print("\n".join(lines))
+
+
+def _iter_generate(headline: str, matches: List[Dict], max_workers: int = None,
+                   timeout: float = None, use_cache: bool = True,
+                   batch_size: int = None) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    Generate jokes for every match on a bounded thread pool, yielding
+    (index, result) as each finishes. result is None when that match failed.
+    With batch_size > 1, each task packs that many matches into one Gemini
+    request (timeout then applies per batch).
+    """
+    max_workers = max_workers or GENERATION_PARALLELISM
+    timeout = timeout if timeout is not None else GENERATION_TIMEOUT
+    batch_size = max(1, batch_size or GENERATION_BATCH_SIZE)
+
+    chunks = [
+        list(range(start, min(start + batch_size, len(matches))))
+        for start in range(0, len(matches), batch_size)
+    ]
+
+    def _run_chunk(indices):
+        if len(indices) == 1:
+            return [_generate_for_match(headline, matches[indices[0]], use_cache)]
+        references = [matches[i].get('searchable_text', '') for i in indices]
+        return generate_v11_jokes_batch(references, headline, use_cache=use_cache)
+
+    outcomes = run_concurrently(_run_chunk, chunks, max_workers=max_workers, timeout=timeout)
+
+    for c, generated_list, error in outcomes:
+        for pos, i in enumerate(chunks[c]):
+            match = matches[i]
+            generated = generated_list[pos] if error is None else None
+            _log_outcome(i, len(matches), match, generated, error)
+            if error is None and generated.get('success'):
+                yield i, _build_result(match, generated)
+            else:
+                yield i, None
+
+
+def _generate_for_matches(headline: str, matches: List[Dict],
+                          max_workers: int = None, timeout: float = None,
+                          use_cache: bool = True, batch_size: int = None) -> List[Dict]:
+    """Collect _iter_generate in match order; failures are skipped."""
+    slots = [None] * len(matches)
+    for i, result in _iter_generate(headline, matches, max_workers, timeout, use_cache, batch_size):
+        slots[i] = result
+    return [r for r in slots if r is not None]
+
+
+def iter_generate_from_selected(headline: str, selected_matches: List[Dict],
+                                max_workers: int = None, timeout: float = None,
+                                use_cache: bool = True,
+                                batch_size: int = None) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    Streaming variant of generate_from_selected.
+    Yields (index into selected_matches, joke dict or None on failure) in
+    completion order, so callers can show each joke as soon as it is ready.
+    """
+    print()
+    print("=" * 60)
+    print(f"🔥 STREAMING {len(selected_matches)} SELECTED BRIDGES")
+    print(f"   Headline: {headline}")
+    print("=" * 60)
+
+    yield from _iter_generate(headline, selected_matches, max_workers, timeout, use_cache, batch_size)
+
+
+def generate_from_selected(headline: str, selected_matches: List[Dict],
+                           max_workers: int = None, timeout: float = None,
+                           use_cache: bool = True, batch_size: int = None) -> List[Dict]:
     """
     Phase 2: Generate jokes only for user-selected bridge matches.
     Takes the headline and pre-selected matches (from search_bridges output).
+    Up to max_workers Gemini calls run at once; timeout is per joke.
+    Previously generated jokes come from the cache unless use_cache=False.
+    batch_size > 1 packs several references into each Gemini request.
     """
     print()
     print("=" * 60)
@@ -67,58 +276,59 @@ def generate_from_selected(headline: str, selected_matches: List[Dict]) -> List[
     print("=" * 60)
     print()
 
-    results = []
+    results = _generate_for_matches(headline, selected_matches, max_workers, timeout,
+                                    use_cache, batch_size)
 
-    for i, match in enumerate(selected_matches):
-        reference_joke = match.get('searchable_text', '')
-        joke_id = match.get('id')
-        similarity = match.get('similarity', 0)
-        bridge = match.get('bridge_content', '')
+    print()
+    print("=" * 60)
+    print("GENERATION COMPLETE")
+    print("=" * 60)
+    print(f"✅ Generated: {len(results)} jokes from {len(selected_matches)} selected bridges")
 
-        print()
-        print(f"[{i+1}/{len(selected_matches)}] ────────────────────────────────")
-        print(f"📌 Reference ID: {joke_id}")
-        print(f"📊 Similarity: {similarity:.3f}")
-        print(f"🌉 Bridge: {bridge[:60]}..." if bridge else "   No bridge")
-        print(f"📝 Joke: {reference_joke[:80]}...")
-        print()
+    return results
 
-        try:
-            generated = generate_v11_joke(reference_joke, headline)
-
-            if generated.get('success'):
-                result = {
-                    "original_id": joke_id,
-                    "searchable_text": reference_joke,
-                    "bridge_content": bridge,
-                    "similarity": similarity,
-                    "engine": generated.get('engine_selected'),
-                    "selected_strategy": generated.get('selected_strategy'),
-                    "joke": generated.get('draft_joke'),
-                    "brainstorming": generated.get('brainstorming', [])
-                }
-                results.append(result)
-
-                print(f"✅ Engine: {result['engine']}")
-                print(f"💡 Strategy: {result['selected_strategy']}")
-                print(f"🎭 Joke: {result['joke']}")
-            else:
-                print(f"❌ Generation failed: {generated.get('error')}")
 
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            continue
+def generate_variants_for_jokes(headline: str, jokes: List[Dict], n: int = None,
+                                k: int = None, max_workers: int = None,
+                                timeout: float = None) -> List[Dict]:
+    """
+    Alternative drafts for generated joke cards: up to n regenerate_joke
+    calls per card, stopping at k distinct variants (engine.generate_variants).
+    Each card gets "variants" (list of joke strings) and "variant_stats".
+    Cards are processed max_workers at a time. timeout is enforced per card
+    by generate_variants, which returns the variants found so far.
+    """
+    max_workers = max_workers or GENERATION_PARALLELISM
+    timeout = timeout if timeout is not None else GENERATION_TIMEOUT
 
     print()
     print("=" * 60)
-    print("GENERATION COMPLETE")
+    print(f"🎲 GENERATING VARIANTS FOR {len(jokes)} JOKES")
     print("=" * 60)
-    print(f"✅ Generated: {len(results)} jokes from {len(selected_matches)} selected bridges")
 
-    return results
+    def _run(card):
+        return generate_variants(
+            card.get('searchable_text', ''), headline, card.get('engine', ''),
+            card.get('joke', ''), n=n, k=k, timeout=timeout
+        )
+
+    # The outer limit is only a backstop for a card that hangs outright
+    outer_timeout = timeout + VARIANT_TIMEOUT_MARGIN if timeout is not None else None
+    for i, result, error in run_concurrently(_run, jokes, max_workers=max_workers, timeout=outer_timeout):
+        card = jokes[i]
+        if error is not None:
+            print(f"   ❌ Variants failed for {card.get('original_id')}: {error}")
+            card["variants"], card["variant_stats"] = [], None
+            continue
+        card["variants"] = [v.get('draft_joke') for v in result["variants"]]
+        card["variant_stats"] = result["stats"]
+
+    return jokes
 
 
-def generate_campaign(headline: str, top_k: int = 10) -> List[Dict]:
+def generate_campaign(headline: str, top_k: int = 10,
+                      max_workers: int = None, timeout: float = None,
+                      use_cache: bool = True, batch_size: int = None) -> List[Dict]:
     """
     Master loop that generates joke variations based on a headline.
     """
@@ -135,47 +345,8 @@ def generate_campaign(headline: str, top_k: int = 10) -> List[Dict]:
         print("❌ No matching structures found!")
         return []
 
-    results = []
-
-    for i, match in enumerate(matches):
-        reference_joke = match.get('searchable_text', '')
-        joke_id = match.get('id')
-        similarity = match.get('similarity', 0)
-        bridge = match.get('bridge_content', '')
-
-        print()
-        print(f"[{i+1}/{len(matches)}] ────────────────────────────────")
-        print(f"📌 Reference ID: {joke_id}")
-        print(f"📊 Similarity: {similarity:.3f}")
-        print(f"🌉 Bridge: {bridge[:60]}..." if bridge else "   No bridge")
-        print(f"📝 Joke: {reference_joke[:80]}...")
-        print()
-
-        try:
-            generated = generate_v11_joke(reference_joke, headline)
-
-            if generated.get('success'):
-                result = {
-                    "original_id": joke_id,
-                    "searchable_text": reference_joke,
-                    "bridge_content": bridge,
-                    "similarity": similarity,
-                    "engine": generated.get('engine_selected'),
-                    "selected_strategy": generated.get('selected_strategy'),
-                    "joke": generated.get('draft_joke'),
-                    "brainstorming": generated.get('brainstorming', [])
-                }
-                results.append(result)
-
-                print(f"✅ Engine: {result['engine']}")
-                print(f"💡 Strategy: {result['selected_strategy']}")
-                print(f"🎭 Joke: {result['joke']}")
-            else:
-                print(f"❌ Generation failed: {generated.get('error')}")
-
-        except Exception as e:
-            print(f"❌ Error: {e}")
-            continue
+    results = _generate_for_matches(headline, matches, max_workers, timeout,
+                                    use_cache, batch_size)
 
     print()
     print("=" * 60)
@@ -0,0 +1,87 @@
+"""
+Shared API Clients
+Lazily constructed, process-wide OpenAI / Gemini / Supabase clients.
+
+Each client is built on first use (so importing the package does not load
+or validate any SDK) and then reused, keeping one keep-alive connection pool
+per process. All three SDK clients are safe to share across worker threads.
+"""
+
+import os
+import threading
+
+
+# Per-request HTTP timeout for the LLM clients (seconds), so a hung
+# connection fails and is retried instead of holding a worker forever
+API_HTTP_TIMEOUT = float(os.getenv("API_HTTP_TIMEOUT", "60"))
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def _get_or_create(name: str, factory):
+    # Keyed by pid so a forked worker builds its own pool instead of
+    # inheriting the parent's sockets.
+    key = (name, os.getpid())
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = factory()
+                _clients[key] = client
+    return client
+
+
+def _create_openai():
+    from openai import OpenAI
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in environment. Check your .env file.")
+    # Retries are owned by rate_limiter.governed_call, not the SDK
+    return OpenAI(api_key=api_key, max_retries=0, timeout=API_HTTP_TIMEOUT)
+
+
+def _create_gemini():
+    from google import genai
+    from google.genai import types
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in environment. Check your .env file.")
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(timeout=int(API_HTTP_TIMEOUT * 1000)),
+    )
+
+
+def _create_supabase():
+    from supabase import create_client
+
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment")
+    return create_client(url, key)
+
+
+def get_openai_client():
+    """Shared OpenAI client."""
+    return _get_or_create("openai", _create_openai)
+
+
+def get_gemini_client():
+    """Shared Gemini client."""
+    return _get_or_create("gemini", _create_gemini)
+
+
+def get_supabase_client():
+    """Shared Supabase client."""
+    return _get_or_create("supabase", _create_supabase)
+
+
+def reset_clients():
+    """Drop all cached clients (e.g. after rotating API keys)."""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,267 @@
+"""
+V12 Gemini Context Cache
+Provider-side cached content for long, constant system instructions.
+
+The first call_gemini with a given (model, system instruction) creates a
+cachedContents entry holding the instruction; later calls reference it by
+name instead of re-sending it, and the cached input tokens are billed at
+the reduced cache rate. Entries live for a TTL and are recreated shortly
+before they expire. Instructions below the provider's minimum cacheable
+size, or ones the provider refuses to cache, are sent inline as before.
+
+GEMINI_CONTEXT_CACHE selects the backend:
+    gemini  provider-side cache via client.caches (default)
+    local   in-process stand-in with the same lifecycle; the instruction is
+            still sent inline, so it works offline and in tests
+    off     always inline
+"""
+
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from .rate_limiter import _status_code, estimate_tokens
+
+
+CONTEXT_CACHE_MODE = os.getenv("GEMINI_CONTEXT_CACHE", "gemini")
+CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+# Recreate an entry this many seconds before it expires, so no request
+# races the provider-side expiry.
+REFRESH_MARGIN = 60
+# After a failed create, send inline for this long before trying again.
+RETRY_AFTER = 300
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_cache_miss(error: Exception) -> bool:
+    """The referenced cachedContents entry is gone (expired or deleted)."""
+    status = _status_code(error)
+    return status == 404 or (status in (400, 403) and "cache" in str(error).lower())
+
+
+class GeminiCacheBackend:
+    """cachedContents on the Gemini API."""
+
+    name = "gemini"
+
+    def create(self, model: str, system_instruction: str, ttl: int) -> str:
+        from google.genai import types
+        from .clients import get_gemini_client
+        from .rate_limiter import governed_call
+
+        client = get_gemini_client()
+        cached = governed_call(
+            "gemini",
+            lambda: client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    ttl=f"{ttl}s",
+                    display_name=f"system-{_sha(system_instruction)[:12]}",
+                ),
+            ),
+        )
+        return cached.name
+
+    def delete(self, name: str):
+        from .clients import get_gemini_client
+
+        get_gemini_client().caches.delete(name=name)
+
+    def apply(self, config, name: str, system_instruction: str):
+        config.cached_content = name
+        config.system_instruction = None
+
+
+class LocalCacheBackend:
+    """
+    In-process stand-in for the provider cache. Creates, expires and
+    deletes entries like the real thing, but apply() puts the instruction
+    inline, so requests behave exactly as without caching.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self.entries: Dict[str, Tuple[str, str]] = {}
+        self.created = 0
+        self.deleted = 0
+
+    def create(self, model: str, system_instruction: str, ttl: int) -> str:
+        self.created += 1
+        name = f"cachedContents/local-{self.created}"
+        self.entries[name] = (model, system_instruction)
+        return name
+
+    def delete(self, name: str):
+        if self.entries.pop(name, None) is not None:
+            self.deleted += 1
+
+    def apply(self, config, name: str, system_instruction: str):
+        config.cached_content = None
+        config.system_instruction = self.entries[name][1]
+
+
+class ContextCache:
+    """Per-process map of (model, instruction) → live cachedContents name."""
+
+    def __init__(self, backend, ttl: int = CONTEXT_CACHE_TTL,
+                 min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+                 clock: Callable[[], float] = time.time):
+        self.backend = backend
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.clock = clock
+        self._lock = threading.Lock()
+
+        # key -> (name, expires_at)
+        self._entries: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        # key -> time before which we don't try to create again
+        self._blocked: Dict[Tuple[str, str], float] = {}
+        # key -> Future of the create in progress; resolves to the name or None
+        self._pending: Dict[Tuple[str, str], Future] = {}
+
+        self.hits = 0
+        self.created = 0
+        self.refreshed = 0
+        self.inline = 0
+        self.cached_tokens = 0
+
+    def lookup(self, model: str, system_instruction: str) -> Optional[str]:
+        """Live cache name for this instruction, creating/refreshing it; None → send inline."""
+        if not system_instruction or estimate_tokens(system_instruction) < self.min_tokens:
+            with self._lock:
+                self.inline += 1
+            return None
+
+        key = (model, _sha(system_instruction))
+        with self._lock:
+            now = self.clock()
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[1] - REFRESH_MARGIN:
+                self.hits += 1
+                return entry[0]
+
+            if now < self._blocked.get(key, 0):
+                self.inline += 1
+                return None
+
+            # One thread creates per key; the rest keep using the old entry
+            # while it is still live, or wait for this key's create.
+            pending = self._pending.get(key)
+            if pending is not None and entry is not None and now < entry[1]:
+                self.hits += 1
+                return entry[0]
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+
+        if not owner:
+            name = pending.result()
+            with self._lock:
+                if name is not None:
+                    self.hits += 1
+                else:
+                    self.inline += 1
+            return name
+
+        # The create (and the delete of the entry it replaces) run outside the lock
+        name = None
+        try:
+            name = self.backend.create(model, system_instruction, self.ttl)
+        except Exception as e:
+            # 400: too small / not cacheable for this model, don't retry
+            permanent = _status_code(e) == 400
+            with self._lock:
+                self._blocked[key] = float("inf") if permanent else now + RETRY_AFTER
+                self._entries.pop(key, None)
+                self.inline += 1
+            print(f"   ⚠️  Gemini context cache unavailable ({e}); sending instruction inline")
+            return None
+        else:
+            with self._lock:
+                self._entries[key] = (name, now + self.ttl)
+                if entry is not None:
+                    self.refreshed += 1
+                else:
+                    self.created += 1
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set_result(name)
+
+        if entry is not None:
+            self._discard(entry[0])
+        return name
+
+    def configure(self, config, model: str, system_instruction: str) -> Optional[str]:
+        """Point config at the cached instruction, or set it inline. Returns the cache name used."""
+        name = self.lookup(model, system_instruction)
+        if name is not None:
+            self.backend.apply(config, name, system_instruction)
+        else:
+            config.system_instruction = system_instruction
+        return name
+
+    def invalidate(self, model: str, system_instruction: str):
+        """Forget an entry the provider no longer has; the next lookup recreates it."""
+        with self._lock:
+            self._entries.pop((model, _sha(system_instruction)), None)
+
+    def record_usage(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        tokens = getattr(usage, "cached_content_token_count", None) or 0
+        with self._lock:
+            self.cached_tokens += tokens
+
+    def clear(self):
+        """Delete every entry this process created."""
+        with self._lock:
+            names = [name for name, _ in self._entries.values()]
+            self._entries.clear()
+        for name in names:
+            self._discard(name)
+
+    def _discard(self, name: str):
+        try:
+            self.backend.delete(name)
+        except Exception:
+            pass  # it expires on its own
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.backend.name,
+                "live": len(self._entries),
+                "hits": self.hits,
+                "created": self.created,
+                "refreshed": self.refreshed,
+                "inline": self.inline,
+                "cached_tokens": self.cached_tokens,
+            }
+
+
+_BACKENDS = {"gemini": GeminiCacheBackend, "local": LocalCacheBackend}
+
+_cache: Optional[ContextCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_context_cache() -> Optional[ContextCache]:
+    """Process-wide context cache, or None when GEMINI_CONTEXT_CACHE=off."""
+    global _cache
+    backend = _BACKENDS.get(CONTEXT_CACHE_MODE)
+    if backend is None:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = ContextCache(backend())
+        return _cache
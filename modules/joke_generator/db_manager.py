@@ -4,90 +4,281 @@ Refactored for Unified Content Engine — reads credentials from .env
 """
 
 import os
-from supabase import create_client
+import json
+from typing import Dict, List
 
+from .clients import get_openai_client, get_supabase_client
+from .rate_limiter import estimate_tokens, governed_call
 
-def get_supabase_client():
-    """Get Supabase client."""
-    url = os.getenv("SUPABASE_URL")
-    key = os.getenv("SUPABASE_KEY")
 
-    if not url or not key:
-        raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment")
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 256  # inputs per embeddings request (API max is 2048)
 
-    return create_client(url, key)
+# Output size of the model; text-embedding-3 supports shorter (Matryoshka)
+# vectors. Must match the bridge_embedding column (see backfill --reembed).
+NATIVE_DIMENSIONS = 1536
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", str(NATIVE_DIMENSIONS)))
 
 
-def get_embedding(text: str) -> list:
+def get_embedding(text: str, use_cache: bool = True, dimensions: int = None) -> list:
     """
     Generate embedding for text using OpenAI.
-    Uses text-embedding-3-small model.
+    Uses text-embedding-3-small model. Repeat texts are served from the
+    local embedding cache without an API call.
     """
-    from openai import OpenAI
+    return get_embeddings([text], use_cache=use_cache, dimensions=dimensions)[0]
 
-    openai_key = os.getenv("OPENAI_API_KEY")
-    if not openai_key:
-        raise ValueError("OPENAI_API_KEY not found in environment. Check your .env file.")
 
-    client = OpenAI(api_key=openai_key)
+def get_embeddings(texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE,
+                   use_cache: bool = True, dimensions: int = None) -> List[list]:
+    """
+    Embed many texts, sending up to batch_size inputs per request.
+    Returns one embedding per input, in order (None for empty texts).
+    dimensions defaults to EMBEDDING_DIMENSIONS.
+    """
+    from .embedding_cache import get_embedding_cache, normalize_text
+
+    dimensions = dimensions or EMBEDDING_DIMENSIONS
+    extra = {} if dimensions == NATIVE_DIMENSIONS else {"dimensions": dimensions}
+    # Native-size vectors keep their original cache keys
+    cache_model = EMBEDDING_MODEL if not extra else f"{EMBEDDING_MODEL}@{dimensions}"
+
+    texts = [normalize_text(t or "") for t in texts]
+    embeddings = [None] * len(texts)
+    cache = get_embedding_cache() if use_cache else None
+
+    # Unique, non-empty texts that still need an API call → their positions
+    pending = {}
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        if cache is not None:
+            cached = cache.get(cache_model, text)
+            if cached is not None:
+                embeddings[i] = cached.tolist()
+                continue
+        pending.setdefault(text, []).append(i)
+
+    if not pending:
+        return embeddings
+
+    client = get_openai_client()
+
+    unique_texts = list(pending)
+    for start in range(0, len(unique_texts), batch_size):
+        batch = unique_texts[start:start + batch_size]
+        response = governed_call(
+            "openai",
+            lambda: client.embeddings.create(
+                input=batch,
+                model=EMBEDDING_MODEL,
+                **extra
+            ),
+            est_tokens=estimate_tokens(*batch),
+        )
+
+        for item in response.data:
+            text = batch[item.index]
+            if cache is not None:
+                cache.put(cache_model, text, item.embedding)
+            for i in pending[text]:
+                embeddings[i] = item.embedding
+
+    return embeddings
+
+
+def execute(query):
+    """Run a PostgREST query through the request governor (rate limit + retry)."""
+    return governed_call("supabase", query.execute)
 
-    text = text.replace("\n", " ").strip()
-    if not text:
-        return None
 
-    response = client.embeddings.create(
-        input=[text],
-        model="text-embedding-3-small"
-    )
+JOKE_COLUMNS = "id, searchable_text, bridge_content"
 
-    return response.data[0].embedding
 
+def get_all_jokes(limit: int = None, columns: str = JOKE_COLUMNS, page_size: int = 1000):
+    """
+    Get all jokes from the database, paging by id so PostgREST's row cap
+    never truncates the result. Embeddings are only fetched if listed in
+    columns (e.g. columns="*").
+    """
+    jokes = []
+    for page in iter_joke_pages(columns=columns, page_size=page_size):
+        jokes.extend(page)
+        if limit and len(jokes) >= limit:
+            return jokes[:limit]
+    return jokes
 
-def get_all_jokes(limit: int = None):
-    """Get all jokes from the database."""
+
+def parse_embedding(value) -> list:
+    """PostgREST returns pgvector columns as '[0.1,0.2,...]' strings."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+
+def iter_bridged_jokes(page_size: int = 1000):
+    """
+    Yield every joke that has a bridge embedding, one page at a time.
+    Only the columns needed for search are selected.
+    """
     supabase = get_supabase_client()
 
-    query = supabase.table("comic_segments").select("*")
-    if limit:
-        query = query.limit(limit)
+    start = 0
+    while True:
+        result = execute(
+            supabase.table("comic_segments")
+            .select("id, searchable_text, bridge_content, bridge_embedding")
+            .not_.is_("bridge_embedding", "null")
+            .order("id")
+            .range(start, start + page_size - 1)
+        )
+        rows = result.data or []
+        if not rows:
+            break
+        for row in rows:
+            row["bridge_embedding"] = parse_embedding(row.get("bridge_embedding"))
+            yield row
 
-    result = query.execute()
-    return result.data
+        start += len(rows)
 
 
 def update_joke_bridge(joke_id: int, bridge_content: str, bridge_embedding: list):
     """Update a joke with its bridge content and embedding."""
     supabase = get_supabase_client()
 
-    result = supabase.table("comic_segments").update({
+    result = execute(supabase.table("comic_segments").update({
         "bridge_content": bridge_content,
         "bridge_embedding": bridge_embedding
-    }).eq("id", joke_id).execute()
+    }).eq("id", joke_id))
 
     return result
 
 
+def iter_joke_pages(columns: str = JOKE_COLUMNS, after_id: int = 0, page_size: int = 1000,
+                    only_missing: bool = False, only_bridged: bool = False):
+    """
+    Yield pages of rows (id + columns) in id order, starting after after_id.
+    Keyset pagination keeps every page cheap however deep the scan goes.
+    """
+    supabase = get_supabase_client()
+
+    last_id = after_id
+    while True:
+        query = (
+            supabase.table("comic_segments")
+            .select(columns)
+            .gt("id", last_id)
+        )
+        if only_missing:
+            query = query.is_("bridge_embedding", "null")
+        if only_bridged:
+            query = query.not_.is_("bridge_content", "null")
+
+        rows = execute(query.order("id").limit(page_size)).data or []
+        if not rows:
+            break
+
+        yield rows
+        last_id = rows[-1]["id"]
+        # No early exit on a short page: PostgREST's max-rows cap can make
+        # every page shorter than page_size
+
+
+def iter_jokes_for_backfill(after_id: int = 0, page_size: int = 200,
+                            only_missing: bool = True,
+                            columns: str = "id, searchable_text",
+                            only_bridged: bool = False):
+    """Pages of jokes for the bridge backfill (see iter_joke_pages)."""
+    return iter_joke_pages(columns, after_id, page_size, only_missing, only_bridged)
+
+
+def iter_changed_jokes(columns: str, since: str = None, after_id: int = 0,
+                       page_size: int = 1000):
+    """
+    Yield pages of rows changed after the (updated_at, id) cursor, oldest
+    first. Needs an updated_at column maintained by a trigger.
+    """
+    supabase = get_supabase_client()
+
+    cursor = (since, after_id)
+    while True:
+        query = supabase.table("comic_segments").select(columns)
+        if cursor[0] is not None:
+            query = query.or_(
+                f'updated_at.gt."{cursor[0]}",'
+                f'and(updated_at.eq."{cursor[0]}",id.gt.{cursor[1]})'
+            )
+        rows = execute(query.order("updated_at").order("id").limit(page_size)).data or []
+        if not rows:
+            break
+
+        for row in rows:
+            if "bridge_embedding" in row:
+                row["bridge_embedding"] = parse_embedding(row["bridge_embedding"])
+        yield rows
+        cursor = (rows[-1]["updated_at"], rows[-1]["id"])
+
+
+def get_jokes_by_ids(ids: List[int], columns: str, batch_size: int = 200) -> List[Dict]:
+    """Fetch specific jokes, batch_size ids per request."""
+    supabase = get_supabase_client()
+
+    rows = []
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        result = execute(supabase.table("comic_segments").select(columns).in_("id", batch))
+        for row in result.data or []:
+            if "bridge_embedding" in row:
+                row["bridge_embedding"] = parse_embedding(row["bridge_embedding"])
+            rows.append(row)
+    return rows
+
+
+def upsert_joke_bridges(rows: List[Dict], batch_size: int = 200) -> int:
+    """
+    Write bridge_content/bridge_embedding for many jokes, batch_size rows per
+    request. Each row needs id, searchable_text, bridge_content and
+    bridge_embedding (searchable_text is sent so the upsert satisfies NOT NULL).
+    """
+    supabase = get_supabase_client()
+
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        execute(supabase.table("comic_segments").upsert(batch, on_conflict="id"))
+        written += len(batch)
+
+    return written
+
+
 def search_by_bridge(query_embedding: list, match_count: int = 10):
     """Search jokes by bridge embedding similarity."""
     supabase = get_supabase_client()
 
-    result = supabase.rpc(
+    result = execute(supabase.rpc(
         'match_joke_bridges',
         {
             'query_embedding': query_embedding,
             'match_count': match_count
         }
-    ).execute()
+    ))
 
     return result.data
 
 
 def check_bridge_column_exists():
     """Check if bridge columns exist in the database."""
+    return check_columns_exist("bridge_content, bridge_embedding")
+
+
+def check_columns_exist(columns: str) -> bool:
+    """Check if the given comic_segments columns exist."""
     supabase = get_supabase_client()
 
     try:
-        result = supabase.table("comic_segments").select("bridge_content, bridge_embedding").limit(1).execute()
+        result = supabase.table("comic_segments").select(columns).limit(1).execute()
         return True
     except Exception as e:
         if "column" in str(e).lower():
@@ -0,0 +1,163 @@
+"""
+V12 Embedding Cache
+Two-tier, content-addressed cache for OpenAI embeddings.
+
+Tier 1 is an in-memory LRU; tier 2 is a SQLite file holding the raw float32
+vectors. Keys are sha256(model + normalised text), so the same theme string
+is only ever embedded once per model.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from .local_store import open_sqlite
+
+
+EMBEDDING_CACHE_FILE = "embeddings.sqlite3"
+MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY", "2048"))
+MAX_DISK_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace (incl. newlines) the way the embeddings call expects."""
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    """Content address for a (model, text) pair."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """In-memory LRU in front of a size-bounded SQLite vector store."""
+
+    def __init__(self, filename: str = EMBEDDING_CACHE_FILE,
+                 memory_entries: int = MEMORY_ENTRIES,
+                 max_disk_entries: int = MAX_DISK_ENTRIES):
+        self.memory_entries = memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db = open_sqlite(filename)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._db.commit()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached float32 vector, or None on a miss."""
+        key = cache_key(model, text)
+
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            row = self._db.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._db.execute(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key)
+            )
+            self._db.commit()
+            self._remember(key, vector)
+            self.disk_hits += 1
+            return vector
+
+    def put(self, model: str, text: str, vector) -> np.ndarray:
+        """Store a vector in both tiers and return it as float32."""
+        key = cache_key(model, text)
+        vector = np.asarray(vector, dtype=np.float32)
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, vector.shape[0], vector.tobytes(), time.time())
+            )
+            self._db.commit()
+            self._remember(key, vector)
+
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 100:
+                self._trim()
+
+        return vector
+
+    def _trim(self):
+        """Evict least-recently-used rows once the store exceeds its bound."""
+        self._writes_since_trim = 0
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_disk_entries
+        if excess <= 0:
+            return
+
+        # Trim an extra 10% so we don't evict on every subsequent write
+        excess += self.max_disk_entries // 10
+        cursor = self._db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,)
+        )
+        self._db.commit()
+        self.evictions += cursor.rowcount
+
+    def stats(self) -> dict:
+        """Hit/miss counters for both tiers."""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "evictions": self.evictions,
+            }
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide embedding cache, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EmbeddingCache()
+        return _cache
@@ -0,0 +1,170 @@
+"""
+V12 Embedding Size Evaluation
+Compares bridge search quality, speed and memory across local snapshot
+settings (truncated dimensions × storage precision).
+
+Replays the theme strings from the search log (cache/search_log.jsonl,
+written by find_matching_structures) against exact full-precision search
+and reports recall@k, query latency and index size for every setting, so
+the cheapest one that keeps quality can be picked for BRIDGE_INDEX_DIMS /
+BRIDGE_INDEX_DTYPE.
+
+Run:
+    python -m modules.joke_generator.embedding_eval [--dims 1536 1024 512 256]
+        [--dtypes float32 float16 int8] [--queries 500] [--source snapshot|replica|db]
+"""
+
+import os
+import json
+import time
+import argparse
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .bridge_index import STORAGE_DTYPES, BridgeIndex, prepare_matrix
+from .local_store import cache_path
+
+
+def load_logged_queries(limit: int = 500, path: str = None) -> List[str]:
+    """Most recent unique theme strings from the search log."""
+    from .campaign_generator import SEARCH_LOG_FILE
+
+    path = path or cache_path(SEARCH_LOG_FILE)
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+
+    queries, seen = [], set()
+    for record in reversed(records):
+        themes = (record.get("themes") or "").strip()
+        if themes and themes not in seen:
+            seen.add(themes)
+            queries.append(themes)
+        if len(queries) >= limit:
+            break
+    return queries
+
+
+def load_reference_vectors(source: str = "snapshot") -> Tuple[List[int], np.ndarray]:
+    """
+    Full-precision bridge vectors to evaluate against: the local snapshot
+    (only if it is still unquantised float32), the local replica, or a
+    fresh pull from Supabase.
+    """
+    if source == "snapshot":
+        from .bridge_index import get_index
+
+        index = get_index()
+        if index is None or not len(index):
+            raise ValueError("No local bridge snapshot; build it or use --source db")
+        if index.vectors is not index.matrix:
+            raise ValueError("Local snapshot is quantised; use --source db for full-precision vectors")
+        return list(index.ids), np.asarray(index.matrix, dtype=np.float32)
+
+    if source == "replica":
+        from .replica import get_replica
+
+        rows = get_replica().iter_bridged()
+    else:
+        from .db_manager import iter_bridged_jokes
+
+        rows = iter_bridged_jokes()
+
+    ids, vectors = [], []
+    for row in rows:
+        ids.append(row["id"])
+        vectors.append(row["bridge_embedding"])
+    return ids, np.asarray(vectors, dtype=np.float32)
+
+
+def evaluate(ids: List[int], vectors: np.ndarray, query_vectors: np.ndarray,
+             dims_list: Sequence[int], dtypes: Sequence[str] = STORAGE_DTYPES,
+             top_ks: Sequence[int] = (10, 30)) -> List[Dict]:
+    """
+    recall@k (vs exact full-precision search), ms/query and index size for
+    every (dims, dtype) combination.
+    """
+    k_max = max(top_ks)
+    blank = [""] * len(ids)
+
+    full, _ = prepare_matrix(vectors)
+    baseline = BridgeIndex(full, ids, blank, blank)
+    truth = [baseline.nearest(baseline.normalize_query(q), k_max, nprobe=0)[0] for q in query_vectors]
+
+    report = []
+    for dims in dims_list:
+        for dtype in dtypes:
+            stored, scales = prepare_matrix(vectors, dims=dims, dtype=dtype)
+            index = BridgeIndex(stored, ids, blank, blank, scales=scales)
+
+            started = time.perf_counter()
+            found = [index.nearest(index.normalize_query(q), k_max, nprobe=0)[0] for q in query_vectors]
+            ms = (time.perf_counter() - started) * 1000 / max(len(query_vectors), 1)
+
+            row = {"dims": index.dim, "dtype": dtype, "mb": index.nbytes / 1e6, "ms_per_query": ms}
+            for k in top_ks:
+                row[f"recall@{k}"] = float(np.mean([
+                    len(np.intersect1d(f[:k], t[:k])) / min(k, len(t) or 1)
+                    for f, t in zip(found, truth)
+                ]))
+            report.append(row)
+
+    return report
+
+
+def print_report(report: List[Dict], top_ks: Sequence[int], n_queries: int,
+                 n_bridges: int, min_recall: float = 0.95):
+    print(f"\n📊 Bridge search by embedding size — {n_bridges} bridges, {n_queries} logged queries")
+    header = ["dims", "dtype", "MB", "ms/query", *[f"recall@{k}" for k in top_ks]]
+    print("   " + "  ".join(f"{h:>10}" for h in header))
+    for row in report:
+        cells = [str(row["dims"]), row["dtype"], f"{row['mb']:.1f}", f"{row['ms_per_query']:.2f}",
+                 *[f"{row[f'recall@{k}']:.3f}" for k in top_ks]]
+        print("   " + "  ".join(f"{c:>10}" for c in cells))
+
+    k = min(top_ks)
+    good = [row for row in report if row[f"recall@{k}"] >= min_recall]
+    if good:
+        best = min(good, key=lambda row: (row["mb"], row["ms_per_query"]))
+        print(f"\n✅ Cheapest setting with recall@{k} ≥ {min_recall}: "
+              f"BRIDGE_INDEX_DIMS={best['dims']} BRIDGE_INDEX_DTYPE={best['dtype']}")
+    else:
+        print(f"\n⚠️  No setting reaches recall@{k} ≥ {min_recall}")
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+
+    parser = argparse.ArgumentParser(description="Evaluate reduced/quantised bridge embeddings.")
+    parser.add_argument("--dims", type=int, nargs="+", default=[1536, 1024, 512, 256])
+    parser.add_argument("--dtypes", nargs="+", choices=STORAGE_DTYPES, default=list(STORAGE_DTYPES))
+    parser.add_argument("--queries", type=int, default=500, help="Most recent logged searches to replay")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--source", choices=["snapshot", "replica", "db"], default="snapshot")
+    parser.add_argument("--log", default=None, help="Search log path")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    args = parser.parse_args()
+
+    queries = load_logged_queries(args.queries, args.log)
+    if not queries:
+        raise SystemExit("❌ No logged searches yet — run some headline searches first")
+
+    from .db_manager import get_embeddings
+
+    print(f"🧮 Embedding {len(queries)} logged queries...")
+    query_vectors = np.asarray([e for e in get_embeddings(queries) if e is not None], dtype=np.float32)
+
+    print(f"📥 Loading full-precision bridge vectors ({args.source})...")
+    ids, vectors = load_reference_vectors(args.source)
+
+    report = evaluate(ids, vectors, query_vectors, args.dims, args.dtypes, args.k)
+    print_report(report, args.k, len(query_vectors), len(ids), args.min_recall)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,50 +3,87 @@ V11 Logic Engine - Core Engine
 Refactored for Unified Content Engine — uses relative imports.
 """
 
-from typing import Dict, Optional
-from .gemini_client import classify_joke_type, call_gemini
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Optional
+from .gemini_client import classify_joke_type, classify_joke_types_batch, call_gemini, draft_from_analysis
+from .joke_analysis import get_analysis_store
 
 
-def generate_v11_joke(reference_joke: str, new_topic: str) -> Dict:
+# Use the slim prompt when a reference joke has a precomputed analysis
+USE_JOKE_ANALYSIS = os.getenv("USE_JOKE_ANALYSIS", "1") == "1"
+
+# Variant generation: up to N regenerate_joke calls per bridge, stop at K
+VARIANT_ATTEMPTS = int(os.getenv("JOKE_VARIANT_ATTEMPTS", "6"))
+VARIANT_TARGET = int(os.getenv("JOKE_VARIANT_TARGET", "3"))
+# Token-overlap (Jaccard) at or above which two drafts count as the same joke
+VARIANT_SIMILARITY = float(os.getenv("JOKE_VARIANT_SIMILARITY", "0.8"))
+
+REQUIRED_KEYS = ["engine_selected", "reasoning", "brainstorming", "selected_strategy", "draft_joke"]
+
+
+def validate_result(result) -> Dict:
     """
-    V11 Enhanced Pipeline: Analyze → Brainstorm → Select → Draft
+    Turn a raw Comedy Architect response into the engine result shape:
+    success=True with optional keys back-filled, or success=False + error.
     """
-    try:
-        result = classify_joke_type(reference_joke, new_topic)
-
-        required_keys = ["engine_selected", "reasoning", "brainstorming", "selected_strategy", "draft_joke"]
-
-        if isinstance(result, dict):
-            if "error" in result:
-                return {
-                    "success": False,
-                    "error": result.get("error"),
-                    "raw": result.get("raw", "")
-                }
-
-            missing = [k for k in required_keys if k not in result]
-            if missing:
-                for key in missing:
-                    if key == "brainstorming":
-                        result[key] = ["N/A"]
-                    elif key == "selected_strategy":
-                        result[key] = "N/A"
-                    else:
-                        return {
-                            "success": False,
-                            "error": f"Missing keys in response: {missing}",
-                            "partial_result": result
-                        }
-
-            result["success"] = True
-            return result
-        else:
+    if isinstance(result, dict):
+        if "error" in result:
             return {
                 "success": False,
-                "error": "Unexpected response type",
-                "raw": str(result)
+                "error": result.get("error"),
+                "raw": result.get("raw", "")
             }
 
+        missing = [k for k in REQUIRED_KEYS if k not in result]
+        if missing:
+            for key in missing:
+                if key == "brainstorming":
+                    result[key] = ["N/A"]
+                elif key == "selected_strategy":
+                    result[key] = "N/A"
+                else:
+                    return {
+                        "success": False,
+                        "error": f"Missing keys in response: {missing}",
+                        "partial_result": result
+                    }
+
+        result["success"] = True
+        return result
+    else:
+        return {
+            "success": False,
+            "error": "Unexpected response type",
+            "raw": str(result)
+        }
+
+
+def generate_v11_joke(reference_joke: str, new_topic: str, use_cache: bool = True,
+                      use_analysis: bool = None,
+                      on_field: Callable[[str, object], None] = None) -> Dict:
+    """
+    V11 Enhanced Pipeline: Analyze → Brainstorm → Select → Draft
+    use_cache=False bypasses the generation cache for a deliberate re-roll.
+    If the reference joke was analysed offline (joke_analysis.py), the
+    Analyze step is skipped and only Brainstorm → Draft is requested.
+    on_field(key, value) is called as each field streams in (e.g. to show
+    "draft_joke" before the call returns).
+    """
+    use_analysis = USE_JOKE_ANALYSIS if use_analysis is None else use_analysis
+    try:
+        analysis = get_analysis_store().get(reference_joke) if use_analysis else None
+        if analysis:
+            result = draft_from_analysis(reference_joke, analysis, new_topic,
+                                         use_cache=use_cache, on_field=on_field)
+        else:
+            result = classify_joke_type(reference_joke, new_topic,
+                                        use_cache=use_cache, on_field=on_field)
+        return validate_result(result)
+
     except Exception as e:
         return {
             "success": False,
@@ -54,6 +91,29 @@ def generate_v11_joke(reference_joke: str, new_topic: str) -> Dict:
         }
 
 
+def generate_v11_jokes_batch(reference_jokes: List[str], new_topic: str,
+                             use_cache: bool = True) -> List[Dict]:
+    """
+    Batched V11 pipeline: one Gemini request for several reference jokes.
+    Any element that is missing or fails validation is retried on its own
+    with generate_v11_joke, so the output always has one result per input.
+    """
+    try:
+        raw_results = classify_joke_types_batch(reference_jokes, new_topic, use_cache=use_cache)
+    except Exception as e:
+        print(f"   ⚠️  Batched generation failed ({e}); falling back to single calls")
+        raw_results = [None] * len(reference_jokes)
+
+    results = []
+    for reference_joke, raw in zip(reference_jokes, raw_results):
+        validated = validate_result(raw) if raw is not None else None
+        if validated is None or not validated.get("success"):
+            validated = generate_v11_joke(reference_joke, new_topic, use_cache=use_cache)
+        results.append(validated)
+
+    return results
+
+
 def regenerate_joke(
     reference_joke: str,
     new_topic: str,
@@ -117,3 +177,154 @@ OUTPUT JSON:
             "success": False,
             "error": str(e)
         }
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _joke_tokens(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall((text or "").casefold()))
+
+
+def is_distinct(draft: str, others: List[str], threshold: float = VARIANT_SIMILARITY) -> bool:
+    """True unless draft shares >= threshold of its word set with any of others."""
+    tokens = _joke_tokens(draft)
+    if not tokens:
+        return False
+    for other in others:
+        other_tokens = _joke_tokens(other)
+        union = tokens | other_tokens
+        if union and len(tokens & other_tokens) / len(union) >= threshold:
+            return False
+    return True
+
+
+class VariantStats:
+    """Counters for variant generation (one call, or the process total)."""
+
+    def __init__(self):
+        self.calls = 0
+        self.launched = 0
+        self.completed = 0
+        self.accepted = 0
+        self.invalid = 0
+        self.duplicates = 0
+        self.cancelled = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, other: "VariantStats"):
+        with self._lock:
+            for name in ("calls", "launched", "completed", "accepted",
+                         "invalid", "duplicates", "cancelled", "seconds"):
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "launched": self.launched,
+                "completed": self.completed,
+                "accepted": self.accepted,
+                "invalid": self.invalid,
+                "duplicates": self.duplicates,
+                "cancelled": self.cancelled,
+                "acceptance_rate": self.accepted / self.completed if self.completed else 0.0,
+                "variants_per_second": self.accepted / self.seconds if self.seconds else 0.0,
+                "requests_per_variant": self.launched / self.accepted if self.accepted else 0.0,
+            }
+
+
+_variant_totals = VariantStats()
+
+
+def variant_stats() -> Dict:
+    """Process-wide variant generation counters."""
+    return _variant_totals.as_dict()
+
+
+def generate_variants(
+    reference_joke: str,
+    new_topic: str,
+    engine_type: str,
+    previous_draft: str,
+    n: int = None,
+    k: int = None,
+    max_workers: int = None,
+    timeout: float = None
+) -> Dict:
+    """
+    Up to n regenerate_joke drafts for one bridge, returning as soon as k
+    valid, mutually distinct ones (also distinct from previous_draft) exist.
+
+    Only max_workers calls (default k) are in flight at once, and a new one
+    is started only when a finished one was rejected, so the cost is about k
+    requests, n at worst. Raise max_workers towards n to trade spend for
+    latency. Calls still running at the stop are abandoned. Each new call is
+    told the drafts accepted so far, so it steers away from them.
+    """
+    n = max(1, n or VARIANT_ATTEMPTS)
+    k = max(1, min(k or VARIANT_TARGET, n))
+    max_workers = max(1, min(max_workers or k, n))
+
+    stats = VariantStats()
+    stats.calls = 1
+    variants: List[Dict] = []
+    started = time.monotonic()
+
+    def _avoid() -> str:
+        return "\n".join([previous_draft] + [v["draft_joke"] for v in variants])
+
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+
+    def _launch():
+        stats.launched += 1
+        pending.add(pool.submit(regenerate_joke, reference_joke, new_topic, engine_type, _avoid()))
+
+    try:
+        for _ in range(max_workers):
+            _launch()
+
+        while pending and len(variants) < k:
+            wait_for = None
+            if timeout is not None:
+                wait_for = timeout - (time.monotonic() - started)
+                if wait_for <= 0:
+                    break
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                if len(variants) >= k:
+                    stats.cancelled += 1  # finished alongside the k-th, not needed
+                    continue
+                stats.completed += 1
+                error = future.exception()
+                result = None if error else future.result()
+                draft = (result or {}).get("draft_joke") if isinstance(result, dict) else None
+
+                if not (result and result.get("success") and isinstance(draft, str) and draft.strip()):
+                    stats.invalid += 1
+                elif not is_distinct(draft, [previous_draft] + [v["draft_joke"] for v in variants]):
+                    stats.duplicates += 1
+                else:
+                    variants.append(result)
+                    print(f"   🎲 Variant {len(variants)}/{k}: {draft[:60]}")
+
+            while (len(pending) < max_workers and len(variants) + len(pending) < k
+                   and stats.launched < n):
+                _launch()
+    finally:
+        stats.cancelled += len(pending)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    stats.accepted = len(variants)
+    stats.seconds = time.monotonic() - started
+    _variant_totals.add(stats)
+
+    return {
+        "success": bool(variants),
+        "variants": variants,
+        "complete": len(variants) >= k,
+        "stats": stats.as_dict(),
+    }
@@ -5,17 +5,16 @@ Refactored for Unified Content Engine — reads API key from .env
 
 import os
 import json
-import re
-from google import genai
-from google.genai import types
+import hashlib
+import threading
+from typing import Callable, List, Optional, Sequence
 
-
-# Initialize the Gemini client from environment
-API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in environment. Check your .env file.")
-
-client = genai.Client(api_key=API_KEY)
+from .clients import get_gemini_client
+from .context_cache import get_context_cache, is_cache_miss
+from .generation_cache import generation_key, get_generation_cache
+from .hedging import HedgeCancelled, hedged_call
+from .rate_limiter import estimate_tokens, governed_call
+from .stream_json import IncrementalJSONParser
 
 
 # Model configuration
@@ -25,6 +24,12 @@ MODELS = {
     "generation": "gemini-3-flash-preview",
 }
 
+# Stream JSON responses and parse them as they arrive
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "1") == "1"
+
+# Model for hedge requests (hedging.py); empty = same model as the stage
+GEMINI_HEDGE_MODEL = os.getenv("GEMINI_HEDGE_MODEL", "")
+
 
 def call_gemini(
     prompt: str,
@@ -32,78 +37,201 @@ def call_gemini(
     model_stage: str = "classification",
     temperature: float = 0.3,
     max_tokens: int = 8192,
-    json_output: bool = True
-) -> dict | str:
+    json_output: bool = True,
+    response_schema: dict = None,
+    stream: bool = None,
+    required_keys: Sequence[str] = None,
+    on_field: Callable[[str, object], None] = None,
+    route: str = None
+) -> dict | list | str:
     """
     Call Gemini API with the appropriate model for the stage.
+    Throttles and transient errors are retried by the request governor.
+    Long system instructions are served from the Gemini context cache
+    (context_cache.py) when it is enabled. A call that runs past its route's
+    p95 latency is hedged (hedging.py) with a second request to the same
+    model or GEMINI_HEDGE_MODEL. Latency is tracked per request shape:
+    the system instruction and max_tokens by default, or the given route.
+
+    JSON responses are parsed incrementally (stream_json.py): on_field(key,
+    value) fires as each top-level field closes. With stream=True (default
+    GEMINI_STREAMING) the response is streamed and reading stops as soon as
+    every key in required_keys has arrived. A truncated object comes back
+    as its completed fields plus "truncated": True.
     """
     model = MODELS.get(model_stage, MODELS["classification"])
+    hedge_model = GEMINI_HEDGE_MODEL or model
+    stream = (GEMINI_STREAMING if stream is None else stream) and json_output
+    # Single, slim and batch calls share a stage but not a latency profile
+    shape = route or f"{_instruction_tag(system_instruction)}:{max_tokens}"
+
+    # With a hedge in flight, only the first request to stream a field
+    # reports live; if the other request wins, its fields are re-sent once
+    # the call returns, so the caller's last value per key is the result's.
+    owner = []
+    closed = []
+    owner_lock = threading.Lock()
+    outcomes = {}
+
+    def on_field_for(attempt_id):
+        if on_field is None:
+            return None
+
+        def _on_field(key, value):
+            with owner_lock:
+                if closed:
+                    return
+                if not owner:
+                    owner.append(attempt_id)
+                if owner[0] != attempt_id:
+                    return
+            on_field(key, value)
+        return _on_field
+
+    def _attempt(attempt_model, attempt_id):
+        def _call(cancel):
+            result = _call_model(
+                attempt_model, prompt, system_instruction, temperature, max_tokens,
+                json_output, response_schema, stream, required_keys,
+                on_field_for(attempt_id), cancel
+            )
+            outcomes[attempt_id] = result
+            return result
+        return _call
+
+    def _is_valid(result):
+        if not json_output:
+            return bool(result)
+        return not (isinstance(result, dict) and ("error" in result or result.get("truncated")))
+
+    try:
+        result = hedged_call(
+            f"gemini:{model}:{model_stage}:{shape}",
+            _attempt(model, "primary"),
+            hedge_fn=_attempt(hedge_model, "hedge"),
+            hedge_route=f"gemini:{hedge_model}:{model_stage}:{shape}",
+            is_valid=_is_valid,
+        )
+    finally:
+        with owner_lock:
+            closed.append(True)
+
+    winner = next((a for a, r in outcomes.items() if r is result), None)
+    if on_field is not None and owner and winner != owner[0] and isinstance(result, dict):
+        for key, value in result.items():
+            if key != "truncated":
+                on_field(key, value)
+    return result
+
+
+def _instruction_tag(system_instruction: Optional[str]) -> str:
+    if not system_instruction:
+        return "plain"
+    return hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()[:8]
+
+
+def _call_model(model, prompt, system_instruction, temperature, max_tokens,
+                json_output, response_schema, stream, required_keys, on_field,
+                cancel: threading.Event):
+    """One Gemini request (governed, context-cached, parsed) for call_gemini."""
+    from google.genai import types
 
     config = types.GenerateContentConfig(
         temperature=temperature,
         max_output_tokens=max_tokens,
     )
 
-    if system_instruction:
-        config.system_instruction = system_instruction
+    context_cache = get_context_cache() if system_instruction else None
+    if context_cache is not None:
+        cache_name = context_cache.configure(config, model, system_instruction)
+    else:
+        cache_name = None
+        if system_instruction:
+            config.system_instruction = system_instruction
 
     if json_output:
         config.response_mime_type = "application/json"
+        if response_schema:
+            config.response_schema = response_schema
 
-    response = client.models.generate_content(
-        model=model,
-        contents=prompt,
-        config=config
-    )
+    client = get_gemini_client()
 
-    result_text = response.text
+    def _request():
+        parser = IncrementalJSONParser(on_field) if json_output else None
+        if not stream:
+            response = client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=config
+            )
+            if parser is not None:
+                parser.feed(response.text or "")
+            return response.text or "", response, parser
 
-    if json_output:
+        last = None
+        chunks = client.models.generate_content_stream(
+            model=model,
+            contents=prompt,
+            config=config
+        )
         try:
-            return json.loads(result_text)
-        except json.JSONDecodeError as e:
-            # Try to find complete JSON
-            json_match = re.search(r'\{[\s\S]*\}', result_text)
-            if json_match:
-                try:
-                    return json.loads(json_match.group())
-                except json.JSONDecodeError:
-                    pass
-
-            # Extract partial result from truncated response
-            engine_match = re.search(r'"engine_selected":\s*"([^"]+)"', result_text)
-            reasoning_match = re.search(r'"reasoning":\s*"([^"]*)"', result_text)
-            joke_match = re.search(r'"draft_joke":\s*"([^"]*)"', result_text)
-            strategy_match = re.search(r'"selected_strategy":\s*"([^"]*)"', result_text)
-
-            if engine_match:
-                return {
-                    "engine_selected": engine_match.group(1),
-                    "reasoning": reasoning_match.group(1) if reasoning_match else "Response was truncated",
-                    "brainstorming": ["Response was truncated"],
-                    "selected_strategy": strategy_match.group(1) if strategy_match else "N/A",
-                    "draft_joke": joke_match.group(1) if joke_match else "Unable to extract joke from truncated response"
-                }
-
-            return {"error": f"Failed to parse JSON: {str(e)}", "raw": result_text[:500]}
-
-    return result_text
-
-
-def classify_joke_type(reference_joke: str, new_topic: str) -> dict:
-    """
-    V11 Enhanced: Classify joke, brainstorm 3 angles, select best, draft joke.
-    """
-    system_instruction = """You are a Comedy Architect. You reverse-engineer the logic of a reference joke and transplant it into a new topic.
+            for chunk in chunks:
+                if cancel.is_set():
+                    raise HedgeCancelled()
+                last = chunk
+                parser.feed(chunk.text or "")
+                if parser.done or (required_keys and parser.has(required_keys)):
+                    break
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        return parser.text, last, parser
 
-YOUR PROCESS:
-1. Analyze the 'Reference Joke' to find the Engine (A, B, or C).
-2. BRAINSTORM 3 distinct mapping angles for the New Topic.
-3. Select the funniest angle.
-4. Draft the final joke.
+    def _generate():
+        return governed_call(
+            "gemini",
+            _request,
+            est_tokens=estimate_tokens(prompt, system_instruction, max_output=max_tokens),
+            cancel=cancel,
+        )
 
----
-THE ENGINES:
+    try:
+        result_text, response, parser = _generate()
+    except Exception as e:
+        if cache_name is None or not is_cache_miss(e):
+            raise
+        # The cached instruction expired or was deleted early; resend inline
+        print(f"   ⚠️  Gemini context cache {cache_name} is gone; retrying inline")
+        context_cache.invalidate(model, system_instruction)
+        cache_name = None
+        config.cached_content = None
+        config.system_instruction = system_instruction
+        result_text, response, parser = _generate()
+
+    if cache_name is not None and response is not None:
+        context_cache.record_usage(response)
+
+    if not json_output:
+        return result_text
+
+    if parser.done:
+        try:
+            return parser.value()
+        except json.JSONDecodeError:
+            pass
+
+    if parser.kind == "object" and required_keys and parser.has(required_keys):
+        return dict(parser.fields)
+
+    # Truncated or malformed: report the fields that did complete
+    if parser.kind == "object" and parser.fields:
+        return {**parser.fields, "truncated": True}
+
+    return {"error": "Failed to parse JSON response", "raw": result_text[:500]}
+
+
+ENGINE_RULES = """THE ENGINES:
 
 TYPE A: The "Word Trap" (Semantic/Pun)
 - Logic: A trigger word bridges two unrelated contexts.
@@ -124,7 +252,18 @@ TYPE C: The "Hyperbole Engine" (Roast/Exaggeration)
   2. Constraint: Conservation of Failure. If Ref fails due to "Lack of Substance," New Joke must also fail due to "Lack of Substance."
   3. Format: Statement ("He is so X..."), NOT a scene.
 
+"""
+
+COMEDY_ARCHITECT_INSTRUCTION = """You are a Comedy Architect. You reverse-engineer the logic of a reference joke and transplant it into a new topic.
+
+YOUR PROCESS:
+1. Analyze the 'Reference Joke' to find the Engine (A, B, or C).
+2. BRAINSTORM 3 distinct mapping angles for the New Topic.
+3. Select the funniest angle.
+4. Draft the final joke.
+
 ---
+""" + ENGINE_RULES + """---
 OUTPUT FORMAT (JSON ONLY):
 {
   "engine_selected": "Type A/B/C",
@@ -138,6 +277,33 @@ OUTPUT FORMAT (JSON ONLY):
   "draft_joke": "The final joke text. Max 40 words. NO FILLER (e.g. 'The health crisis is dire'). Start directly with the setup."
 }"""
 
+
+def _is_cacheable(result) -> bool:
+    """
+    Only complete drafts go into the generation cache: no error, not
+    truncated or salvaged, every output field present and a non-empty
+    draft_joke. Anything else would be served again for the whole TTL.
+    """
+    if not isinstance(result, dict) or "error" in result or result.get("truncated"):
+        return False
+    if any(key not in result for key in _JOKE_FIELDS):
+        return False
+    draft = result.get("draft_joke")
+    return isinstance(draft, str) and bool(draft.strip())
+
+
+def classify_joke_type(reference_joke: str, new_topic: str, use_cache: bool = True,
+                       on_field: Callable[[str, object], None] = None) -> dict:
+    """
+    V11 Enhanced: Classify joke, brainstorm 3 angles, select best, draft joke.
+    Successful results are cached per (reference joke, topic, prompt, model,
+    temperature); pass use_cache=False to skip the lookup and force a fresh
+    draft (which then replaces the cached one). on_field(key, value) sees
+    each output field as soon as it is streamed.
+    """
+    temperature = 0.5
+    model = MODELS["classification"]
+
     prompt = f"""REFERENCE JOKE:
 "{reference_joke}"
 
@@ -146,10 +312,256 @@ NEW TOPIC:
 
 Analyze the reference joke, brainstorm 3 mapping angles, select the funniest, and draft the final joke."""
 
+    cache = get_generation_cache()
+    key = generation_key(reference_joke, new_topic, COMEDY_ARCHITECT_INSTRUCTION, model, temperature)
+
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    result = call_gemini(
+        prompt=prompt,
+        system_instruction=COMEDY_ARCHITECT_INSTRUCTION,
+        model_stage="classification",
+        temperature=temperature,
+        json_output=True,
+        required_keys=tuple(_JOKE_FIELDS),
+        on_field=on_field
+    )
+
+    if _is_cacheable(result):
+        cache.put(key, result)
+
+    return result
+
+
+BATCH_INSTRUCTION = COMEDY_ARCHITECT_INSTRUCTION + """
+
+---
+BATCH MODE:
+You will receive several numbered reference jokes for the same New Topic.
+Run the full process above for EACH reference joke independently.
+Return a JSON ARRAY with exactly one object per reference joke. Each object has
+the OUTPUT FORMAT fields above plus "reference_index": the number of the
+reference joke it was built from."""
+
+_JOKE_FIELDS = {
+    "engine_selected": {"type": "STRING"},
+    "reasoning": {"type": "STRING"},
+    "brainstorming": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "selected_strategy": {"type": "STRING"},
+    "draft_joke": {"type": "STRING"},
+}
+
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"reference_index": {"type": "INTEGER"}, **_JOKE_FIELDS},
+        "required": ["reference_index", *_JOKE_FIELDS],
+    },
+}
+
+
+def classify_joke_types_batch(reference_jokes: List[str], new_topic: str,
+                              use_cache: bool = True) -> List[Optional[dict]]:
+    """
+    Batched Comedy Architect: one request for K reference jokes on one topic.
+    Returns one result per reference joke, in order; None where the model's
+    array had no usable element for that joke (callers fall back per item).
+    """
+    temperature = 0.5
+    model = MODELS["classification"]
+    cache = get_generation_cache()
+
+    keys = [
+        generation_key(ref, new_topic, BATCH_INSTRUCTION, model, temperature)
+        for ref in reference_jokes
+    ]
+    results = [cache.get(key) if use_cache else None for key in keys]
+    pending = [i for i, r in enumerate(results) if r is None]
+    if not pending:
+        return results
+
+    numbered = "\n\n".join(
+        f'[{n}] "{reference_jokes[i]}"' for n, i in enumerate(pending, start=1)
+    )
+    prompt = f"""REFERENCE JOKES:
+{numbered}
+
+NEW TOPIC:
+"{new_topic}"
+
+For EACH reference joke: analyze it, brainstorm 3 mapping angles, select the funniest, and draft the final joke."""
+
+    response = call_gemini(
+        prompt=prompt,
+        system_instruction=BATCH_INSTRUCTION,
+        model_stage="classification",
+        temperature=temperature,
+        max_tokens=min(8192, 1024 * len(pending) + 1024),
+        json_output=True,
+        response_schema=BATCH_RESPONSE_SCHEMA
+    )
+
+    if not isinstance(response, list):
+        return results
+
+    for item in response:
+        if not isinstance(item, dict):
+            continue
+        n = item.pop("reference_index", None)
+        if not isinstance(n, int) or not 1 <= n <= len(pending):
+            continue
+        i = pending[n - 1]
+        if results[i] is None and "draft_joke" in item:
+            results[i] = item
+            # Invalid elements are retried by the caller; don't cache them
+            if _is_cacheable(item):
+                cache.put(keys[i], item)
+
+    return results
+
+
+ANALYSIS_INSTRUCTION = """You are a Comedy Architect. You reverse-engineer the logic of a reference joke so it can later be transplanted into new topics.
+
+YOUR PROCESS:
+1. Analyze the 'Reference Joke' to find the Engine (A, B, or C).
+2. Extract the mechanism that makes it funny.
+
+---
+""" + ENGINE_RULES + """---
+OUTPUT FORMAT (JSON ONLY):
+{
+  "engine_selected": "Type A/B/C",
+  "reasoning": "Explain why this engine fits.",
+  "mechanism": "One sentence: how the joke produces its laugh.",
+  "key_element": "Type A: the trigger word and its two meanings. Type B: the abstract behavior. Type C: the exaggerated scale.",
+  "constraint": "What any transplant must preserve (e.g. the failure mode)."
+}"""
+
+_ANALYSIS_FIELDS = {
+    "engine_selected": {"type": "STRING"},
+    "reasoning": {"type": "STRING"},
+    "mechanism": {"type": "STRING"},
+    "key_element": {"type": "STRING"},
+    "constraint": {"type": "STRING"},
+}
+
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": _ANALYSIS_FIELDS,
+    "required": list(_ANALYSIS_FIELDS),
+}
+
+
+def analyze_reference_joke(reference_joke: str) -> dict:
+    """
+    Offline pass: classify a reference joke's engine and extract its
+    mechanism once, so per-topic generation does not have to.
+    """
+    prompt = f"""REFERENCE JOKE:
+"{reference_joke}"
+
+Analyze the reference joke: select its engine and extract its mechanism."""
+
     return call_gemini(
         prompt=prompt,
-        system_instruction=system_instruction,
+        system_instruction=ANALYSIS_INSTRUCTION,
+        model_stage="extraction",
+        temperature=0.2,
+        max_tokens=1024,
+        json_output=True,
+        response_schema=ANALYSIS_SCHEMA,
+        required_keys=tuple(_ANALYSIS_FIELDS)
+    )
+
+
+SLIM_INSTRUCTION = """You are a Comedy Architect. You transplant the logic of an already-analyzed reference joke into a new topic.
+
+YOUR PROCESS:
+1. Read the given Engine and mechanism of the 'Reference Joke' (do NOT re-analyze it).
+2. BRAINSTORM 3 distinct mapping angles for the New Topic, following that Engine's mapping rules.
+3. Select the funniest angle.
+4. Draft the final joke.
+
+---
+""" + ENGINE_RULES + """---
+OUTPUT FORMAT (JSON ONLY):
+{
+  "brainstorming": [
+    "Option 1: [Trait/Angle] -> [Scenario]",
+    "Option 2: [Trait/Angle] -> [Scenario]",
+    "Option 3: [Trait/Angle] -> [Scenario]"
+  ],
+  "selected_strategy": "The best option from above",
+  "draft_joke": "The final joke text. Max 40 words. NO FILLER (e.g. 'The health crisis is dire'). Start directly with the setup."
+}"""
+
+_DRAFT_FIELDS = {k: _JOKE_FIELDS[k] for k in ("brainstorming", "selected_strategy", "draft_joke")}
+
+SLIM_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": _DRAFT_FIELDS,
+    "required": list(_DRAFT_FIELDS),
+}
+
+
+def draft_from_analysis(reference_joke: str, analysis: dict, new_topic: str,
+                        use_cache: bool = True,
+                        on_field: Callable[[str, object], None] = None) -> dict:
+    """
+    Slim Comedy Architect: the engine and mechanism come from the offline
+    analysis, so the model only brainstorms and drafts. Returns the same
+    shape as classify_joke_type (engine/reasoning filled from the analysis).
+    """
+    temperature = 0.5
+    model = MODELS["classification"]
+
+    prompt = f"""REFERENCE JOKE:
+"{reference_joke}"
+
+ANALYSIS:
+- Engine: {analysis.get("engine_selected")}
+- Mechanism: {analysis.get("mechanism")}
+- Key element: {analysis.get("key_element")}
+- Constraint: {analysis.get("constraint")}
+
+NEW TOPIC:
+"{new_topic}"
+
+Brainstorm 3 mapping angles, select the funniest, and draft the final joke."""
+
+    cache = get_generation_cache()
+    key = generation_key(
+        reference_joke, new_topic,
+        SLIM_INSTRUCTION + json.dumps(analysis, sort_keys=True), model, temperature
+    )
+
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    result = call_gemini(
+        prompt=prompt,
+        system_instruction=SLIM_INSTRUCTION,
         model_stage="classification",
-        temperature=0.5,
-        json_output=True
+        temperature=temperature,
+        json_output=True,
+        response_schema=SLIM_RESPONSE_SCHEMA,
+        required_keys=tuple(_DRAFT_FIELDS),
+        on_field=on_field
     )
+
+    if isinstance(result, dict) and "error" not in result and "draft_joke" in result:
+        result = {
+            "engine_selected": analysis.get("engine_selected"),
+            "reasoning": analysis.get("reasoning"),
+            **result,
+        }
+        if _is_cacheable(result):
+            cache.put(key, result)
+
+    return result
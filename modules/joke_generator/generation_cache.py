@@ -0,0 +1,121 @@
+"""
+V11 Generation Cache
+Persistent cache of Comedy Architect results.
+
+Keyed by (reference joke hash, normalised topic, system-prompt hash, model,
+temperature), so editing the prompt or switching models naturally misses.
+Entries expire after a TTL and the store is bounded by entry count.
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Optional
+
+from .local_store import open_sqlite
+
+
+GENERATION_CACHE_FILE = "generations.sqlite3"
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "20000"))
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_topic(topic: str) -> str:
+    """Casefold and collapse whitespace so trivial retypes still hit."""
+    return " ".join(topic.casefold().split())
+
+
+def generation_key(reference_joke: str, topic: str, system_instruction: str,
+                   model: str, temperature: float) -> str:
+    """Cache key for one reference joke → topic generation."""
+    parts = [
+        _sha(reference_joke.strip()),
+        normalize_topic(topic),
+        _sha(system_instruction or ""),
+        model,
+        f"{temperature:.3f}",
+    ]
+    return _sha("\0".join(parts))
+
+
+class GenerationCache:
+    """SQLite store of JSON results with TTL and max-size eviction."""
+
+    def __init__(self, filename: str = GENERATION_CACHE_FILE,
+                 ttl: float = GENERATION_CACHE_TTL,
+                 max_entries: int = GENERATION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._db = open_sqlite(filename)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_generations_created ON generations(created_at)")
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a fresh copy of the cached result, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, created_at FROM generations WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or time.time() - row[1] > self.ttl:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, result: dict):
+        """Store a result, evicting expired and then oldest entries."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO generations (key, result, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(result), now)
+            )
+            self._db.execute("DELETE FROM generations WHERE created_at < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM generations WHERE key IN (SELECT key FROM generations "
+                "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache: Optional[GenerationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_generation_cache() -> GenerationCache:
+    """Process-wide generation cache, opened on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GenerationCache()
+        return _cache
@@ -0,0 +1,201 @@
+"""
+V12 Hedged Requests
+Latency-aware hedging for LLM calls (call_gemini, openai_client).
+
+Every call's latency is recorded per route (provider:model:request shape).
+Once a route has enough samples, a call that is still running after the
+route's p95 gets a hedge: a second request to the same model (or an
+alternate one, GEMINI_HEDGE_MODEL / OPENAI_HEDGE_MODEL). The first valid response wins and
+the other request is cancelled: governed_call makes no further retries for
+it, a streaming call stops reading, and a blocking request already in
+flight is abandoned. Hedges are capped at HEDGE_BUDGET extra requests per
+call, so the extra spend stays bounded even when a provider slows down.
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.05"))
+LATENCY_WINDOW = 500
+
+
+class HedgeCancelled(Exception):
+    """Raised inside the losing request when it notices it was cancelled."""
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies per route."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(route)
+            if samples is None:
+                samples = self._samples[route] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, route: str, q: float,
+                   min_samples: int = HEDGE_MIN_SAMPLES) -> Optional[float]:
+        """q-quantile of the route's latencies, or None while there are too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(route, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            routes = {route: sorted(samples) for route, samples in self._samples.items()}
+        return {
+            route: {
+                "samples": len(s),
+                "p50": s[len(s) // 2],
+                "p95": s[min(len(s) - 1, int(0.95 * len(s)))],
+                "p99": s[min(len(s) - 1, int(0.99 * len(s)))],
+            }
+            for route, s in routes.items() if s
+        }
+
+
+class HedgeBudget:
+    """Allows at most `ratio` hedges per call, counted over the process lifetime."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET):
+        self.ratio = ratio
+        self.calls = 0
+        self.hedges = 0
+        self.wins = 0
+        self.denied = 0
+        self._lock = threading.Lock()
+
+    def count_call(self):
+        with self._lock:
+            self.calls += 1
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.ratio * self.calls:
+                self.denied += 1
+                return False
+            self.hedges += 1
+            return True
+
+    def count_win(self):
+        with self._lock:
+            self.wins += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"calls": self.calls, "hedges": self.hedges,
+                    "hedge_wins": self.wins, "denied": self.denied}
+
+
+_tracker = LatencyTracker()
+_budget = HedgeBudget()
+
+
+def get_latency_tracker() -> LatencyTracker:
+    return _tracker
+
+
+def get_hedge_budget() -> HedgeBudget:
+    return _budget
+
+
+def hedging_stats() -> Dict:
+    """Per-route latency percentiles plus hedge counters."""
+    return {"routes": _tracker.stats(), **_budget.stats()}
+
+
+def _start(fn: Callable[[threading.Event], Any], cancel: threading.Event) -> Future:
+    """Run fn(cancel) on a daemon thread; the Future carries its result."""
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def _run():
+        try:
+            future.set_result(fn(cancel))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_run, daemon=True).start()
+    return future
+
+
+def hedged_call(
+    route: str,
+    fn: Callable[[threading.Event], Any],
+    hedge_fn: Callable[[threading.Event], Any] = None,
+    hedge_route: str = None,
+    is_valid: Callable[[Any], bool] = None,
+    tracker: LatencyTracker = None,
+    budget: HedgeBudget = None,
+) -> Any:
+    """
+    Run fn(cancel) and, if it outlives the route's p95, race it against
+    hedge_fn(cancel) (default: fn again). Returns the first result that
+    passes is_valid; if neither does, the primary's outcome (result or
+    exception) is returned/raised. fn should check cancel.is_set() where it
+    can and raise HedgeCancelled.
+    """
+    tracker = tracker or _tracker
+    budget = budget or _budget
+    hedge_fn = hedge_fn or fn
+    hedge_route = hedge_route or route
+    is_valid = is_valid or (lambda result: result is not None)
+
+    budget.count_call()
+    threshold = tracker.percentile(route, HEDGE_PERCENTILE) if HEDGING_ENABLED else None
+
+    started = time.monotonic()
+    if threshold is None:
+        # Not enough history yet: plain call on this thread
+        result = fn(threading.Event())
+        tracker.record(route, time.monotonic() - started)
+        return result
+
+    attempts = {}  # future -> (route, started, cancel event)
+    cancel = threading.Event()
+    primary = _start(fn, cancel)
+    attempts[primary] = (route, started, cancel)
+
+    done, _ = wait([primary], timeout=threshold)
+    if not done and budget.try_spend():
+        print(f"   ⚡ {route} slower than p95 ({threshold:.1f}s); hedging on {hedge_route}")
+        cancel = threading.Event()
+        attempts[_start(hedge_fn, cancel)] = (hedge_route, time.monotonic(), cancel)
+
+    pending = set(attempts)
+    winner = None
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            attempt_route, attempt_started, _ = attempts[future]
+            if future.exception() is None:
+                tracker.record(attempt_route, time.monotonic() - attempt_started)
+                if winner is None and is_valid(future.result()):
+                    winner = future
+
+    for future in pending:
+        attempt_route, attempt_started, attempt_cancel = attempts[future]
+        attempt_cancel.set()
+        # The loser took at least this long; keep the tail in the window
+        tracker.record(attempt_route, time.monotonic() - attempt_started)
+
+    if winner is None:
+        return primary.result()
+    if winner is not primary:
+        budget.count_win()
+    return winner.result()
@@ -0,0 +1,256 @@
+"""
+V12 Reference Joke Analysis
+Offline, precomputed engine classification + mechanism for every reference
+joke in comic_segments.
+
+The analysis of a reference joke does not depend on the topic, so it is done
+once per joke and stored in cache/joke_analysis.sqlite3 (keyed by the joke
+text and the analysis prompt). generate_v11_joke then sends the slim prompt
+(draft_from_analysis), which skips re-classifying the joke and asks only for
+brainstorm + draft.
+
+Run:
+    python -m modules.joke_generator.joke_analysis run [--limit N] [--workers 8]
+    python -m modules.joke_generator.joke_analysis benchmark --topic "..." [--n 10]
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from .local_store import open_sqlite
+
+
+ANALYSIS_FILE = "joke_analysis.sqlite3"
+ANALYSIS_KEYS = ("engine_selected", "reasoning", "mechanism", "key_element", "constraint")
+
+
+def analysis_key(reference_joke: str) -> str:
+    """Key on the whitespace-normalised joke text and the analysis prompt."""
+    from .gemini_client import ANALYSIS_INSTRUCTION
+
+    text = " ".join((reference_joke or "").split())
+    prompt_hash = hashlib.sha256(ANALYSIS_INSTRUCTION.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{prompt_hash}\0{text}".encode("utf-8")).hexdigest()
+
+
+class AnalysisStore:
+    """SQLite store of reference-joke analyses."""
+
+    def __init__(self, filename: str = ANALYSIS_FILE):
+        self._lock = threading.Lock()
+        self._db = open_sqlite(filename)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS analyses (
+                key TEXT PRIMARY KEY,
+                joke_id INTEGER,
+                analysis TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_analyses_joke ON analyses(joke_id)")
+        self._db.commit()
+
+    def get(self, reference_joke: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT analysis FROM analyses WHERE key = ?", (analysis_key(reference_joke),)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, reference_joke: str, analysis: dict, joke_id: int = None):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analyses (key, joke_id, analysis, created_at) VALUES (?, ?, ?, ?)",
+                (analysis_key(reference_joke), joke_id, json.dumps(analysis), time.time())
+            )
+            self._db.commit()
+
+    def __contains__(self, reference_joke: str) -> bool:
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM analyses WHERE key = ?", (analysis_key(reference_joke),)
+            ).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+
+
+_store: Optional[AnalysisStore] = None
+_store_lock = threading.Lock()
+
+
+def get_analysis_store() -> AnalysisStore:
+    """Process-wide analysis store, opened on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AnalysisStore()
+        return _store
+
+
+def is_valid_analysis(result) -> bool:
+    return isinstance(result, dict) and "error" not in result and \
+        all(result.get(k) for k in ANALYSIS_KEYS)
+
+
+# ─── Offline pass ────────────────────────────────────────────────────────────
+
+def iter_reference_jokes(page_size: int = 1000) -> Iterator[Dict]:
+    """Reference jokes from the local replica if synced, else from Supabase."""
+    from .replica import get_replica
+
+    replica = get_replica()
+    if len(replica):
+        for page in replica.iter_pages(page_size=page_size, only_missing=False):
+            yield from page
+        return
+
+    from .db_manager import iter_joke_pages
+
+    for page in iter_joke_pages("id, searchable_text", page_size=page_size):
+        yield from page
+
+
+def analyze_jokes(jokes: List[Dict], max_workers: int = 8, refresh: bool = False) -> Dict[str, int]:
+    """
+    Analyse jokes ({id, searchable_text}) that have no stored analysis yet
+    (all of them with refresh=True).
+    """
+    from .gemini_client import analyze_reference_joke
+    from .parallel import run_concurrently
+
+    store = get_analysis_store()
+    todo = [j for j in jokes if j.get("searchable_text") and (refresh or j["searchable_text"] not in store)]
+    counts = {"skipped": len(jokes) - len(todo), "analyzed": 0, "failed": 0}
+
+    outcomes = run_concurrently(
+        lambda joke: analyze_reference_joke(joke["searchable_text"]), todo, max_workers=max_workers
+    )
+    for i, result, error in outcomes:
+        joke = todo[i]
+        if error is None and is_valid_analysis(result):
+            store.put(joke["searchable_text"], {k: result[k] for k in ANALYSIS_KEYS}, joke_id=joke["id"])
+            counts["analyzed"] += 1
+        else:
+            counts["failed"] += 1
+            print(f"   ❌ Analysis failed for {joke['id']}: {error or result}")
+
+    return counts
+
+
+def run_analysis(limit: int = None, max_workers: int = 8, refresh: bool = False,
+                 page_size: int = 200) -> Dict[str, int]:
+    """Analyse the whole reference corpus, one page at a time."""
+    print()
+    print("=" * 60)
+    print("🔬 REFERENCE JOKE ANALYSIS")
+    print("=" * 60)
+
+    totals = {"skipped": 0, "analyzed": 0, "failed": 0}
+    page = []
+
+    def _flush():
+        counts = analyze_jokes(page, max_workers=max_workers, refresh=refresh)
+        for k, v in counts.items():
+            totals[k] += v
+        print(f"   ✅ {totals['analyzed']} analysed, {totals['skipped']} already done, "
+              f"{totals['failed']} failed")
+        page.clear()
+
+    for n, joke in enumerate(iter_reference_jokes(), start=1):
+        page.append(joke)
+        if len(page) >= page_size:
+            _flush()
+        if limit is not None and n >= limit:
+            break
+    if page:
+        _flush()
+
+    return totals
+
+
+# ─── Benchmark ───────────────────────────────────────────────────────────────
+
+def benchmark(topic: str, n: int = 10) -> List[Dict]:
+    """
+    Generate for n analysed reference jokes with the full and the slim
+    prompt (uncached), and compare latency and output size.
+    """
+    from .gemini_client import classify_joke_type, draft_from_analysis
+    from .rate_limiter import estimate_tokens
+
+    store = get_analysis_store()
+    samples = []
+    for joke in iter_reference_jokes():
+        analysis = store.get(joke.get("searchable_text") or "")
+        if analysis:
+            samples.append((joke["searchable_text"], analysis))
+        if len(samples) >= n:
+            break
+    if not samples:
+        raise ValueError("No analysed jokes yet; run `joke_analysis run` first")
+
+    pipelines = {
+        "full": lambda ref, analysis: classify_joke_type(ref, topic, use_cache=False),
+        "slim": lambda ref, analysis: draft_from_analysis(ref, analysis, topic, use_cache=False),
+    }
+
+    report = []
+    for name, generate in pipelines.items():
+        latencies, sizes, ok = [], [], 0
+        for ref, analysis in samples:
+            started = time.perf_counter()
+            result = generate(ref, analysis)
+            latencies.append(time.perf_counter() - started)
+            sizes.append(estimate_tokens(json.dumps(result)))
+            ok += isinstance(result, dict) and "draft_joke" in result
+        latencies.sort()
+        report.append({
+            "pipeline": name,
+            "jokes": len(samples),
+            "success": ok,
+            "mean_s": sum(latencies) / len(latencies),
+            "p95_s": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+            "output_tokens": sum(sizes) / len(sizes),
+        })
+
+    print(f"\n📊 Full vs slim Comedy Architect prompt — {len(samples)} jokes, topic: {topic}")
+    print(f"   {'pipeline':>8}  {'ok':>4}  {'mean s':>7}  {'p95 s':>7}  {'~out tokens':>11}")
+    for row in report:
+        print(f"   {row['pipeline']:>8}  {row['success']:>4}  {row['mean_s']:>7.2f}  "
+              f"{row['p95_s']:>7.2f}  {row['output_tokens']:>11.0f}")
+    return report
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+
+    parser = argparse.ArgumentParser(description="Precompute or benchmark reference-joke analysis.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Analyse reference jokes that have no analysis yet")
+    run.add_argument("--limit", type=int, default=None)
+    run.add_argument("--workers", type=int, default=8)
+    run.add_argument("--refresh", action="store_true", help="Re-analyse every joke")
+
+    bench = sub.add_parser("benchmark", help="Compare the full and slim generation prompts")
+    bench.add_argument("--topic", required=True)
+    bench.add_argument("--n", type=int, default=10)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_analysis(limit=args.limit, max_workers=args.workers, refresh=args.refresh)
+    else:
+        benchmark(args.topic, n=args.n)
+
+
+if __name__ == "__main__":
+    main()
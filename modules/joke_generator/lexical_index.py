@@ -0,0 +1,268 @@
+"""
+V12 Lexical Bridge Index
+BM25 inverted index over searchable_text + bridge_content.
+
+Complements the vector index for specific headlines (names, places,
+products) that an abstract theme embedding blurs away. Postings are kept
+as NumPy arrays, so scoring a query is a handful of vectorised adds. The
+index is updated incrementally from the bridge snapshot (only new or
+changed jokes are re-tokenised) and persisted as a single .npz file next to
+the vector snapshot.
+"""
+
+import os
+import re
+import hashlib
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he her his i if in into is it its
+me my of on or our she so than that the their them then there they this to was
+we were what when which who will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords or single characters."""
+    return [
+        t for t in _TOKEN_RE.findall((text or "").casefold())
+        if len(t) > 1 and t not in _STOPWORDS
+    ]
+
+
+def _doc_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class LexicalIndex:
+    """Incrementally maintained BM25 index keyed by joke id."""
+
+    def __init__(self):
+        self.ids: List[int] = []            # doc slot → joke id
+        self.hashes: List[str] = []         # doc slot → content hash
+        self.doc_len: List[int] = []
+        self.live: List[bool] = []          # False once replaced or deleted
+        self.slot_of: Dict[int, int] = {}   # joke id → live doc slot
+        # term → (doc slots, term freqs); lists while being appended to,
+        # NumPy arrays once loaded or first searched
+        self.postings: Dict[str, tuple] = {}
+        self._doc_stats = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    # ─── Building ────────────────────────────────────────────────────────
+
+    def _add(self, joke_id: int, text: str, content_hash: str):
+        tokens = tokenize(text)
+        slot = len(self.ids)
+        self.ids.append(joke_id)
+        self.hashes.append(content_hash)
+        self.doc_len.append(len(tokens))
+        self.live.append(True)
+        self.slot_of[joke_id] = slot
+
+        for term, tf in Counter(tokens).items():
+            docs, tfs = self.postings.get(term, ([], []))
+            if isinstance(docs, np.ndarray):
+                docs, tfs = docs.tolist(), tfs.tolist()
+            docs.append(slot)
+            tfs.append(tf)
+            self.postings[term] = (docs, tfs)
+        self._doc_stats = None
+
+    def _remove(self, joke_id: int):
+        slot = self.slot_of.pop(joke_id, None)
+        if slot is not None:
+            self.live[slot] = False
+            self._doc_stats = None
+
+    def sync(self, documents: Iterable[Tuple[int, str]]) -> Dict[str, int]:
+        """
+        Bring the index in line with (joke_id, text) pairs: add new jokes,
+        re-index changed ones and drop ones that disappeared. Compacts
+        itself when more than a quarter of the slots are dead.
+        """
+        documents = list(documents)
+        added = changed = 0
+        with self._lock:
+            seen = set()
+            for joke_id, text in documents:
+                seen.add(joke_id)
+                content_hash = _doc_hash(text)
+                slot = self.slot_of.get(joke_id)
+                if slot is not None and self.hashes[slot] == content_hash:
+                    continue
+                if slot is not None:
+                    self._remove(joke_id)
+                    changed += 1
+                else:
+                    added += 1
+                self._add(joke_id, text, content_hash)
+
+            removed = [joke_id for joke_id in self.slot_of if joke_id not in seen]
+            for joke_id in removed:
+                self._remove(joke_id)
+
+            if self.ids and len(self.slot_of) < 0.75 * len(self.ids):
+                self._rebuild(documents)
+
+        return {"added": added, "changed": changed, "removed": len(removed)}
+
+    def _rebuild(self, documents: List[Tuple[int, str]]):
+        fresh = LexicalIndex()
+        for joke_id, text in documents:
+            fresh._add(joke_id, text, _doc_hash(text))
+        self.ids, self.hashes, self.doc_len = fresh.ids, fresh.hashes, fresh.doc_len
+        self.live, self.slot_of, self.postings = fresh.live, fresh.slot_of, fresh.postings
+        self._doc_stats = None
+
+    # ─── Search ──────────────────────────────────────────────────────────
+
+    def _posting_arrays(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        posting = self.postings.get(term)
+        if posting is None:
+            return None
+        if not isinstance(posting[0], np.ndarray):
+            posting = (np.asarray(posting[0], dtype=np.int64),
+                       np.asarray(posting[1], dtype=np.float32))
+            self.postings[term] = posting
+        return posting
+
+    def _stats(self):
+        """(live mask, live doc count, per-doc BM25 length norm), cached until the next edit."""
+        if self._doc_stats is None:
+            live = np.asarray(self.live, dtype=bool)
+            doc_len = np.asarray(self.doc_len, dtype=np.float32)
+            avg_len = float(doc_len[live].mean()) if live.any() else 1.0
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / (avg_len or 1.0))
+            self._doc_stats = (live, int(live.sum()), norm)
+        return self._doc_stats
+
+    def search(self, query: str, top_k: int = 30) -> List[Tuple[int, float]]:
+        """BM25 top-k as [(joke_id, score), ...], best first."""
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self.slot_of:
+                return []
+
+            live, n_docs, norm = self._stats()
+
+            scores = np.zeros(len(self.ids), dtype=np.float32)
+            for term in terms:
+                arrays = self._posting_arrays(term)
+                if arrays is None:
+                    continue
+                docs, tfs = arrays
+                df = int(live[docs].sum())
+                if df == 0:
+                    continue
+                idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+                scores[docs] += idf * tfs * (BM25_K1 + 1) / (tfs + norm[docs])
+
+            scores[~live] = 0
+            hits = np.flatnonzero(scores)
+            if hits.size == 0:
+                return []
+            if hits.size > top_k:
+                hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            return [(self.ids[slot], float(scores[slot])) for slot in hits]
+
+    # ─── Persistence ─────────────────────────────────────────────────────
+
+    def save(self, path: str):
+        """Write the index as one .npz (postings flattened with offsets)."""
+        with self._lock:
+            terms = list(self.postings)
+            arrays = [self._posting_arrays(t) for t in terms]
+            offsets = np.concatenate([[0], np.cumsum([len(a[0]) for a in arrays])]).astype(np.int64)
+            docs = np.concatenate([a[0] for a in arrays]) if arrays else np.zeros(0, np.int64)
+            tfs = np.concatenate([a[1] for a in arrays]) if arrays else np.zeros(0, np.float32)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp.npz"
+            np.savez(
+                tmp_path,
+                terms=np.asarray(terms, dtype=str),
+                offsets=offsets,
+                docs=docs,
+                tfs=tfs,
+                ids=np.asarray(self.ids, dtype=np.int64),
+                hashes=np.asarray(self.hashes, dtype=str),
+                doc_len=np.asarray(self.doc_len, dtype=np.int32),
+                live=np.asarray(self.live, dtype=bool),
+            )
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        index = cls()
+        with np.load(path, allow_pickle=False) as data:
+            offsets = data["offsets"]
+            docs = data["docs"].astype(np.int64)
+            tfs = data["tfs"].astype(np.float32)
+            for n, term in enumerate(data["terms"].tolist()):
+                a, b = offsets[n], offsets[n + 1]
+                index.postings[term] = (docs[a:b], tfs[a:b])
+            index.ids = data["ids"].tolist()
+            index.hashes = data["hashes"].tolist()
+            index.doc_len = data["doc_len"].tolist()
+            index.live = data["live"].tolist()
+        index.slot_of = {
+            joke_id: slot for slot, joke_id in enumerate(index.ids) if index.live[slot]
+        }
+        return index
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse several best-first id rankings: score = Σ 1 / (k + rank)."""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, joke_id in enumerate(ranking, start=1):
+            fused[joke_id] = fused.get(joke_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def update_lexical_index(documents: Iterable[Tuple[int, str]], path: str) -> Dict[str, int]:
+    """Incrementally sync the on-disk index with the given documents."""
+    try:
+        index = LexicalIndex.load(path)
+    except (OSError, KeyError, ValueError):
+        index = LexicalIndex()
+    counts = index.sync(documents)
+    index.save(path)
+    return counts
+
+
+_indexes: Dict[str, tuple] = {}
+_index_lock = threading.Lock()
+
+
+def get_lexical_index(path: str) -> Optional[LexicalIndex]:
+    """Process-wide lexical index, reloaded when the file changes."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    with _index_lock:
+        cached = _indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            try:
+                cached = (mtime, LexicalIndex.load(path))
+            except (OSError, KeyError, ValueError) as e:
+                print(f"   ⚠️  Could not load lexical index: {e}")
+                return None
+            _indexes[path] = cached
+        return cached[1]
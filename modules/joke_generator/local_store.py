@@ -0,0 +1,43 @@
+"""
+Local Store
+Shared on-disk locations for the Joke Generator's local caches and indexes.
+"""
+
+import os
+import json
+import sqlite3
+import threading
+
+# Project-level cache folder (next to temp/), overridable for shared volumes
+CACHE_DIR = os.getenv(
+    "CONTENT_ENGINE_CACHE_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "cache"),
+)
+
+
+def cache_path(*parts: str) -> str:
+    """Build a path inside the cache folder, creating parent directories."""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def open_sqlite(filename: str) -> sqlite3.Connection:
+    """
+    Open a SQLite database in the cache folder. WAL mode lets several worker
+    processes read while one writes; callers serialise their own writes.
+    """
+    conn = sqlite3.connect(cache_path(filename), check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+_append_lock = threading.Lock()
+
+
+def append_jsonl(filename: str, record: dict):
+    """Append one JSON record to a log file in the cache folder."""
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with _append_lock, open(cache_path(filename), "a", encoding="utf-8") as f:
+        f.write(line)
@@ -4,31 +4,52 @@ Refactored for Unified Content Engine — reads API key from .env
 """
 
 import os
-from openai import OpenAI
 
+from .clients import get_openai_client
+from .hedging import hedged_call
+from .rate_limiter import estimate_tokens, governed_call
 
-# Initialize from environment
-API_KEY = os.getenv("OPENAI_API_KEY")
-if not API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in environment. Check your .env file.")
 
-client = OpenAI(api_key=API_KEY)
+# Model for hedge requests (hedging.py); empty = same model as the call
+OPENAI_HEDGE_MODEL = os.getenv("OPENAI_HEDGE_MODEL", "")
 
 
 def generate_content(prompt: str, model: str = "gpt-4o-mini", max_tokens: int = 500, temperature: float = 0.7) -> str:
     """
     Generate content using OpenAI models.
+    Rate-limited and retried by the shared request governor, and hedged
+    when slower than the model's p95; returns None once retries are
+    exhausted or on a non-retryable error.
     """
+    client = get_openai_client()
+    hedge_model = OPENAI_HEDGE_MODEL or model
+
+    def _attempt(attempt_model):
+        def _call(cancel):
+            response = governed_call(
+                "openai",
+                lambda: client.chat.completions.create(
+                    model=attempt_model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                ),
+                est_tokens=estimate_tokens(prompt, max_output=max_tokens),
+                cancel=cancel,
+            )
+            return response.choices[0].message.content
+        return _call
+
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=temperature
+        return hedged_call(
+            f"openai:{model}:{max_tokens}",
+            _attempt(model),
+            hedge_fn=_attempt(hedge_model),
+            hedge_route=f"openai:{hedge_model}:{max_tokens}",
+            is_valid=bool,
         )
-        return response.choices[0].message.content
     except Exception as e:
         print(f"Error generating content: {e}")
         return None
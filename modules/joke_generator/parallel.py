@@ -0,0 +1,83 @@
+"""
+Bounded-Concurrency Helpers
+Thread-pool fan-out for the network-bound LLM calls in the Joke Generator.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Iterator, Optional, Sequence, Tuple
+
+
+def run_concurrently(
+    fn: Callable[[Any], Any],
+    items: Sequence[Any],
+    max_workers: int = 8,
+    timeout: Optional[float] = None,
+) -> Iterator[Tuple[int, Any, Optional[BaseException]]]:
+    """
+    Run fn(item) for every item on at most max_workers threads and yield
+    (index, result, error) as each one finishes. error is None on success.
+
+    timeout is per task and counts from when the task actually starts, so
+    queued work is not penalised. A timed-out task is reported as a
+    TimeoutError; its thread cannot be killed and is simply abandoned.
+    Abandoned threads keep their pool slot, so queued tasks also get a
+    batch deadline: the time the batch needs if every task ran for the
+    full timeout. A task still queued by then is reported as timed out
+    instead of waiting forever behind hung calls.
+    """
+    if not items:
+        return
+
+    started = {}
+
+    def _run(index, item):
+        started[index] = time.monotonic()
+        return fn(item)
+
+    workers = max(1, min(max_workers, len(items)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {pool.submit(_run, i, item): i for i, item in enumerate(items)}
+    pending = set(futures)
+    if timeout is not None:
+        waves = -(-len(items) // workers)
+        batch_deadline = time.monotonic() + timeout * waves
+
+    try:
+        while pending:
+            wait_for = None
+            if timeout is not None:
+                now = time.monotonic()
+                deadlines = [batch_deadline]
+                queued = False
+                for f in pending:
+                    if futures[f] in started:
+                        deadlines.append(started[futures[f]] + timeout)
+                    else:
+                        queued = True
+                wait_for = max(min(deadlines) - now, 0)
+                if queued:
+                    # Poll so a task that starts later gets its own deadline
+                    wait_for = min(wait_for, 0.05)
+
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                index = futures[future]
+                error = future.exception()
+                yield index, (None if error else future.result()), error
+
+            if timeout is not None:
+                now = time.monotonic()
+                for future in list(pending):
+                    index = futures[future]
+                    if index in started and now - started[index] >= timeout:
+                        pending.discard(future)
+                        future.cancel()
+                        yield index, None, TimeoutError(f"Task timed out after {timeout:.0f}s")
+                    elif index not in started and now >= batch_deadline:
+                        pending.discard(future)
+                        future.cancel()
+                        yield index, None, TimeoutError("Task never started: all workers are stuck on timed-out calls")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,263 @@
+"""
+Request Governor
+Shared rate limiting, retry and adaptive concurrency for OpenAI, Gemini and
+Supabase calls.
+
+Every provider gets token buckets for requests/min and tokens/min plus an
+AIMD concurrency limit: each throttle (429) halves the number of calls
+allowed in flight, successes grow it back by about one per window of calls.
+Retryable failures (429, 408, 5xx, connection errors) back off
+exponentially with full jitter, honouring Retry-After when the provider
+sends one.
+"""
+
+import os
+import time
+import random
+import threading
+from typing import Callable, Dict, Optional
+
+from .hedging import HedgeCancelled
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+# Defaults sit comfortably under the lower paid tiers; raise via env vars.
+PROVIDER_LIMITS = {
+    "openai": {
+        "rpm": _env_int("OPENAI_RPM", 3000),
+        "tpm": _env_int("OPENAI_TPM", 1_000_000),
+        "max_concurrency": _env_int("OPENAI_MAX_CONCURRENCY", 16),
+    },
+    "gemini": {
+        "rpm": _env_int("GEMINI_RPM", 1000),
+        "tpm": _env_int("GEMINI_TPM", 1_000_000),
+        "max_concurrency": _env_int("GEMINI_MAX_CONCURRENCY", 16),
+    },
+    "supabase": {
+        "rpm": _env_int("SUPABASE_RPM", 6000),
+        "tpm": 0,  # not token-metered
+        "max_concurrency": _env_int("SUPABASE_MAX_CONCURRENCY", 16),
+    },
+}
+
+MAX_RETRIES = _env_int("API_MAX_RETRIES", 5)
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at rate_per_min / 60 per second."""
+
+    def __init__(self, rate_per_min: float, capacity: float = None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_min
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1.0):
+        """Block until amount tokens are available, then take them."""
+        if self.rate <= 0:
+            return
+        # A request larger than the whole bucket would wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def drain(self):
+        """Empty the bucket (used when the provider says we are over limit)."""
+        with self._lock:
+            self._refill()
+            self.tokens = 0.0
+
+
+class ProviderGovernor:
+    """Rate limits, adaptive concurrency and counters for one provider."""
+
+    def __init__(self, name: str, rpm: int, tpm: int, max_concurrency: int):
+        self.name = name
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = float(self.max_concurrency)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+        self.calls = 0
+        self.retries = 0
+        self.throttles = 0
+        self.failures = 0
+
+    def _limit(self) -> int:
+        return max(1, int(self.concurrency))
+
+    def acquire(self, est_tokens: int = 0):
+        """Wait for a concurrency slot and rate-limit budget."""
+        with self._cond:
+            while self.in_flight >= self._limit():
+                self._cond.wait()
+            self.in_flight += 1
+        if self.requests is not None:
+            self.requests.acquire(1)
+        if self.tokens is not None and est_tokens:
+            self.tokens.acquire(est_tokens)
+
+    def release(self, throttled: bool = False):
+        """Free the slot and adapt the concurrency limit (AIMD)."""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.concurrency = max(1.0, self.concurrency / 2)
+            else:
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1.0 / self._limit())
+            self._cond.notify_all()
+
+    def count(self, counter: str):
+        """Increment one of the calls/retries/throttles/failures counters."""
+        with self._cond:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttles": self.throttles,
+                "failures": self.failures,
+                "concurrency_limit": self._limit(),
+                "in_flight": self.in_flight,
+            }
+
+
+_governors: Dict[str, ProviderGovernor] = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(provider: str) -> ProviderGovernor:
+    """Process-wide governor for a provider."""
+    with _governors_lock:
+        governor = _governors.get(provider)
+        if governor is None:
+            limits = PROVIDER_LIMITS.get(provider, {"rpm": 0, "tpm": 0, "max_concurrency": 8})
+            governor = ProviderGovernor(provider, **limits)
+            _governors[provider] = governor
+        return governor
+
+
+def estimate_tokens(*texts: str, max_output: int = 0) -> int:
+    """Rough token estimate (~4 chars/token) for the tokens/min bucket."""
+    return sum(len(t or "") for t in texts) // 4 + max_output
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Pull an HTTP status out of OpenAI / google-genai / postgrest / httpx errors."""
+    for attr in ("status_code", "code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str) and value.isdigit():
+            return int(value)
+    response = getattr(error, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds from a Retry-After header, if the error carries one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Throttles, timeouts, 5xx and dropped connections are worth retrying."""
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    name = type(error).__name__.lower()
+    return any(word in name for word in ("timeout", "connection", "ratelimit", "unavailable"))
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than Retry-After."""
+    delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def governed_call(provider: str, fn: Callable[[], object], est_tokens: int = 0,
+                  max_retries: int = None, cancel: threading.Event = None):
+    """
+    Run fn() under the provider's rate limits, retrying transient failures.
+    Non-retryable errors, and the last retryable one, are re-raised.
+    cancel (set when a hedged call has lost the race) stops further
+    attempts: HedgeCancelled is raised instead of retrying.
+    """
+    governor = get_governor(provider)
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+
+    attempt = 0
+    while True:
+        if cancel is not None and cancel.is_set():
+            raise HedgeCancelled()
+        governor.acquire(est_tokens)
+        throttled = False
+        try:
+            governor.count("calls")
+            return fn()
+        except HedgeCancelled:
+            raise
+        except Exception as e:
+            throttled = _status_code(e) == 429
+            if throttled:
+                governor.count("throttles")
+                if governor.requests is not None:
+                    governor.requests.drain()
+
+            if attempt >= max_retries or not is_retryable(e):
+                governor.count("failures")
+                raise
+
+            delay = backoff_delay(attempt, _retry_after(e))
+            governor.count("retries")
+            print(f"   ⏳ {provider} call failed ({e.__class__.__name__}); "
+                  f"retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+        finally:
+            governor.release(throttled=throttled)
+
+        if cancel is not None:
+            if cancel.wait(delay):
+                raise HedgeCancelled()
+        else:
+            time.sleep(delay)
+        attempt += 1
+
+
+def governor_stats() -> Dict[str, Dict]:
+    """Counters for every provider used so far in this process."""
+    with _governors_lock:
+        governors = list(_governors.values())
+    return {g.name: g.stats() for g in governors}
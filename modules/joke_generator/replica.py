@@ -0,0 +1,422 @@
+"""
+V12 Local Joke Replica
+Incrementally synced copy of comic_segments on local disk.
+
+Text columns live in SQLite (cache/replica.sqlite3); bridge embeddings are
+appended to a raw float32 file (cache/replica/embeddings.f32) that is read
+memory-mapped. After the first pull only changed rows move:
+
+- With an updated_at column (see DOCUMENTATION.md for the trigger), sync
+  pages through rows changed since the last (updated_at, id) cursor.
+- Without one, sync scans id/text columns only (keyset pagination, no
+  embeddings), compares content hashes, and fetches embeddings just for new
+  or changed ids. Deleted jokes are dropped.
+
+Run:
+    python -m modules.joke_generator.replica [--full] [--page-size 1000]
+"""
+
+import os
+import time
+import hashlib
+import argparse
+import threading
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .local_store import cache_path, open_sqlite
+
+
+REPLICA_DB = "replica.sqlite3"
+VECTORS_FILE = os.path.join("replica", "embeddings.f32")
+TEXT_COLUMNS = "id, searchable_text, bridge_content"
+
+COMPACT_RATIO = 0.25  # rewrite the vector file once this share of it is dead
+
+
+def _content_hash(searchable_text: Optional[str], bridge_content: Optional[str]) -> str:
+    return hashlib.sha1(
+        f"{searchable_text or ''}\0{bridge_content or ''}".encode("utf-8")
+    ).hexdigest()
+
+
+class JokeReplica:
+    """SQLite + flat float32 file mirror of comic_segments."""
+
+    def __init__(self, db_file: str = REPLICA_DB, vectors_file: str = VECTORS_FILE):
+        self.conn = open_sqlite(db_file)
+        self._base_vectors_path = cache_path(vectors_file)
+        self._lock = threading.Lock()
+        with self._lock, self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS jokes (
+                    id INTEGER PRIMARY KEY,
+                    searchable_text TEXT,
+                    bridge_content TEXT,
+                    content_hash TEXT NOT NULL,
+                    updated_at TEXT,
+                    vec_row INTEGER
+                )
+            """)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    # ─── State ───────────────────────────────────────────────────────────
+
+    def _get_state(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_state(self, key: str, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+            (key, None if value is None else str(value)),
+        )
+
+    @property
+    def vectors_path(self) -> str:
+        """Current vector file; compact() switches to a new one via sync_state."""
+        name = self._get_state("vectors_file")
+        if not name:
+            return self._base_vectors_path
+        return os.path.join(os.path.dirname(self._base_vectors_path), name)
+
+    @property
+    def dim(self) -> Optional[int]:
+        value = self._get_state("dim")
+        return int(value) if value else None
+
+    def _vector_count(self) -> int:
+        dim = self.dim
+        if not dim or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * dim)
+
+    def vectors(self) -> Optional[np.ndarray]:
+        """All stored vector rows, memory-mapped (including superseded ones)."""
+        n = self._vector_count()
+        if n == 0:
+            return None
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n, self.dim))
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM jokes").fetchone()[0]
+
+    def reset(self):
+        """Forget everything (next sync is a full pull)."""
+        with self._lock, self.conn:
+            old_path = self.vectors_path
+            self.conn.execute("DELETE FROM jokes")
+            self.conn.execute("DELETE FROM sync_state")
+            open(self.vectors_path, "wb").close()
+        if old_path != self.vectors_path and os.path.exists(old_path):
+            os.remove(old_path)
+
+    # ─── Writing ─────────────────────────────────────────────────────────
+
+    def _append_vectors(self, embeddings: List[Optional[list]]) -> List[Optional[int]]:
+        """Append the non-null embeddings to the vector file; returns their rows."""
+        present = [e for e in embeddings if e is not None]
+        if not present:
+            return [None] * len(embeddings)
+
+        block = np.asarray(present, dtype=np.float32)
+        dim = self.dim
+        if dim is None:
+            dim = block.shape[1]
+            self._set_state("dim", dim)
+        elif block.shape[1] != dim:
+            raise ValueError(
+                f"Embedding size changed ({dim} → {block.shape[1]}); "
+                f"resync with `python -m modules.joke_generator.replica --full`"
+            )
+
+        start = self._vector_count()
+        with open(self.vectors_path, "ab") as f:
+            f.write(block.tobytes())
+
+        rows, n = [], start
+        for e in embeddings:
+            if e is None:
+                rows.append(None)
+            else:
+                rows.append(n)
+                n += 1
+        return rows
+
+    def apply(self, rows: List[Dict]):
+        """
+        Upsert rows (id, searchable_text, bridge_content, optionally
+        bridge_embedding / updated_at). Rows without a bridge_embedding key
+        keep their stored vector.
+        """
+        if not rows:
+            return
+        with self._lock, self.conn:
+            with_vectors = [r for r in rows if "bridge_embedding" in r]
+            vec_rows = self._append_vectors([r["bridge_embedding"] for r in with_vectors])
+            new_vec = {r["id"]: v for r, v in zip(with_vectors, vec_rows)}
+
+            for row in rows:
+                joke_id = row["id"]
+                if joke_id in new_vec:
+                    vec_row = new_vec[joke_id]
+                else:
+                    current = self.conn.execute(
+                        "SELECT vec_row FROM jokes WHERE id = ?", (joke_id,)
+                    ).fetchone()
+                    vec_row = current[0] if current else None
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO jokes "
+                    "(id, searchable_text, bridge_content, content_hash, updated_at, vec_row) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (joke_id, row.get("searchable_text"), row.get("bridge_content"),
+                     _content_hash(row.get("searchable_text"), row.get("bridge_content")),
+                     row.get("updated_at"), vec_row),
+                )
+
+    def delete(self, ids: List[int]):
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM jokes WHERE id = ?", [(i,) for i in ids])
+
+    def compact(self) -> int:
+        """Rewrite the vector file without superseded rows. Returns rows dropped."""
+        vectors = self.vectors()
+        if vectors is None:
+            return 0
+        with self._lock:
+            live = self.conn.execute(
+                "SELECT id, vec_row FROM jokes WHERE vec_row IS NOT NULL ORDER BY vec_row"
+            ).fetchall()
+            dead = len(vectors) - len(live)
+            if dead <= COMPACT_RATIO * len(vectors):
+                return 0
+
+            # The new file gets a new name; the renumbered rows and the switch
+            # to that name commit together, so readers see old or new, never a mix.
+            old_path = self.vectors_path
+            base, ext = os.path.splitext(os.path.basename(self._base_vectors_path))
+            new_name = f"{base}-{int(time.time() * 1000)}{ext}"
+            new_path = os.path.join(os.path.dirname(old_path), new_name)
+            try:
+                with open(new_path, "wb") as f:
+                    for start in range(0, len(live), 16384):
+                        chunk = [vec_row for _, vec_row in live[start:start + 16384]]
+                        f.write(np.ascontiguousarray(vectors[chunk]).tobytes())
+                with self.conn:
+                    self.conn.executemany(
+                        "UPDATE jokes SET vec_row = ? WHERE id = ?",
+                        [(n, joke_id) for n, (joke_id, _) in enumerate(live)],
+                    )
+                    self._set_state("vectors_file", new_name)
+            except BaseException:
+                if os.path.exists(new_path):
+                    os.remove(new_path)
+                raise
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass  # still mapped elsewhere; the stale file is just disk space
+            return dead
+
+    # ─── Sync ────────────────────────────────────────────────────────────
+
+    def sync(self, page_size: int = 1000, full: bool = False) -> Dict[str, int]:
+        """Pull changes from Supabase. full=True starts again from scratch."""
+        from .db_manager import check_columns_exist
+
+        if full:
+            self.reset()
+
+        mode = self._get_state("mode")
+        if mode is None:
+            mode = "updated_at" if check_columns_exist("updated_at") else "hash"
+            with self.conn:
+                self._set_state("mode", mode)
+
+        print(f"🔄 Syncing comic_segments replica ({mode} change tracking)...")
+        started = time.time()
+        counts = self._sync_updated_at(page_size) if mode == "updated_at" \
+            else self._sync_by_hash(page_size)
+
+        dropped = self.compact()
+        with self.conn:
+            self._set_state("synced_at", time.time())
+        print(f"   ✅ +{counts['upserted']} changed, -{counts['deleted']} deleted, "
+              f"{counts['fetched_embeddings']} embeddings fetched "
+              f"({time.time() - started:.1f}s, {len(self)} jokes local"
+              f"{f', compacted {dropped} stale vectors' if dropped else ''})")
+        return counts
+
+    def _sync_updated_at(self, page_size: int) -> Dict[str, int]:
+        from .db_manager import iter_changed_jokes
+
+        since = self._get_state("cursor_updated_at")
+        after_id = int(self._get_state("cursor_id", 0))
+        counts = {"upserted": 0, "deleted": 0, "fetched_embeddings": 0}
+
+        columns = f"{TEXT_COLUMNS}, bridge_embedding, updated_at"
+        for page in iter_changed_jokes(columns, since, after_id, page_size):
+            self.apply(page)
+            counts["upserted"] += len(page)
+            counts["fetched_embeddings"] += sum(r.get("bridge_embedding") is not None for r in page)
+            with self.conn:
+                self._set_state("cursor_updated_at", page[-1]["updated_at"])
+                self._set_state("cursor_id", page[-1]["id"])
+
+        # Deletions don't bump updated_at; a light id scan finds them
+        counts["deleted"] = self._prune_deleted(page_size)
+        return counts
+
+    def _sync_by_hash(self, page_size: int) -> Dict[str, int]:
+        from .db_manager import get_jokes_by_ids, iter_joke_pages
+
+        counts = {"upserted": 0, "deleted": 0, "fetched_embeddings": 0}
+        seen = set()
+
+        for page in iter_joke_pages(TEXT_COLUMNS, page_size=page_size):
+            ids = [r["id"] for r in page]
+            seen.update(ids)
+            placeholders = ",".join("?" * len(ids))
+            local = dict(self.conn.execute(
+                f"SELECT id, content_hash FROM jokes WHERE id IN ({placeholders})", ids
+            ).fetchall())
+
+            changed = [
+                r for r in page
+                if local.get(r["id"]) != _content_hash(r.get("searchable_text"), r.get("bridge_content"))
+            ]
+            if not changed:
+                continue
+
+            bridged = [r["id"] for r in changed if r.get("bridge_content")]
+            vectors = {
+                r["id"]: r["bridge_embedding"]
+                for r in get_jokes_by_ids(bridged, "id, bridge_embedding")
+            } if bridged else {}
+            for r in changed:
+                r["bridge_embedding"] = vectors.get(r["id"])
+
+            self.apply(changed)
+            counts["upserted"] += len(changed)
+            counts["fetched_embeddings"] += sum(v is not None for v in vectors.values())
+
+        stale = [
+            joke_id for (joke_id,) in self.conn.execute("SELECT id FROM jokes").fetchall()
+            if joke_id not in seen
+        ]
+        self.delete(stale)
+        counts["deleted"] = len(stale)
+        return counts
+
+    def _prune_deleted(self, page_size: int) -> int:
+        from .db_manager import iter_joke_pages
+
+        seen = set()
+        for page in iter_joke_pages("id", page_size=page_size):
+            seen.update(r["id"] for r in page)
+        stale = [
+            joke_id for (joke_id,) in self.conn.execute("SELECT id FROM jokes").fetchall()
+            if joke_id not in seen
+        ]
+        self.delete(stale)
+        return len(stale)
+
+    # ─── Reading ─────────────────────────────────────────────────────────
+
+    def iter_bridged(self, batch_size: int = 10000) -> Iterator[Dict]:
+        """Jokes with a bridge embedding, in id order (same shape as iter_bridged_jokes)."""
+        vectors = self.vectors()
+        if vectors is None:
+            return
+        last_id = None
+        while True:
+            query = "SELECT id, searchable_text, bridge_content, vec_row FROM jokes " \
+                    "WHERE vec_row IS NOT NULL"
+            args = ()
+            if last_id is not None:
+                query += " AND id > ?"
+                args = (last_id,)
+            rows = self.conn.execute(query + " ORDER BY id LIMIT ?", args + (batch_size,)).fetchall()
+            if not rows:
+                return
+            block = vectors[[r[3] for r in rows]]
+            for (joke_id, text, bridge, _), vector in zip(rows, block):
+                yield {
+                    "id": joke_id,
+                    "searchable_text": text,
+                    "bridge_content": bridge,
+                    "bridge_embedding": vector,
+                }
+            last_id = rows[-1][0]
+
+    def iter_pages(self, after_id: int = 0, page_size: int = 200,
+                   only_missing: bool = True) -> Iterator[List[Dict]]:
+        """Offline equivalent of db_manager.iter_jokes_for_backfill."""
+        last_id = after_id
+        while True:
+            query = "SELECT id, searchable_text FROM jokes WHERE id > ?"
+            if only_missing:
+                query += " AND vec_row IS NULL"
+            rows = self.conn.execute(query + " ORDER BY id LIMIT ?", (last_id, page_size)).fetchall()
+            if not rows:
+                return
+            yield [{"id": r[0], "searchable_text": r[1]} for r in rows]
+            last_id = rows[-1][0]
+
+    def jokes_by_ids(self, ids: List[int]) -> List[Dict]:
+        """id/searchable_text for specific jokes (e.g. backfill retries), in id order."""
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        rows = self.conn.execute(
+            f"SELECT id, searchable_text FROM jokes WHERE id IN ({placeholders}) ORDER BY id",
+            list(ids),
+        ).fetchall()
+        return [{"id": r[0], "searchable_text": r[1]} for r in rows]
+
+    def stats(self) -> Dict:
+        bridged = self.conn.execute("SELECT COUNT(*) FROM jokes WHERE vec_row IS NOT NULL").fetchone()[0]
+        return {
+            "jokes": len(self),
+            "bridged": bridged,
+            "dim": self.dim,
+            "vector_rows": self._vector_count(),
+            "mode": self._get_state("mode"),
+            "synced_at": float(self._get_state("synced_at", 0)) or None,
+        }
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+def get_replica() -> JokeReplica:
+    """Process-wide replica handle."""
+    global _replica
+    if _replica is None:
+        with _replica_lock:
+            if _replica is None:
+                _replica = JokeReplica()
+    return _replica
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+
+    parser = argparse.ArgumentParser(description="Sync the local comic_segments replica.")
+    parser.add_argument("--full", action="store_true", help="Drop the replica and pull everything")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    replica = get_replica()
+    replica.sync(page_size=args.page_size, full=args.full)
+    print(f"   {replica.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+V12 Incremental JSON
+Streaming parser for a JSON object response, fed chunk by chunk.
+
+Each top-level field is decoded as soon as its value closes, so a caller can
+act on "draft_joke" before the rest of the response arrives, stop reading
+once the keys it needs are present, and recover the completed fields from
+a truncated response.
+"""
+
+import json
+from typing import Callable, Dict, Optional
+
+
+class IncrementalJSONParser:
+    """
+    Tracks the top-level fields of a streamed JSON object.
+
+    feed(text) returns the fields completed by that chunk; .fields holds all
+    of them. Anything before the first '{' (e.g. a ```json fence) is
+    skipped. A top-level array is accumulated but not split into fields.
+    """
+
+    def __init__(self, on_field: Callable[[str, object], None] = None):
+        self.on_field = on_field
+        self.text = ""
+        self.fields: Dict[str, object] = {}
+        self.kind: Optional[str] = None  # "object" | "array" once the root opens
+        self.done = False
+
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        # inside the root object: "key" → "colon" → "value" → "next"
+        self._phase = "key"
+        self._key: Optional[str] = None
+        self._start = 0
+        self._root = (0, 0)
+
+    def feed(self, chunk: str) -> Dict[str, object]:
+        self.text += chunk or ""
+        completed = {}
+        text = self.text
+
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            pos = self._pos
+            self._pos += 1
+
+            if self.kind is None:
+                if ch in "{[":
+                    self.kind = "object" if ch == "{" else "array"
+                    self._depth = 1
+                    self._root = (pos, pos)
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self.kind == "object":
+                        if self._phase == "key":
+                            self._key = self._decode(self._start, pos + 1)
+                            self._phase = "colon"
+                        elif self._phase == "value":
+                            self._complete(pos + 1, completed)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._phase in ("key", "value"):
+                    self._start = pos
+            elif ch in "{[":
+                if self._depth == 1 and self._phase == "value":
+                    self._start = pos
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 1 and self._phase == "value":
+                    self._complete(pos, completed)
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+                    self._root = (self._root[0], pos + 1)
+                elif self._depth == 1 and self._phase == "value":
+                    self._complete(pos + 1, completed)
+            elif self._depth == 1 and self.kind == "object":
+                if ch == ":" and self._phase == "colon":
+                    self._phase = "value"
+                    self._start = None
+                elif ch == "," and self._phase == "value":
+                    self._complete(pos, completed)
+                    self._phase = "key"
+                elif ch == "," and self._phase == "next":
+                    self._phase = "key"
+                elif not ch.isspace() and self._phase == "value" and self._start is None:
+                    self._start = pos  # number / true / false / null
+
+        return completed
+
+    def _decode(self, start: int, end: int):
+        return json.loads(self.text[start:end])
+
+    def _complete(self, end: int, completed: dict):
+        """Close the current root-level value, if one is open."""
+        if self._phase != "value" or self._start is None:
+            return
+        try:
+            value = self._decode(self._start, end)
+        except json.JSONDecodeError:
+            pass
+        else:
+            self.fields[self._key] = value
+            completed[self._key] = value
+            if self.on_field is not None:
+                self.on_field(self._key, value)
+        self._phase = "next"
+        self._start = None
+
+    def has(self, keys) -> bool:
+        return all(k in self.fields for k in keys)
+
+    def value(self):
+        """The whole root value once it has closed (fences and trailing text dropped)."""
+        if not self.done:
+            raise ValueError("JSON value is not complete")
+        return json.loads(self.text[self._root[0]:self._root[1]])
@@ -0,0 +1,151 @@
+"""
+V12 Theme Memo
+Persistent headline → themes memo for expand_headline_to_themes.
+
+Headlines are matched loosely: Unicode-normalised, casefolded, punctuation
+stripped and whitespace collapsed, so "Traffic jams!!" and "traffic  jams"
+share one entry. Entries expire after a TTL (news angles drift) and the
+store is bounded by entry count.
+
+Warm it ahead of time from a list of trending topics (one per line):
+    python -m modules.joke_generator.theme_memo topics.txt [--workers 8]
+"""
+
+import os
+import re
+import time
+import argparse
+import threading
+import unicodedata
+from typing import Optional
+
+from .local_store import open_sqlite
+
+
+THEME_MEMO_FILE = "themes.sqlite3"
+THEME_MEMO_TTL = float(os.getenv("THEME_MEMO_TTL", str(3 * 24 * 3600)))
+THEME_MEMO_MAX_ENTRIES = int(os.getenv("THEME_MEMO_MAX_ENTRIES", "50000"))
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+
+def normalize_headline(headline: str) -> str:
+    """Loose memo key: NFKC, casefold, no punctuation, single spaces."""
+    text = unicodedata.normalize("NFKC", headline or "").casefold()
+    text = _PUNCTUATION_RE.sub(" ", text).replace("_", " ")
+    return " ".join(text.split())
+
+
+class ThemeMemo:
+    """SQLite store of expanded themes with TTL and max-size eviction."""
+
+    def __init__(self, filename: str = THEME_MEMO_FILE,
+                 ttl: float = THEME_MEMO_TTL,
+                 max_entries: int = THEME_MEMO_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._db = open_sqlite(filename)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS themes (
+                key TEXT PRIMARY KEY,
+                headline TEXT NOT NULL,
+                themes TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_themes_created ON themes(created_at)")
+        self._db.commit()
+
+    def get(self, headline: str) -> Optional[str]:
+        """Memoised themes for a headline, or None."""
+        key = normalize_headline(headline)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT themes, created_at FROM themes WHERE key = ?", (key,)
+            ).fetchone()
+
+            if not key or row is None or time.time() - row[1] > self.ttl:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return row[0]
+
+    def put(self, headline: str, themes: str):
+        """Store themes, evicting expired and then oldest entries."""
+        key = normalize_headline(headline)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO themes (key, headline, themes, created_at) VALUES (?, ?, ?, ?)",
+                (key, headline, themes, now)
+            )
+            self._db.execute("DELETE FROM themes WHERE created_at < ?", (now - self.ttl,))
+            self._db.execute(
+                "DELETE FROM themes WHERE key IN (SELECT key FROM themes "
+                "ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+
+    def __contains__(self, headline: str) -> bool:
+        key = normalize_headline(headline)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT created_at FROM themes WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._db.execute("SELECT COUNT(*) FROM themes").fetchone()[0]
+            return {
+                "entries": entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_memo: Optional[ThemeMemo] = None
+_memo_lock = threading.Lock()
+
+
+def get_theme_memo() -> ThemeMemo:
+    """Process-wide theme memo, opened on first use."""
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = ThemeMemo()
+        return _memo
+
+
+def main():
+    from dotenv import load_dotenv
+    from .bridge_manager import warm_theme_memo
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+
+    parser = argparse.ArgumentParser(description="Pre-expand themes for trending topics.")
+    parser.add_argument("topics_file", help="Text file with one topic/headline per line")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    with open(args.topics_file, "r", encoding="utf-8") as f:
+        topics = [line.strip() for line in f if line.strip()]
+
+    counts = warm_theme_memo(topics, max_workers=args.workers)
+    print(f"🔥 Theme memo warmed: {counts['expanded']} expanded, "
+          f"{counts['cached']} already cached, {counts['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,5 +3,5 @@ Video Studio Module — Ported from Studio_AutoPost
 Video generation (MoviePy) + Instagram upload (Graph API).
 """
 
-from .studio import generate_reel, ASSETS_DIR
+from .studio import generate_reel, generate_reels_batch, render_reels, ASSETS_DIR
 from .uploader import upload_reel
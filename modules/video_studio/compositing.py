@@ -0,0 +1,102 @@
+"""
+Overlay Compositing
+Region-of-interest blending of the static text overlay onto video frames.
+
+The overlay from create_text_image is a full 1080×1920 RGBA frame, but the
+text only covers its text_area. OverlayBlender finds the tight bounding box
+of the non-transparent pixels once, precomputes the premultiplied colour and
+inverse alpha for that box, and per frame blends only the box, in integer
+arithmetic, into the frame's own buffer. Per-frame work scales with the
+text's area instead of the frame's.
+"""
+
+import numpy as np
+
+
+def overlay_bbox(rgba):
+    """(x0, y0, x1, y1) of the pixels with alpha > 0, or None if there are none."""
+    alpha = rgba[..., 3]
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+class OverlayBlender:
+    """
+    Blends one static RGBA overlay onto RGB uint8 frames, anchored top-left.
+
+        out = (frame * (255 - a) + rgb * a) / 255   (rounded, per channel)
+
+    rgb * a and 255 - a are precomputed for the bounding box; each blend is
+    a multiply-add into a reused uint16 buffer plus a rounding divide by 255.
+    Not thread-safe (the scratch buffers are shared); use one per render.
+    """
+
+    def __init__(self, rgba):
+        rgba = np.asarray(rgba, dtype=np.uint8)
+        if rgba.ndim != 3 or rgba.shape[2] != 4:
+            raise ValueError("Overlay must be an RGBA array")
+
+        self.size = rgba.shape[1], rgba.shape[0]
+        self.bbox = overlay_bbox(rgba)
+        if self.bbox is None:
+            return
+
+        x0, y0, x1, y1 = self.bbox
+        roi = rgba[y0:y1, x0:x1].astype(np.uint16)
+        alpha = roi[..., 3:4]
+        self._premultiplied = roi[..., :3] * alpha       # ≤ 255·255
+        self._inverse_alpha = 255 - alpha                # (h, w, 1), broadcast over RGB
+        self._acc = np.empty(self._premultiplied.shape, dtype=np.uint16)
+        self._tmp = np.empty_like(self._acc)
+
+    @property
+    def coverage(self):
+        """Fraction of the frame inside the bounding box."""
+        if self.bbox is None:
+            return 0.0
+        x0, y0, x1, y1 = self.bbox
+        return (x1 - x0) * (y1 - y0) / (self.size[0] * self.size[1])
+
+    def crop(self, rgba, align=1):
+        """
+        The overlay cut to its bounding box, and the box's (x, y) offset.
+        align rounds the offset down to a multiple (ffmpeg's overlay snaps
+        yuv420 positions to even pixels).
+        """
+        if self.bbox is None:
+            return None, (0, 0)
+        x0, y0, x1, y1 = self.bbox
+        x0 -= x0 % align
+        y0 -= y0 % align
+        return np.ascontiguousarray(rgba[y0:y1, x0:x1]), (x0, y0)
+
+    def blend(self, frame):
+        """
+        Composite the overlay onto frame. Writable frames are modified in
+        place; read-only ones (e.g. a decoder's buffer) are copied first.
+        """
+        if self.bbox is None:
+            return frame
+        if frame.dtype != np.uint8 or not frame.flags.writeable:
+            frame = np.array(frame, dtype=np.uint8)
+
+        # Overlay anchored top-left; a smaller frame clips the box
+        x0, y0, x1, y1 = self.bbox
+        roi = frame[y0:y1, x0:x1, :3]
+        h, w = roi.shape[:2]
+        if h == 0 or w == 0:
+            return frame
+        acc, tmp = self._acc[:h, :w], self._tmp[:h, :w]
+
+        np.multiply(roi, self._inverse_alpha[:h, :w], out=acc)
+        acc += self._premultiplied[:h, :w]               # ≤ 255·255
+        # Exact round(acc / 255) for acc ≤ 255·255: (v + (v >> 8)) >> 8, v = acc + 128
+        acc += 128
+        np.right_shift(acc, 8, out=tmp)
+        acc += tmp
+        acc >>= 8
+        np.copyto(roi, acc, casting="unsafe")
+        return frame
@@ -4,20 +4,44 @@ Refactored for Unified Content Engine — output goes to temp/ folder.
 """
 
 import os
+import time
 import random
 import textwrap
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from moviepy import (
-    VideoFileClip, AudioFileClip, CompositeVideoClip, ImageClip,
+    VideoFileClip, AudioFileClip,
     vfx, afx
 )
 from PIL import Image, ImageDraw, ImageFont
 import numpy as np
 
+from .compositing import OverlayBlender
+
 # Configuration — paths resolve relative to THIS file
 ASSETS_DIR = os.path.join(os.path.dirname(__file__), "assets")
 OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "temp")
 VIDEO_DURATION = 15
+RENDER_FPS = 24
+X264_PRESET = os.getenv("REEL_X264_PRESET", "medium")
+
+# "ffmpeg" renders in one native ffmpeg pass; "moviepy" composites in Python
+RENDER_ENGINE = os.getenv("REEL_RENDER_ENGINE", "ffmpeg")
+
+# Render from pre-normalised, pre-looped templates (template_cache.py)
+USE_TEMPLATE_CACHE = os.getenv("REEL_TEMPLATE_CACHE", "1") == "1"
+
+# Batch rendering: reels rendered at once (0 = half the cores) and encoder
+# threads per reel (0 = cores / workers), so the box is not oversubscribed
+RENDER_WORKERS = int(os.getenv("REEL_RENDER_WORKERS", "0"))
+RENDER_THREADS = int(os.getenv("REEL_RENDER_THREADS", "0"))
+
+# Jobs sharing a template, track and duration are rendered together: the
+# background is decoded once and fanned out to one encoder per reel
+SHARED_DECODE = os.getenv("REEL_SHARED_DECODE", "1") == "1"
+# Reels per shared-decode ffmpeg run (each encoder holds its own lookahead)
+SHARED_BATCH_SIZE = int(os.getenv("REEL_SHARED_BATCH_SIZE", "8"))
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -233,12 +257,21 @@ def create_text_image(text, width=1080, height=1920, config=None):
 
 
 def generate_reel(joke_text, output_filename="daily_reel.mp4", duration=None,
-                 video_path=None, audio_path=None):
+                 video_path=None, audio_path=None, engine=None, threads=None,
+                 use_template_cache=None):
     """
     Generate an Instagram Reel.
     Supports explicit video/audio paths and config-based styling.
+    engine: "ffmpeg" (one native ffmpeg pass) or "moviepy"; defaults to
+    REEL_RENDER_ENGINE. A failed ffmpeg render falls back to MoviePy.
+    threads caps the encoder threads (None = encoder default).
+    With the template cache (REEL_TEMPLATE_CACHE), the background comes from
+    an intermediate already looped, resampled and scaled for this duration,
+    so the render only composites the overlay and muxes the audio.
     """
     duration = duration or VIDEO_DURATION
+    engine = engine or RENDER_ENGINE
+    use_template_cache = USE_TEMPLATE_CACHE if use_template_cache is None else use_template_cache
 
     if not video_path:
         video_path = get_random_file(os.path.join(ASSETS_DIR, "templates"), (".mp4", ".mov"))
@@ -259,6 +292,117 @@ def generate_reel(joke_text, output_filename="daily_reel.mp4", duration=None,
     if video_config:
         print(f"   ⚙️  Loaded config for {video_filename}")
 
+    txt_img_array = create_text_image(joke_text, config=video_config)
+    output_path = os.path.join(OUTPUT_DIR, output_filename)
+
+    prepared = False
+    if use_template_cache:
+        from .template_cache import prepare_template
+
+        try:
+            video_path = prepare_template(video_path, duration, RENDER_FPS, threads=threads)
+            prepared = True
+        except Exception as e:
+            print(f"   ⚠️  Template cache unavailable ({e}); rendering from the source template")
+
+    if engine == "ffmpeg":
+        try:
+            _render_ffmpeg(video_path, audio_path, txt_img_array, duration, output_path,
+                           threads, prepared)
+            print(f"✅ Saved to: {output_path}")
+            return output_path
+        except Exception as e:
+            print(f"   ⚠️  ffmpeg render failed ({e}); falling back to MoviePy")
+
+    _render_moviepy(video_path, audio_path, txt_img_array, duration, output_path, threads)
+
+    print(f"✅ Saved to: {output_path}")
+    return output_path
+
+
+def _probe_video(video_path):
+    """(width, height) of a video, read from ffmpeg's stream header."""
+    from imageio_ffmpeg import read_frames
+
+    reader = read_frames(video_path)
+    try:
+        meta = next(reader)
+    finally:
+        reader.close()
+    return meta["size"]
+
+
+def _scale_filter(width, height):
+    """
+    The MoviePy path's resize/crop as an ffmpeg filter: off-ratio templates
+    are scaled to 1920 high and centre-cropped to 1080 wide, near-9:16 ones
+    scaled to 1080 wide.
+    """
+    if abs(width / height - 1080 / 1920) > 0.1:
+        scaled_w = round(width * 1920 / height)
+        chain = "scale=-2:1920:flags=lanczos"
+        if scaled_w > 1080:
+            chain += ",crop=1080:1920"
+        return chain
+    return "scale=1080:-2:flags=lanczos"
+
+
+def _save_overlay(txt_img_array, path):
+    """
+    Save the overlay cropped to its non-transparent bounding box, so ffmpeg
+    converts and blends only that region. Returns the box's (x, y).
+    """
+    cropped, offset = OverlayBlender(txt_img_array).crop(txt_img_array, align=2)
+    if cropped is None:
+        cropped = np.zeros((2, 2, 4), dtype=np.uint8)  # nothing to draw
+    Image.fromarray(cropped).save(path)
+    return offset
+
+
+def _render_ffmpeg(video_path, audio_path, txt_img_array, duration, output_path,
+                   threads=None, prepared=False):
+    """
+    Single ffmpeg invocation: looped template → scale/crop → text overlay
+    (written once as a PNG) → looped audio, cut to duration. A prepared
+    template is already looped and scaled, so only the overlay remains.
+    """
+    import tempfile
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    if prepared:
+        background = "[0:v]null[bg];"
+    else:
+        width, height = _probe_video(video_path)
+        # round=up picks the same source frame MoviePy samples at n/fps
+        background = f"[0:v]fps={RENDER_FPS}:round=up,{_scale_filter(width, height)}[bg];"
+
+    fd, overlay_path = tempfile.mkstemp(suffix=".png", dir=OUTPUT_DIR)
+    os.close(fd)
+    try:
+        x, y = _save_overlay(txt_img_array, overlay_path)
+
+        cmd = [
+            get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-stream_loop", "-1", "-i", video_path,
+            "-i", overlay_path,
+            "-stream_loop", "-1", "-i", audio_path,
+            "-filter_complex",
+            background + f"[bg][1:v]overlay={x}:{y},format=yuv420p[v]",
+            "-map", "[v]", "-map", "2:a",
+            "-t", f"{duration}",
+            "-c:v", "libx264", "-preset", X264_PRESET,
+            "-c:a", "aac", "-ac", "2", "-ar", "44100",
+        ]
+        if threads:
+            cmd += ["-threads", str(threads), "-filter_complex_threads", str(threads)]
+        cmd.append(output_path)
+        _run_ffmpeg(cmd)
+    finally:
+        os.remove(overlay_path)
+
+
+def _render_moviepy(video_path, audio_path, txt_img_array, duration, output_path, threads=None):
+    """Composite and encode through MoviePy (frame by frame in Python)."""
     video = VideoFileClip(video_path)
 
     if video.duration < duration:
@@ -274,11 +418,12 @@ def generate_reel(joke_text, output_filename="daily_reel.mp4", duration=None,
         if video.w > 1080:
             x_center = video.w // 2
             video = video.cropped(x1=x_center - 540, x2=x_center + 540)
-    else:
+    elif video.w != 1080:
         video = video.resized(width=1080)
 
-    txt_img_array = create_text_image(joke_text, config=video_config)
-    txt_clip = ImageClip(txt_img_array).with_duration(duration)
+    # Blend only the text's bounding box, in place, instead of compositing
+    # a full-frame RGBA clip over every frame
+    video = video.image_transform(OverlayBlender(txt_img_array).blend)
 
     audio = AudioFileClip(audio_path)
     if audio.duration < duration:
@@ -286,19 +431,20 @@ def generate_reel(joke_text, output_filename="daily_reel.mp4", duration=None,
     else:
         audio = audio.subclipped(0, duration)
 
-    final = CompositeVideoClip([video, txt_clip])
-    final = final.with_audio(audio)
+    final = video.with_audio(audio)
 
-    output_path = os.path.join(OUTPUT_DIR, output_filename)
+    output_filename = os.path.basename(output_path)
     temp_audio_path = os.path.join(OUTPUT_DIR, f"temp_{output_filename}_audio.m4a")
 
     final.write_videofile(
         output_path,
-        fps=24,
+        fps=RENDER_FPS,
         codec="libx264",
+        preset=X264_PRESET,
         audio_codec="aac",
         temp_audiofile=temp_audio_path,
         remove_temp=True,
+        threads=threads,
         logger=None
     )
 
@@ -306,5 +452,261 @@ def generate_reel(joke_text, output_filename="daily_reel.mp4", duration=None,
     audio.close()
     final.close()
 
-    print(f"✅ Saved to: {output_path}")
-    return output_path
+
+def generate_reels_batch(joke_texts, output_filenames, duration=None, video_path=None,
+                         audio_path=None, threads=None, use_template_cache=None):
+    """
+    Render several reels that share one template, track and duration.
+    The background is decoded and normalised once, split into one branch
+    per joke for its text overlay, and each branch gets its own encoder.
+    The audio is encoded once and copied into every output.
+    Returns the output paths, in input order. Raises on failure.
+    """
+    if len(joke_texts) != len(output_filenames):
+        raise ValueError("joke_texts and output_filenames must have the same length")
+    if not joke_texts:
+        return []
+
+    duration = duration or VIDEO_DURATION
+    use_template_cache = USE_TEMPLATE_CACHE if use_template_cache is None else use_template_cache
+
+    if not video_path:
+        video_path = get_random_file(os.path.join(ASSETS_DIR, "templates"), (".mp4", ".mov"))
+
+    if not audio_path:
+        audio_path = get_random_file(os.path.join(ASSETS_DIR, "music"), (".mp3", ".wav", ".m4a"))
+
+    video_filename = os.path.basename(video_path)
+
+    print(f"🎬 Creating {len(joke_texts)} Reels from one decode...")
+    print(f"   📹 Video: {video_filename}")
+    print(f"   🎵 Audio: {os.path.basename(audio_path)}")
+
+    video_config = load_template_config().get(video_filename)
+    overlays = [create_text_image(text, config=video_config) for text in joke_texts]
+    output_paths = [os.path.join(OUTPUT_DIR, name) for name in output_filenames]
+
+    prepared = False
+    if use_template_cache:
+        from .template_cache import prepare_template
+
+        try:
+            video_path = prepare_template(video_path, duration, RENDER_FPS, threads=threads)
+            prepared = True
+        except Exception as e:
+            print(f"   ⚠️  Template cache unavailable ({e}); rendering from the source template")
+
+    _render_ffmpeg_batch(video_path, audio_path, overlays, duration, output_paths, threads, prepared)
+
+    for path in output_paths:
+        print(f"✅ Saved to: {path}")
+    return output_paths
+
+
+def _render_ffmpeg_batch(video_path, audio_path, overlays, duration, output_paths,
+                         threads=None, prepared=False):
+    """
+    One ffmpeg run, N outputs: background → split=N → overlay i → encoder i.
+    The looped audio is encoded to AAC first and stream-copied into each output.
+    """
+    import tempfile
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    ffmpeg = get_ffmpeg_exe()
+    count = len(overlays)
+
+    if prepared:
+        background = "[0:v]"
+    else:
+        width, height = _probe_video(video_path)
+        background = f"[0:v]fps={RENDER_FPS}:round=up,{_scale_filter(width, height)},"
+    labels = "".join(f"[bg{i}]" for i in range(count))
+    graph = [f"{background}split={count}{labels}"]
+
+    temp_paths = []
+    try:
+        fd, audio_out = tempfile.mkstemp(suffix=".m4a", dir=OUTPUT_DIR)
+        os.close(fd)
+        temp_paths.append(audio_out)
+        _run_ffmpeg([
+            ffmpeg, "-y", "-loglevel", "error",
+            "-stream_loop", "-1", "-i", audio_path,
+            "-vn", "-t", f"{duration}",
+            "-c:a", "aac", "-ac", "2", "-ar", "44100",
+            audio_out,
+        ])
+
+        cmd = [ffmpeg, "-y", "-loglevel", "error", "-stream_loop", "-1", "-i", video_path]
+        for i, txt_img_array in enumerate(overlays):
+            fd, overlay_path = tempfile.mkstemp(suffix=".png", dir=OUTPUT_DIR)
+            os.close(fd)
+            temp_paths.append(overlay_path)
+            x, y = _save_overlay(txt_img_array, overlay_path)
+            cmd += ["-i", overlay_path]
+            graph.append(f"[bg{i}][{i + 1}:v]overlay={x}:{y},format=yuv420p[v{i}]")
+        cmd += ["-i", audio_out, "-filter_complex", ";".join(graph)]
+        if threads:
+            cmd += ["-filter_complex_threads", str(threads)]
+
+        # Encoders run concurrently; split the thread cap between them
+        encoder_threads = max(1, threads // count) if threads else None
+        for i, output_path in enumerate(output_paths):
+            cmd += [
+                "-map", f"[v{i}]", "-map", f"{count + 1}:a",
+                "-t", f"{duration}",
+                "-c:v", "libx264", "-preset", X264_PRESET,
+                "-c:a", "copy",
+            ]
+            if encoder_threads:
+                cmd += ["-threads", str(encoder_threads)]
+            cmd.append(output_path)
+        _run_ffmpeg(cmd)
+    finally:
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _run_ffmpeg(cmd):
+    import subprocess
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-500:] or f"ffmpeg exited with {result.returncode}")
+
+
+def _render_job(index, job, threads):
+    """Process-pool entry point: render one job, never raise."""
+    started = time.monotonic()
+    try:
+        path = generate_reel(**job, threads=threads)
+        return {"index": index, "success": True, "path": path, "error": None,
+                "seconds": time.monotonic() - started}
+    except Exception as e:
+        return {"index": index, "success": False, "path": None, "error": str(e),
+                "seconds": time.monotonic() - started}
+
+
+def _render_group(indices, jobs, threads):
+    """
+    Process-pool entry point for jobs sharing a template, track and
+    duration: one shared-decode render, or per-job renders if it fails.
+    Returns one result per job; never raises.
+    """
+    if len(jobs) == 1:
+        return [_render_job(indices[0], jobs[0], threads)]
+
+    started = time.monotonic()
+    first = jobs[0]
+    try:
+        paths = generate_reels_batch(
+            [job["joke_text"] for job in jobs],
+            [job.get("output_filename", f"reel_{i + 1}.mp4") for i, job in zip(indices, jobs)],
+            duration=first.get("duration"),
+            video_path=first["video_path"],
+            audio_path=first["audio_path"],
+            threads=threads,
+            use_template_cache=first.get("use_template_cache"),
+        )
+    except Exception as e:
+        print(f"   ⚠️  Shared-decode render failed ({e}); rendering reels one by one")
+        return [_render_job(i, job, threads) for i, job in zip(indices, jobs)]
+
+    # One run produced every file; split its wall time evenly
+    seconds = (time.monotonic() - started) / len(jobs)
+    return [{"index": i, "success": True, "path": path, "error": None, "seconds": seconds}
+            for i, path in zip(indices, paths)]
+
+
+def _group_jobs(jobs, shared_decode, max_group=SHARED_BATCH_SIZE):
+    """
+    Split job indices into render units. Jobs on the ffmpeg engine with the
+    same explicit template, track and duration share a unit (up to
+    max_group); everything else renders on its own.
+    """
+    if not shared_decode or max_group <= 1:
+        return [[i] for i in range(len(jobs))]
+
+    units, shared = [], {}
+    for i, job in enumerate(jobs):
+        engine = job.get("engine") or RENDER_ENGINE
+        if engine != "ffmpeg" or not job.get("video_path") or not job.get("audio_path"):
+            units.append([i])
+            continue
+        key = (
+            os.path.abspath(job["video_path"]), os.path.abspath(job["audio_path"]),
+            job.get("duration") or VIDEO_DURATION, job.get("use_template_cache"),
+        )
+        unit = shared.get(key)
+        if unit is None or len(unit) >= max_group:
+            unit = shared[key] = []
+            units.append(unit)
+        unit.append(i)
+    return units
+
+
+def render_reels(jobs, max_workers=None, threads_per_job=None, on_progress=None,
+                 shared_decode=None):
+    """
+    Render several reels in parallel worker processes.
+
+    jobs: list of generate_reel keyword dicts (joke_text, output_filename,
+    duration, video_path, audio_path, engine).
+    With shared_decode (REEL_SHARED_DECODE), jobs on the same template,
+    track and duration render together via generate_reels_batch, so the
+    background is decoded and scaled once per group instead of per reel.
+    Returns one result per job, in job order:
+        {"index", "success", "path", "error", "seconds"}
+    on_progress(completed, total, result) is called in this process as
+    each job finishes (success or failure).
+    """
+    if not jobs:
+        return []
+
+    shared_decode = SHARED_DECODE if shared_decode is None else shared_decode
+
+    cpus = os.cpu_count() or 1
+    max_workers = max_workers or RENDER_WORKERS or max(1, cpus // 2)
+    max_workers = max(1, min(max_workers, len(jobs)))
+    # Groups no larger than an even share per worker, so every worker gets
+    # a unit and progress still arrives in steps
+    max_group = min(SHARED_BATCH_SIZE, -(-len(jobs) // max_workers))
+    units = _group_jobs(jobs, shared_decode, max_group)
+    max_workers = min(max_workers, len(units))
+    threads = threads_per_job or RENDER_THREADS or max(1, cpus // max_workers)
+
+    print(f"🎞️  Rendering {len(jobs)} reels ({len(units)} decode(s)) on {max_workers} worker(s), "
+          f"{threads} thread(s) each")
+
+    results = [None] * len(jobs)
+
+    def _done(result):
+        results[result["index"]] = result
+        if not result["success"]:
+            print(f"   ❌ Reel {result['index'] + 1} failed: {result['error']}")
+        if on_progress is not None:
+            on_progress(sum(r is not None for r in results), len(jobs), result)
+
+    if max_workers == 1:
+        for unit in units:
+            for result in _render_group(unit, [jobs[i] for i in unit], threads):
+                _done(result)
+        return results
+
+    # spawn: the caller may be a threaded server (Streamlit), fork is unsafe there
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = {
+            pool.submit(_render_group, unit, [jobs[i] for i in unit], threads): unit
+            for unit in units
+        }
+        for future in as_completed(futures):
+            try:
+                unit_results = future.result()
+            except Exception as e:  # worker died (e.g. out of memory)
+                unit_results = [{"index": i, "success": False, "path": None, "error": str(e),
+                                 "seconds": None} for i in futures[future]]
+            for result in unit_results:
+                _done(result)
+
+    return results
@@ -0,0 +1,131 @@
+"""
+Template Cache
+Pre-normalised background templates for the reel renderers.
+
+Each template is transcoded once per (duration, fps, target size) into an
+intermediate that is already looped/trimmed to the reel length, resampled
+to the render fps and scaled/cropped to 1080×1920, without audio. Renders
+then only overlay the text and mux the music. Entries are keyed by the
+template's content hash, so replacing a template file misses naturally.
+
+Warm the cache for every bundled template:
+    python -m modules.video_studio.template_cache [--duration 15]
+"""
+
+import os
+import hashlib
+import argparse
+import tempfile
+import threading
+
+from .studio import (
+    ASSETS_DIR, RENDER_FPS, VIDEO_DURATION, _probe_video, _run_ffmpeg, _scale_filter,
+    get_random_file,
+)
+
+
+TEMPLATE_CACHE_DIR = os.getenv(
+    "REEL_TEMPLATE_CACHE_DIR",
+    os.path.join(
+        os.getenv("CONTENT_ENGINE_CACHE_DIR", os.path.join(os.path.dirname(__file__), "..", "..", "cache")),
+        "templates",
+    ),
+)
+TARGET_SIZE = (1080, 1920)
+# Near-lossless intermediate: it is encoded again by every render
+INTERMEDIATE_CRF = 12
+
+_hashes = {}
+_hash_lock = threading.Lock()
+
+
+def file_hash(path):
+    """sha256 of a file's content, memoised on (path, size, mtime)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _hash_lock:
+        digest = _hashes.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with _hash_lock:
+            _hashes[memo_key] = digest
+    return digest
+
+
+def template_cache_path(video_path, duration, fps=RENDER_FPS, size=TARGET_SIZE):
+    """Where the normalised intermediate for these settings lives."""
+    width, height = size
+    name = f"{file_hash(video_path)[:20]}_{duration:g}s_{fps}fps_{width}x{height}.mp4"
+    return os.path.join(TEMPLATE_CACHE_DIR, name)
+
+
+def prepare_template(video_path, duration=None, fps=RENDER_FPS, size=TARGET_SIZE, threads=None):
+    """
+    Return the normalised intermediate for a template, transcoding it on a
+    cache miss. Safe to call from several processes at once (the file is
+    written under a temporary name and moved into place).
+    """
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    duration = duration or VIDEO_DURATION
+    if tuple(size) != TARGET_SIZE:
+        raise ValueError(f"Only {TARGET_SIZE[0]}x{TARGET_SIZE[1]} templates are supported")
+
+    cached = template_cache_path(video_path, duration, fps, size)
+    if os.path.exists(cached):
+        return cached
+
+    print(f"   🧰 Normalising template {os.path.basename(video_path)} ({duration:g}s @ {fps}fps)")
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    width, height = _probe_video(video_path)
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".mp4", dir=TEMPLATE_CACHE_DIR)
+    os.close(fd)
+    try:
+        cmd = [
+            get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-stream_loop", "-1", "-i", video_path,
+            "-an",
+            "-vf", f"fps={fps}:round=up,{_scale_filter(width, height)},format=yuv420p",
+            "-t", f"{duration}",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(INTERMEDIATE_CRF),
+        ]
+        if threads:
+            cmd += ["-threads", str(threads)]
+        cmd.append(tmp_path)
+        _run_ffmpeg(cmd)
+        os.replace(tmp_path, cached)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return cached
+
+
+def prepare_all_templates(durations=(VIDEO_DURATION,), fps=RENDER_FPS):
+    """Warm the cache for every template in assets/templates."""
+    templates_dir = os.path.join(ASSETS_DIR, "templates")
+    get_random_file(templates_dir, (".mp4", ".mov"))  # raises if there are none
+    paths = []
+    for name in sorted(os.listdir(templates_dir)):
+        if name.lower().endswith((".mp4", ".mov")):
+            for duration in durations:
+                paths.append(prepare_template(os.path.join(templates_dir, name), duration, fps))
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-normalise reel templates.")
+    parser.add_argument("--duration", type=float, nargs="+", default=[VIDEO_DURATION])
+    args = parser.parse_args()
+
+    paths = prepare_all_templates(durations=args.duration)
+    print(f"✅ {len(paths)} normalised templates in {TEMPLATE_CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
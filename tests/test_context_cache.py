@@ -0,0 +1,159 @@
+"""ContextCache lifecycle against LocalCacheBackend, driven by a fake clock."""
+
+import threading
+from types import SimpleNamespace
+
+from modules.joke_generator.context_cache import (
+    REFRESH_MARGIN,
+    RETRY_AFTER,
+    ContextCache,
+    LocalCacheBackend,
+)
+
+
+MODEL = "gemini-test"
+INSTRUCTION = "You are a test instruction. " * 200
+TTL = 600
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FailingBackend(LocalCacheBackend):
+    """Raises the queued errors from create() before behaving normally."""
+
+    def __init__(self, *errors):
+        super().__init__()
+        self.errors = list(errors)
+        self.attempts = 0
+
+    def create(self, model, system_instruction, ttl):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super().create(model, system_instruction, ttl)
+
+
+def make_cache(backend=None, min_tokens=0):
+    clock = FakeClock()
+    cache = ContextCache(backend or LocalCacheBackend(), ttl=TTL,
+                         min_tokens=min_tokens, clock=clock)
+    return cache, clock
+
+
+def test_create_then_hit():
+    cache, clock = make_cache()
+
+    name = cache.lookup(MODEL, INSTRUCTION)
+    clock.now += TTL - REFRESH_MARGIN - 1
+
+    assert cache.lookup(MODEL, INSTRUCTION) == name
+    assert cache.backend.created == 1
+    assert cache.stats()["created"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_refresh_inside_margin_replaces_entry():
+    cache, clock = make_cache()
+
+    first = cache.lookup(MODEL, INSTRUCTION)
+    clock.now += TTL - REFRESH_MARGIN
+    second = cache.lookup(MODEL, INSTRUCTION)
+
+    assert second != first
+    assert first not in cache.backend.entries
+    assert cache.backend.deleted == 1
+    assert cache.stats()["refreshed"] == 1
+    assert cache.lookup(MODEL, INSTRUCTION) == second
+
+
+def test_invalidate_then_recreate():
+    cache, _ = make_cache()
+
+    first = cache.lookup(MODEL, INSTRUCTION)
+    cache.invalidate(MODEL, INSTRUCTION)
+    second = cache.lookup(MODEL, INSTRUCTION)
+
+    assert second != first
+    assert cache.backend.created == 2
+    assert cache.stats()["created"] == 2
+
+
+def test_bad_request_blocks_permanently():
+    backend = FailingBackend(StatusError(400))
+    cache, clock = make_cache(backend)
+
+    assert cache.lookup(MODEL, INSTRUCTION) is None
+    clock.now += 100 * RETRY_AFTER
+
+    assert cache.lookup(MODEL, INSTRUCTION) is None
+    assert backend.attempts == 1
+    assert cache.stats()["inline"] == 2
+
+
+def test_transient_failure_retries_after_delay():
+    backend = FailingBackend(StatusError(503))
+    cache, clock = make_cache(backend)
+
+    assert cache.lookup(MODEL, INSTRUCTION) is None
+    clock.now += RETRY_AFTER - 1
+    assert cache.lookup(MODEL, INSTRUCTION) is None
+    assert backend.attempts == 1
+
+    clock.now += 1
+    assert cache.lookup(MODEL, INSTRUCTION) is not None
+    assert backend.attempts == 2
+
+
+def test_short_instruction_stays_inline():
+    cache, _ = make_cache(min_tokens=1024)
+
+    assert cache.lookup(MODEL, "Be brief.") is None
+    assert cache.backend.created == 0
+
+
+def test_configure_with_local_backend_sends_instruction_inline():
+    cache, _ = make_cache()
+    config = SimpleNamespace(cached_content=None, system_instruction=None)
+
+    assert cache.configure(config, MODEL, INSTRUCTION) is not None
+    assert config.system_instruction == INSTRUCTION
+    assert config.cached_content is None
+
+
+def test_concurrent_lookups_create_once():
+    release = threading.Event()
+
+    class SlowBackend(LocalCacheBackend):
+        def create(self, model, system_instruction, ttl):
+            if system_instruction == INSTRUCTION:
+                release.wait(5)
+            return super().create(model, system_instruction, ttl)
+
+    cache, _ = make_cache(SlowBackend())
+    names = []
+    threads = [
+        threading.Thread(target=lambda: names.append(cache.lookup(MODEL, INSTRUCTION)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    # Another key is not held up by the slow create
+    assert cache.lookup(MODEL, INSTRUCTION + "other") is not None
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert cache.backend.created == 2
+    assert len(set(names)) == 1 and names[0] is not None
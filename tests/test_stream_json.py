@@ -0,0 +1,151 @@
+"""IncrementalJSONParser fed in chunks, and call_gemini's early stop on required_keys."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from modules.joke_generator import gemini_client
+from modules.joke_generator.stream_json import IncrementalJSONParser
+
+
+RESPONSE = {
+    "joke_type": "A",
+    "draft_joke": "He said \"no\" \\ then left é \U0001F600",
+    "scores": {"punch": 8, "nested": [1, {"deep": [2, 3]}]},
+    "tags": ["a", "b,c", "}"],
+    "confidence": 0.75,
+    "final": True,
+    "notes": None,
+}
+
+
+def feed_chars(parser, text):
+    completed = {}
+    for ch in text:
+        completed.update(parser.feed(ch))
+    return completed
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+def test_char_by_char_matches_json_loads(ensure_ascii):
+    text = json.dumps(RESPONSE, ensure_ascii=ensure_ascii)
+    parser = IncrementalJSONParser()
+
+    completed = feed_chars(parser, text)
+
+    assert parser.done
+    assert parser.kind == "object"
+    assert parser.fields == RESPONSE
+    assert completed == RESPONSE
+    assert parser.value() == RESPONSE
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_any_chunk_boundary(size):
+    text = json.dumps(RESPONSE, indent=2)
+    parser = IncrementalJSONParser()
+
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+
+    assert parser.fields == RESPONSE
+
+
+def test_escape_split_across_chunks():
+    parser = IncrementalJSONParser()
+
+    parser.feed('{"a": "x\\')
+    parser.feed('"y\\u00')
+    assert parser.feed('e9", "b": 1}') == {"a": 'x"yé', "b": 1}
+
+
+def test_fields_complete_in_order_with_callback():
+    seen = []
+    parser = IncrementalJSONParser(on_field=lambda k, v: seen.append((k, v)))
+
+    assert parser.feed('{"first": {"x": [1, 2]}, "sec') == {"first": {"x": [1, 2]}}
+    assert parser.feed('ond": 42') == {}  # a number only closes at , or }
+    assert parser.feed("}") == {"second": 42}
+    assert seen == [("first", {"x": [1, 2]}), ("second", 42)]
+
+
+def test_code_fence_and_trailing_text_are_skipped():
+    parser = IncrementalJSONParser()
+
+    parser.feed('```json\n{"draft_joke": "hi", "n": [1]}\n```\nDone.')
+
+    assert parser.fields == {"draft_joke": "hi", "n": [1]}
+    assert parser.value() == {"draft_joke": "hi", "n": [1]}
+
+
+def test_top_level_array():
+    items = [{"a": 1}, "x]", [2, 3]]
+    parser = IncrementalJSONParser()
+
+    feed_chars(parser, json.dumps(items))
+
+    assert parser.kind == "array"
+    assert parser.done
+    assert parser.fields == {}
+    assert parser.value() == items
+
+
+def test_truncated_keeps_completed_fields():
+    parser = IncrementalJSONParser()
+
+    parser.feed('{"joke_type": "B", "draft_joke": "cut off mid')
+
+    assert not parser.done
+    assert parser.fields == {"joke_type": "B"}
+    with pytest.raises(ValueError):
+        parser.value()
+
+
+def test_has_required_keys_before_close():
+    parser = IncrementalJSONParser()
+
+    parser.feed('{"joke_type": "A", "draft_joke": "x",')
+    assert parser.has(["joke_type", "draft_joke"])
+    assert not parser.has(["joke_type", "analysis"])
+    assert not parser.done
+
+
+class FakeModels:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.sent = 0
+        self.closed = False
+
+    def generate_content_stream(self, model, contents, config):
+        def _stream():
+            try:
+                for text in self.chunks:
+                    self.sent += 1
+                    yield SimpleNamespace(text=text, usage_metadata=None)
+            finally:
+                self.closed = True
+        return _stream()
+
+
+def test_call_gemini_stops_reading_once_required_keys_arrive(monkeypatch):
+    models = FakeModels([
+        '{"joke_type": "A", ',
+        '"draft_joke": "ok", ',
+        '"analysis": "long tail ',
+        'never needed"}',
+    ])
+    monkeypatch.setattr(gemini_client, "get_gemini_client",
+                        lambda: SimpleNamespace(models=models))
+    fields = []
+
+    result = gemini_client.call_gemini(
+        "prompt", model_stage="stream-test", stream=True,
+        required_keys=["joke_type", "draft_joke"],
+        on_field=lambda k, v: fields.append(k),
+    )
+
+    assert result == {"joke_type": "A", "draft_joke": "ok"}
+    assert fields == ["joke_type", "draft_joke"]
+    assert models.sent == 2  # the "analysis" chunks are never read
+    assert models.closed